@@ -0,0 +1,94 @@
+# coding: utf-8
+
+# PID -> process identity cache for the GPU collectors.
+#
+# Resolving the owner of a process (username, name, cmdline, container) costs several /proc reads and a
+# passwd lookup, while training jobs keep the same PID for days. Entries are reused across ticks as long
+# as the process create time still matches (so a recycled PID is never mistaken for the old process) and
+# are dropped once their PID stops showing up on a GPU.
+#
+# Processes running in a container usually belong to root, so the container id is read from the cgroup
+# and, for root processes only, the owner is resolved once per container from the `argus.user` label the
+# admin sets on the Docker container. Enforcement uses that owner instead of the username. Nothing the
+# process controls (its environment, say) is trusted, and rootless containers (under a user's systemd
+# slice) run as that user anyway, so they are not treated as containers.
+
+import re
+import psutil
+import subprocess
+
+OWNER_LABEL = 'argus.user'
+
+# docker / podman / containerd / cri-o cgroup paths end with the 64 hex digit container id; paths under
+# user.slice belong to a user's own (rootless) containers and are skipped
+CONTAINER_PATTERN = re.compile(r'^(?![^\n]*/user\.slice/)[^\n]*(?:docker|libpod|cri-containerd|crio|containerd|kubepods)[^\n]*?[/-]([0-9a-f]{64})(?:\.scope)?$', re.MULTILINE)
+
+class ProcessCache:
+    def __init__(self, logger):
+        self.logger = logger
+        self.entries = dict()
+        self.seen = set()
+        self.container_owners = dict()
+
+    def start_tick(self):
+        # forgets the processes that were not looked up during the previous tick
+        for pid in set(self.entries) - self.seen:
+            del self.entries[pid]
+        self.seen = set()
+        containers = {entry['container'] for entry in self.entries.values()}
+        for container in set(self.container_owners) - containers:
+            del self.container_owners[container]
+
+    def get(self, pid):
+        # {create_time, user, name, cmdline, container, owner} of `pid`, or None once it is gone
+        try:
+            process = psutil.Process(pid)
+            create_time = process.create_time()
+        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+            self.entries.pop(pid, None)
+            return None
+        self.seen.add(pid)
+
+        entry = self.entries.get(pid)
+        if entry is None or entry['create_time'] != create_time:
+            entry = self.inspect(process, create_time)
+            self.entries[pid] = entry
+        return entry
+
+    def inspect(self, process, create_time):
+        entry = {'create_time': create_time, 'user': "N/A", 'name': "N/A", 'cmdline': None, 'container': None, 'owner': None}
+        with process.oneshot():
+            for field, read in [('user', process.username), ('name', process.name), ('cmdline', lambda: ' '.join(process.cmdline())[:256] or None)]:
+                try:
+                    entry[field] = read()
+                except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                    pass
+                except Exception as e:
+                    self.logger.warning(f"[Client Get] Could not get {field} for PID {process.pid}: {e}")
+
+        entry['container'] = self.get_container(process.pid)
+        if entry['container'] and entry['user'] == 'root':
+            entry['owner'] = self.get_container_owner(entry['container'])
+        return entry
+
+    def get_container(self, pid):
+        try:
+            with open(f'/proc/{pid}/cgroup') as cgroup_file:
+                match = CONTAINER_PATTERN.search(cgroup_file.read())
+        except OSError:
+            return None
+        return match.group(1)[:12] if match else None
+
+    def get_container_owner(self, container):
+        if container not in self.container_owners:
+            owner = None
+            try:
+                inspect_process = subprocess.run(['docker', 'inspect', '--format', f'{{{{index .Config.Labels "{OWNER_LABEL}"}}}}', container],
+                                                 capture_output=True, text=True, timeout=5)
+                if inspect_process.returncode == 0:
+                    owner = inspect_process.stdout.strip()
+                    owner = owner if owner and owner != '<no value>' else None
+            except (OSError, subprocess.TimeoutExpired) as e:
+                self.logger.warning(f"[Client Get] Could not inspect container {container}: {e}")
+            self.container_owners[container] = owner
+        return self.container_owners[container]
@@ -0,0 +1,87 @@
+# coding: utf-8
+
+# Local copy of this node's booking schedule and enforcement settings (from the master's /server/schedule),
+# so kills can be decided on the node itself: right at each hour boundary, and while the master is down.
+# The decision mirrors the master's enforcement engine. The copy is kept on disk to survive restarts.
+
+import os
+import json
+import time
+import threading
+
+class BookingSchedule:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.version = None
+        self.start = None
+        self.end = None
+        self.bookers = dict()
+        self.settings = dict()
+        if os.path.exists(self.path):
+            try:
+                with open(self.path) as schedule_file:
+                    self.update(json.load(schedule_file), save=False)
+            except (OSError, ValueError, KeyError):
+                pass
+
+    def update(self, schedule, save=True):
+        # schedule: {version, start, end, schedule: {hour: {gpu_id: booker}}, settings}
+        with self.lock:
+            self.version = schedule['version']
+            self.start, self.end = int(schedule['start']), int(schedule['end'])
+            self.bookers = {int(timestamp): gpus for timestamp, gpus in schedule['schedule'].items()}
+            self.settings = schedule['settings']
+        if save:
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, 'w') as schedule_file:
+                json.dump(schedule, schedule_file)
+            os.replace(temp_path, self.path)
+
+    def needs_refresh(self, version, now=None):
+        # when the master announced another version, or less than half of the fetched hours are left
+        now = time.time() if now is None else now
+        if self.end is None or (version is not None and version != self.version):
+            return True
+        return self.end - now < (self.end - self.start) / 2
+
+    def kill_offset(self):
+        # seconds after the hour boundary at which the booked hour is enforced
+        return int(self.settings.get('grace_seconds', 0))
+
+    def evaluate(self, server_status, now=None):
+        # [{pid, gpu_id, user, booker}, ...] breaking the cached policy at `now`; [] when the schedule does not cover `now`
+        now = time.time() if now is None else now
+        current_hour_timestamp = int(now) - int(now) % 3600
+        with self.lock:
+            if self.end is None or not self.start <= current_hour_timestamp < self.end:
+                return []
+            bookers = self.bookers.get(current_hour_timestamp, {})
+            settings = self.settings
+        if not bookers or now < current_hour_timestamp + int(settings.get('grace_seconds', 0)):
+            return []
+
+        allow_users = set(settings.get('allow_users', []))
+        allow_processes = set(settings.get('allow_processes', []))
+        kills = list()
+        for gpu in server_status:
+            booker = bookers.get(str(gpu['gpu_id']))
+            if not booker:
+                continue
+            for process in gpu.get('processes', []):
+                # a container's owner stands in for its (usually root) username
+                user = process.get('owner') or process['user']
+                if user == booker or user in allow_users:
+                    continue
+                if os.path.basename(process.get('process_name') or '') in allow_processes:
+                    continue
+                if (process.get('used_gpu_memory_mib') or 0) < settings.get('min_memory_mib', 0):
+                    continue
+                kills.append({'pid': process['pid'], 'gpu_id': str(gpu['gpu_id']), 'user': user, 'booker': booker})
+        return kills
+
+    def killing_pid_list(self, server_status, now=None):
+        kills = self.evaluate(server_status, now)
+        if self.settings.get('dry_run'):
+            return []
+        return [kill['pid'] for kill in kills]
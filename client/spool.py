@@ -0,0 +1,132 @@
+# coding: utf-8
+
+# Bounded on-disk spool for telemetry snapshots that could not be delivered to the master.
+#
+# Samples are appended as JSON lines and never rewritten on delivery: the byte offset of the oldest
+# undelivered line is kept in `{path}.offset`, so peek() reads only the lines it returns and drop() just
+# moves the offset. Once the file holds more than `max_entries` undelivered samples (plus 10% slack) the
+# offset skips past the oldest ones. The delivered head is cut off only when it is at least half of the file
+# (and COMPACT_MIN_BYTES), or for free once everything is delivered. The offset is persisted before the file
+# is replaced, so a crash can only replay samples, never lose them.
+
+import os
+import json
+import threading
+
+# delivered bytes kept at the head of the file before it is compacted
+COMPACT_MIN_BYTES = 4 * 1024 * 1024
+
+class SnapshotSpool:
+    def __init__(self, path, max_entries=10000):
+        self.path = path
+        self.offset_path = f"{path}.offset"
+        self.max_entries = int(max_entries)
+        self.lock = threading.Lock()
+        self.offset = 0
+        self.count = 0
+        # (byte offset after, lines consumed up to) each sample returned by the last peek(), so drop() needs no read
+        self.peeked = []
+        if os.path.exists(self.path):
+            try:
+                with open(self.offset_path) as offset_file:
+                    self.offset = int(offset_file.read() or 0)
+            except (OSError, ValueError):
+                self.offset = 0
+            with open(self.path, 'rb') as spool_file:
+                if self.offset > os.fstat(spool_file.fileno()).st_size:
+                    self.offset = 0
+                spool_file.seek(self.offset)
+                self.count = sum(1 for line in spool_file if line.strip())
+
+    def __len__(self):
+        return self.count
+
+    def append(self, sample):
+        with self.lock:
+            with open(self.path, 'ab') as spool_file:
+                spool_file.write(json.dumps(sample, separators=(',', ':')).encode() + b'\n')
+            self.count += 1
+            if self.count > self.max_entries + self.max_entries // 10:
+                self.skip(self.count - self.max_entries)
+
+    def peek(self, limit):
+        # the `limit` oldest undelivered samples, reading only their lines
+        with self.lock:
+            samples, self.peeked = list(), list()
+            if not self.count or not os.path.exists(self.path):
+                return samples
+            with open(self.path, 'rb') as spool_file:
+                spool_file.seek(self.offset)
+                lines = 0
+                while len(samples) < limit:
+                    line = spool_file.readline()
+                    if not line:
+                        break
+                    if not line.strip():
+                        continue
+                    lines += 1
+                    try:
+                        samples.append(json.loads(line))
+                    except ValueError:
+                        continue
+                    self.peeked.append((spool_file.tell(), lines))
+            return samples
+
+    def drop(self, count):
+        # removes the `count` oldest samples once they have been delivered
+        with self.lock:
+            if 0 < count <= len(self.peeked):
+                offset, lines = self.peeked[count - 1]
+                self.count = max(0, self.count - lines)
+                self.advance(offset)
+            elif count > 0:
+                self.skip(count)
+            self.peeked = []
+
+    def skip(self, count):
+        # moves the offset past the `count` oldest lines without parsing them
+        with open(self.path, 'rb') as spool_file:
+            spool_file.seek(self.offset)
+            skipped = 0
+            while skipped < count:
+                line = spool_file.readline()
+                if not line:
+                    break
+                skipped += 1 if line.strip() else 0
+            offset = spool_file.tell()
+        self.count = max(0, self.count - skipped)
+        self.peeked = []
+        self.advance(offset)
+
+    def advance(self, offset):
+        size = os.path.getsize(self.path)
+        if offset >= size:
+            # everything delivered: empty the file instead of copying anything
+            self.save_offset(0)
+            open(self.path, 'wb').close()
+            self.offset = 0
+        elif offset >= COMPACT_MIN_BYTES and offset * 2 >= size:
+            self.compact(offset)
+        else:
+            self.save_offset(offset)
+            self.offset = offset
+
+    def compact(self, offset):
+        temp_path = f"{self.path}.tmp"
+        with open(self.path, 'rb') as spool_file, open(temp_path, 'wb') as temp_file:
+            spool_file.seek(offset)
+            while True:
+                chunk = spool_file.read(1024 * 1024)
+                if not chunk:
+                    break
+                temp_file.write(chunk)
+        self.save_offset(0)
+        os.replace(temp_path, self.path)
+        self.offset = 0
+        self.peeked = []
+
+    def save_offset(self, offset):
+        temp_path = f"{self.offset_path}.tmp"
+        with open(temp_path, 'w') as offset_file:
+            offset_file.write(str(offset))
+        os.replace(temp_path, self.offset_path)
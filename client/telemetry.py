@@ -4,71 +4,67 @@
 # Date: 2025-05-21
 
 import os
+import gzip
+import random
+import asyncio
+import json
 import time
 import psutil 
 import logging
 import requests
 import subprocess
 from dotenv import load_dotenv
+from spool import SnapshotSpool
+from schedule import BookingSchedule
+from process_cache import ProcessCache
+from concurrent.futures import ThreadPoolExecutor
 
-class Telemetry:        
-    def __init__(self, server_id, server_password, master_url, interval):
-        self.server_id = server_id
-        self.server_password = server_password
-        self.master_url = master_url
-        self.interval = int(interval)
-        self.logger = logging.getLogger("telemetry_client")
+try:
+    import pynvml
+except ImportError:
+    pynvml = None
 
-    def kill_process_psutil(self, pid: int, force: bool = False, timeout: int = 5) -> bool:
-        try:
-            proc = psutil.Process(pid)
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
-            if force:
-                proc.kill()
-                self.logger.info(f"[psutil] Force kill signal sent to process {pid}.")
-                time.sleep(1)
-                return not psutil.pid_exists(pid)
+class GPUCollector:
+    # Base class of the GPU collector backends. collect() returns one dict per GPU, numeric fields are None when unknown:
+    # {gpu_id, uuid, memory_usage_mib, memory_total_mib, memory_percent, utilization_percent, temperature_celsius, processes}
+    # and one dict per process: {pid, user, process_name, used_gpu_memory_mib[, cmdline, container, owner]}
+    def __init__(self, logger):
+        self.logger = logger
+        self.process_cache = ProcessCache(logger)
 
-            # Attempt graceful termination
-            self.logger.info(f"[psutil] Attempting graceful termination of process {pid} (PID: {proc.pid})...")
-            proc.terminate() # Sends SIGTERM on POSIX, TerminateProcess on Windows
+    def collect(self):
+        raise NotImplementedError
 
-            # Wait for the process to terminate
-            try:
-                self.logger.info(f"[psutil] Waiting up to {timeout} seconds for process {pid} to terminate...")
-                # wait() returns the exit status or None. Raises TimeoutExpired if it doesn't die.
-                proc.wait(timeout=timeout)
-                self.logger.info(f"[psutil] Process {pid} terminated gracefully.")
-                return True
-            except psutil.TimeoutExpired:
-                self.logger.info(f"[psutil] Process {pid} did not terminate gracefully after {timeout} seconds. Force killing...")
-                proc.kill() # Sends SIGKILL on POSIX, TerminateProcess on Windows (forcefully)
-                time.sleep(0.1) # Brief pause
-                if not psutil.pid_exists(pid):
-                    self.logger.info(f"[psutil] Process {pid} killed forcefully after timeout.")
-                    return True
-                else:
-                    self.logger.info(f"[psutil] Process {pid} may still be running after forceful kill attempt.")
-                    return False
-            except psutil.NoSuchProcess: # Process might have terminated very quickly
-                self.logger.info(f"[psutil] Process {pid} terminated gracefully (or was already gone).")
-                return True
+    def close(self):
+        pass
 
-        except psutil.NoSuchProcess:
-            self.logger.info(f"[psutil] Process {pid} not found (already terminated or never existed).")
-            return True # Considered success as the process is not running
-        except psutil.AccessDenied:
-            self.logger.info(f"[psutil] Access denied. Insufficient permissions to kill process {pid}.")
-            return False
-        except Exception as e:
-            self.logger.info(f"[psutil] An error occurred while trying to kill process {pid}: {e}")
-            return False
+    def describe_process(self, pid, process_name, used_gpu_memory_mib):
+        entry = self.process_cache.get(pid)
+        process = {
+            "pid": pid,
+            "user": entry['user'] if entry else "N/A",
+            "process_name": process_name if process_name is not None else (entry['name'] if entry else "N/A"),
+            "used_gpu_memory_mib": used_gpu_memory_mib,
+        }
+        if entry:
+            for field in ('cmdline', 'container', 'owner'):
+                if entry[field]:
+                    process[field] = entry[field]
+        return process
 
-    def get_server_info(self):
+class SmiCollector(GPUCollector):
+    # Parses two `nvidia-smi` queries per tick (GPUs, then compute apps). Works wherever the driver tools are installed.
+    def collect(self):
         gpus_data = []
         gpus_details_by_id = {}
         uuid_to_gpu_id_map = {}
 
+        self.process_cache.start_tick()
         try:
             gpu_query_cmd = [
                 'nvidia-smi',
@@ -101,24 +97,24 @@ class Telemetry:
 
                 util_str = parts[4]
                 try:
-                    utilization_display = f"{int(util_str)}%"
+                    utilization = int(util_str)
                 except ValueError:
-                    utilization_display = util_str 
+                    utilization = None
 
                 temp_str = parts[5]
                 try:
-                    temperature_display = f"{int(temp_str)}°C"
+                    temperature = int(temp_str)
                 except ValueError:
-                    temperature_display = temp_str 
+                    temperature = None
                 
                 gpus_details_by_id[gpu_id] = {
                     "gpu_id": gpu_id,
                     "uuid": gpu_uuid,
                     "memory_usage_mib": mem_used,
                     "memory_total_mib": mem_total,
-                    "memory_percent": f"{(mem_used / mem_total * 100):.1f}%" if mem_total > 0 else "N/A",
-                    "utilization_percent": utilization_display,
-                    "temperature_celsius": temperature_display,
+                    "memory_percent": round(mem_used / mem_total * 100, 1) if mem_total > 0 else None,
+                    "utilization_percent": utilization,
+                    "temperature_celsius": temperature,
                     "processes": []
                 }
                 uuid_to_gpu_id_map[gpu_uuid] = gpu_id
@@ -159,28 +155,13 @@ class Telemetry:
                         val_str = parts[3].replace(" MiB", "") # Attempt to remove " MiB" if present
                         process_mem_used_mib = int(val_str)
                     except ValueError:
-                        process_mem_used_mib = "N/A" 
-                        self.logger.warning(f"[Client Get] Could not parse used_gpu_memory for PID {pid} (value: '{parts[3]}'). Setting to N/A.")
-
-                    username = "N/A" 
-
-                    try:
-                        p = psutil.Process(pid)
-                        username = p.username()
-                    except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-                        pass 
-                    except Exception as e:
-                        self.logger.warning(f"[Client Get] Could not get user for PID {pid}: {e}")
+                        process_mem_used_mib = None
+                        self.logger.warning(f"[Client Get] Could not parse used_gpu_memory for PID {pid} (value: '{parts[3]}'). Setting to None.")
 
                     if gpu_uuid_for_process in uuid_to_gpu_id_map:
                         target_gpu_id = uuid_to_gpu_id_map[gpu_uuid_for_process]
                         if target_gpu_id in gpus_details_by_id:
-                            gpus_details_by_id[target_gpu_id]["processes"].append({
-                                "pid": pid,
-                                "user": username,
-                                "process_name": process_name,
-                                "used_gpu_memory_mib": process_mem_used_mib # Added process GPU memory
-                            })
+                            gpus_details_by_id[target_gpu_id]["processes"].append(self.describe_process(pid, process_name, process_mem_used_mib))
                         else: 
                             self.logger.warning(f"[Client Get] Process PID {pid} (GPU UUID: {gpu_uuid_for_process}) maps to GPU ID {target_gpu_id}, which was not found.")
                     else:
@@ -202,37 +183,399 @@ class Telemetry:
             self.logger.error(f"[Client Get] An unexpected error occurred: {e}")
         return gpus_data
 
+class NvmlCollector(GPUCollector):
+    # Reads every device and its compute processes in-process through NVML in a single pass.
+    # The library is initialised once and device handles / UUIDs are kept for the lifetime of the collector.
+    def __init__(self, logger):
+        super().__init__(logger)
+        if pynvml is None:
+            raise RuntimeError("pynvml is not installed. Please install it using 'pip install nvidia-ml-py'.")
+        pynvml.nvmlInit()
+        self.devices = list()
+        for index in range(pynvml.nvmlDeviceGetCount()):
+            handle = pynvml.nvmlDeviceGetHandleByIndex(index)
+            self.devices.append((index, handle, self.decode(pynvml.nvmlDeviceGetUUID(handle))))
+
+    def decode(self, value):
+        return value.decode() if isinstance(value, bytes) else value
+
+    def format_gpu(self, gpu_id, gpu_uuid, mem_used, mem_total, utilization, temperature):
+        return {
+            "gpu_id": gpu_id,
+            "uuid": gpu_uuid,
+            "memory_usage_mib": mem_used,
+            "memory_total_mib": mem_total,
+            "memory_percent": round(mem_used / mem_total * 100, 1) if mem_total > 0 else None,
+            "utilization_percent": utilization,
+            "temperature_celsius": temperature,
+            "processes": []
+        }
+
+    def collect(self):
+        self.process_cache.start_tick()
+        gpus_data = []
+        for gpu_id, handle, gpu_uuid in self.devices:
+            memory = pynvml.nvmlDeviceGetMemoryInfo(handle)
+            utilization = pynvml.nvmlDeviceGetUtilizationRates(handle).gpu
+            temperature = pynvml.nvmlDeviceGetTemperature(handle, pynvml.NVML_TEMPERATURE_GPU)
+            gpu = self.format_gpu(gpu_id, gpu_uuid, memory.used // (1024 * 1024), memory.total // (1024 * 1024), utilization, temperature)
+
+            for process in pynvml.nvmlDeviceGetComputeRunningProcesses(handle):
+                # the process name comes from the PID cache rather than one NVML call per process per tick
+                used_gpu_memory_mib = process.usedGpuMemory // (1024 * 1024) if process.usedGpuMemory is not None else None
+                gpu["processes"].append(self.describe_process(process.pid, None, used_gpu_memory_mib))
+            gpus_data.append(gpu)
+        return gpus_data
+
+    def close(self):
+        pynvml.nvmlShutdown()
+
+def create_collector(backend, logger):
+    # backend: 'nvml', 'smi' or 'auto' (NVML when it initialises, nvidia-smi otherwise)
+    if backend == 'smi':
+        return SmiCollector(logger)
+    try:
+        return NvmlCollector(logger)
+    except Exception as e:
+        if backend == 'nvml':
+            raise
+        logger.warning(f"[Client Get] NVML unavailable ({e}), falling back to nvidia-smi.")
+        return SmiCollector(logger)
+
+class MasterUnavailable(Exception):
+    pass
+
+class Telemetry:        
+    def __init__(self, server_id, server_password, master_url, interval, collector='auto', compression='gzip', keyframe_interval=10,
+                 spool_path='./telemetry_spool.jsonl', spool_max_entries=10000, max_backoff=300, request_timeout=10,
+                 schedule_path='./telemetry_schedule.json', schedule_hours=24):
+        self.server_id = server_id
+        self.server_password = server_password
+        self.master_url = master_url
+        self.interval = int(interval)
+        self.logger = logging.getLogger("telemetry_client")
+        self.collector = create_collector(collector or 'auto', self.logger)
+        self.fallback_collector = SmiCollector(self.logger)
+        self.compression = compression or 'gzip'
+        self.keyframe_interval = int(keyframe_interval)
+        # delta uploads are computed against the last snapshot the master acknowledged
+        self.seq = 0
+        self.acked_seq = None
+        self.acked_snapshot = None
+        self.deltas_since_keyframe = 0
+        self.heartbeat_supported = True
+        # one worker for collection + HTTP (the session is used sequentially), a pool for process termination
+        self.io_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="telemetry_io")
+        self.kill_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="telemetry_kill")
+        self.killing_pids = set()
+        self.kill_tasks = set()
+        # outage handling: snapshots are spooled to disk and the master is retried with backoff
+        self.session = None
+        self.request_timeout = request_timeout
+        self.spool = SnapshotSpool(spool_path, spool_max_entries)
+        self.spool_batch_size = 500
+        # batches replayed after each live heartbeat, so a long backlog drains without delaying the next ticks
+        self.spool_flush_batches = 2
+        self.max_backoff = max_backoff
+        self.failures = 0
+        self.retry_at = 0
+        # local copy of the booking schedule, so kills happen on time at hour boundaries and while the master is down
+        self.schedule = BookingSchedule(schedule_path)
+        self.schedule_hours = int(schedule_hours)
+        self.schedule_supported = True
+
+    def kill_process_psutil(self, pid: int, force: bool = False, timeout: int = 5) -> bool:
+        try:
+            proc = psutil.Process(pid)
+
+            if force:
+                proc.kill()
+                self.logger.info(f"[psutil] Force kill signal sent to process {pid}.")
+                time.sleep(1)
+                return not psutil.pid_exists(pid)
+
+            # Attempt graceful termination
+            self.logger.info(f"[psutil] Attempting graceful termination of process {pid} (PID: {proc.pid})...")
+            proc.terminate() # Sends SIGTERM on POSIX, TerminateProcess on Windows
+
+            # Wait for the process to terminate
+            try:
+                self.logger.info(f"[psutil] Waiting up to {timeout} seconds for process {pid} to terminate...")
+                # wait() returns the exit status or None. Raises TimeoutExpired if it doesn't die.
+                proc.wait(timeout=timeout)
+                self.logger.info(f"[psutil] Process {pid} terminated gracefully.")
+                return True
+            except psutil.TimeoutExpired:
+                self.logger.info(f"[psutil] Process {pid} did not terminate gracefully after {timeout} seconds. Force killing...")
+                proc.kill() # Sends SIGKILL on POSIX, TerminateProcess on Windows (forcefully)
+                time.sleep(0.1) # Brief pause
+                if not psutil.pid_exists(pid):
+                    self.logger.info(f"[psutil] Process {pid} killed forcefully after timeout.")
+                    return True
+                else:
+                    self.logger.info(f"[psutil] Process {pid} may still be running after forceful kill attempt.")
+                    return False
+            except psutil.NoSuchProcess: # Process might have terminated very quickly
+                self.logger.info(f"[psutil] Process {pid} terminated gracefully (or was already gone).")
+                return True
+
+        except psutil.NoSuchProcess:
+            self.logger.info(f"[psutil] Process {pid} not found (already terminated or never existed).")
+            return True # Considered success as the process is not running
+        except psutil.AccessDenied:
+            self.logger.info(f"[psutil] Access denied. Insufficient permissions to kill process {pid}.")
+            return False
+        except Exception as e:
+            self.logger.info(f"[psutil] An error occurred while trying to kill process {pid}: {e}")
+            return False
+
+    def get_server_info(self):
+        try:
+            return self.collector.collect()
+        except Exception as e:
+            self.logger.error(f"[Client Get] {type(self.collector).__name__} failed ({e}), falling back to nvidia-smi for this tick.")
+            return self.fallback_collector.collect()
+
+    def build_status_payload(self, server_status):
+        self.seq += 1
+        snapshot = {gpu["gpu_id"]: gpu for gpu in server_status}
+        keyframe = self.acked_snapshot is None or self.deltas_since_keyframe >= self.keyframe_interval
+        if keyframe:
+            gpus, removed_gpus = server_status, []
+        else:
+            gpus = [gpu for gpu_id, gpu in snapshot.items() if self.acked_snapshot.get(gpu_id) != gpu]
+            removed_gpus = [gpu_id for gpu_id in self.acked_snapshot if gpu_id not in snapshot]
+        payload = {
+            "format": "compact",
+            "seq": self.seq,
+            "keyframe": keyframe,
+            "base_seq": None if keyframe else self.acked_seq,
+            "timestamp": time.time(),
+            "gpus": gpus,
+            "removed_gpus": removed_gpus,
+        }
+        return payload, snapshot
+
+    def encode_status_payload(self, payload):
+        body = json.dumps(payload, separators=(',', ':')).encode()
+        headers = {"Content-Type": "application/json"}
+        if self.compression == 'zstd' and zstandard is not None:
+            body = zstandard.ZstdCompressor().compress(body)
+            headers["Content-Encoding"] = "zstd"
+        elif self.compression in ('gzip', 'zstd'):
+            body = gzip.compress(body)
+            headers["Content-Encoding"] = "gzip"
+        return body, headers
+
+    def request_master(self, method, endpoint, **kwargs):
+        # one call to the master: re-authenticates once on 401 / login redirects, raises MasterUnavailable on 5xx or network errors
+        for attempt in range(2):
+            try:
+                response = self.session.request(method, f"{self.master_url}{endpoint}", allow_redirects=False, timeout=self.request_timeout, **kwargs)
+            except requests.RequestException as e:
+                raise MasterUnavailable(f"{method} {endpoint} failed: {e}")
+            if response.status_code >= 500:
+                raise MasterUnavailable(f"{method} {endpoint} returned {response.status_code}")
+            if response.status_code not in (301, 302, 303, 401) or attempt:
+                return response
+            self.logger.info(f"[Client Login] Session rejected by {endpoint} ({response.status_code}), logging in again.")
+            if not self.client_login():
+                raise MasterUnavailable("re-login failed")
+        return response
+
+    def send_server_info(self, endpoint, server_status):
+        # posts `server_status` (or its delta) to `endpoint` and returns the response
+        payload, snapshot = self.build_status_payload(server_status)
+        body, headers = self.encode_status_payload(payload)
+        try:
+            response = self.request_master("POST", f"{endpoint}?server_id={self.server_id}", data=body, headers=headers)
+        except MasterUnavailable:
+            self.acked_seq, self.acked_snapshot = None, None
+            raise
+        if response.status_code == 200:
+            self.acked_seq, self.acked_snapshot = payload["seq"], snapshot
+            self.deltas_since_keyframe = 0 if payload["keyframe"] else self.deltas_since_keyframe + 1
+            self.logger.info(f"[Client Post] Server info posted successfully ({'keyframe' if payload['keyframe'] else 'delta'}, {len(payload['gpus'])} GPU(s), {len(body)} bytes).")
+        else:
+            # the master may not hold our base snapshot any more, start over from a keyframe
+            self.acked_seq, self.acked_snapshot = None, None
+            self.logger.error(f"[Client Post] Failed to post server info. Status code: {response.status_code}")
+        return response
+
     def post_server_info(self):
         server_status = self.get_server_info()
         if server_status:
-            response = self.session.post(
-                url = f"{self.master_url}/server/status?server_id={self.server_id}", 
-                json = {"server_status": server_status, "timestamp": time.time()}
-            )
-            if response.status_code == 200:
-                self.logger.info(f"[Client Post] Server info posted successfully.")
-            else:
-                self.logger.error(f"[Client Post] Failed to post server info. Status code: {response.status_code}")
+            self.send_server_info("/server/status", server_status)
         else:
             self.logger.error(f"[Client Post] No GPU data available to post.")
 
-    def get_server_kill(self):
-        response = self.session.get(url = f"{self.master_url}/server/kill?server_id={self.server_id}")
+    def request_killing_pid_list(self):
+        response = self.request_master("GET", f"/server/kill?server_id={self.server_id}")
         response_json = response.json()
         self.logger.info(f"[Client Kill] {response_json}")
-        if response_json['killing_pid_list']:
-            for pid in response_json['killing_pid_list']:
-                status = self.kill_process_psutil(pid)
-                if status:
-                    self.logger.info(f"[Client Kill] Server PID {pid} Killed")
-                else:
-                    self.logger.error(f"[Client Kill] Server PID {pid} Kill Failed")
+        if 'schedule_version' in response_json:
+            self.sync_schedule(response_json['schedule_version'])
+        return response_json['killing_pid_list']
+
+    def sync_schedule(self, version):
+        # fetches the booking schedule when the master announced another version or the cached hours run low
+        if not self.schedule_supported or not self.schedule.needs_refresh(version):
+            return
+        try:
+            response = self.request_master("GET", f"/server/schedule?server_id={self.server_id}&hours={self.schedule_hours}")
+        except MasterUnavailable as e:
+            self.logger.error(f"[Client Schedule] Failed to fetch the booking schedule: {e}")
+            return
+        if response.status_code == 404:
+            self.logger.info(f"[Client Schedule] Master has no /server/schedule, kills are only decided by the master.")
+            self.schedule_supported = False
+        elif response.status_code != 200:
+            self.logger.error(f"[Client Schedule] Failed to fetch the booking schedule. Status code: {response.status_code}")
+        else:
+            self.schedule.update(response.json())
+            self.logger.info(f"[Client Schedule] Booking schedule {self.schedule.version} cached until {self.schedule.end}.")
+
+    def local_killing_pid_list(self, server_status):
+        # kill decision taken from the cached schedule, used while the master cannot be asked
+        killing_pid_list = self.schedule.killing_pid_list(server_status)
+        if killing_pid_list:
+            self.logger.info(f"[Client Kill] Local schedule {self.schedule.version}: {killing_pid_list}")
+        return killing_pid_list
+
+    def get_server_kill(self):
+        self.kill_processes(self.request_killing_pid_list())
+
+    def kill_processes(self, killing_pid_list):
+        if killing_pid_list:
+            for pid in killing_pid_list:
+                self.report_kill(pid, self.kill_process_psutil(pid))
         else:
             self.logger.info(f"[Client Kill] No Server PID to Kill")
 
+    def report_kill(self, pid, status):
+        if status:
+            self.logger.info(f"[Client Kill] Server PID {pid} Killed")
+        else:
+            self.logger.error(f"[Client Kill] Server PID {pid} Kill Failed")
+
+    def flush_spool(self):
+        # replays up to `spool_flush_batches` batches of the snapshots spooled during an outage, oldest first
+        for _ in range(self.spool_flush_batches):
+            if not len(self.spool):
+                return
+            samples = self.spool.peek(self.spool_batch_size)
+            if not samples:
+                return
+            body, headers = self.encode_status_payload({"samples": samples})
+            response = self.request_master("POST", f"/server/status/batch?server_id={self.server_id}", data=body, headers=headers)
+            if response.status_code == 400:
+                # the master will never take this batch, keeping it would block the rest of the spool
+                self.logger.error(f"[Client Spool] Master rejected {len(samples)} spooled sample(s), dropping them: {response.text[:200]}")
+            elif response.status_code != 200:
+                self.logger.error(f"[Client Spool] Failed to flush {len(samples)} spooled sample(s). Status code: {response.status_code}")
+                return
+            self.spool.drop(len(samples))
+            self.logger.info(f"[Client Spool] Flushed {len(samples)} spooled sample(s), {len(self.spool)} left.")
+
+    def send_heartbeat(self, server_status):
+        # status upload and kill decision in one round trip; masters without /server/heartbeat get the two old calls
+        if self.heartbeat_supported:
+            response = self.send_server_info("/server/heartbeat", server_status)
+            if response.status_code != 404:
+                if response.status_code != 200:
+                    return []
+                response_json = response.json()
+                self.logger.info(f"[Client Kill] {response_json['killing_pid_list']}")
+                if 'schedule_version' in response_json:
+                    self.sync_schedule(response_json['schedule_version'])
+                return response_json['killing_pid_list']
+            self.logger.info(f"[Client Heartbeat] Master has no /server/heartbeat, using /server/status and /server/kill.")
+            self.heartbeat_supported = False
+        self.send_server_info("/server/status", server_status)
+        return self.request_killing_pid_list()
+
+    def exchange_heartbeat(self):
+        # while the master is unreachable snapshots go to the spool, and it is retried with exponential backoff + jitter
+        server_status = self.get_server_info()
+        if not server_status:
+            self.logger.error(f"[Client Post] No GPU data available to post.")
+            return []
+
+        if time.time() < self.retry_at:
+            self.spool.append({"timestamp": time.time(), "server_status": server_status})
+            return self.local_killing_pid_list(server_status)
+
+        try:
+            killing_pid_list = self.send_heartbeat(server_status)
+        except MasterUnavailable as e:
+            self.spool.append({"timestamp": time.time(), "server_status": server_status})
+            self.failures += 1
+            backoff = min(self.max_backoff, self.interval * 2 ** self.failures)
+            backoff = random.uniform(backoff / 2, backoff)
+            self.retry_at = time.time() + backoff
+            self.logger.error(f"[Client Heartbeat] Master unavailable ({e}). {len(self.spool)} sample(s) spooled, retrying in {backoff:.1f}s.")
+            return self.local_killing_pid_list(server_status)
+
+        self.failures, self.retry_at = 0, 0
+
+        # the live heartbeat and its kill decision go first; a failed flush is retried after the next one
+        try:
+            self.flush_spool()
+        except MasterUnavailable as e:
+            self.logger.error(f"[Client Spool] Failed to flush spooled samples ({e}), {len(self.spool)} left.")
+        return killing_pid_list
+
+    def heartbeat(self):
+        self.kill_processes(self.exchange_heartbeat())
+
+    async def kill_processes_async(self, killing_pid_list):
+        # each PID is terminated in its own worker so one stuck process delays neither the others nor the next heartbeat
+        if not killing_pid_list:
+            self.logger.info(f"[Client Kill] No Server PID to Kill")
+            return
+        loop = asyncio.get_running_loop()
+
+        async def kill(pid):
+            try:
+                self.report_kill(pid, await loop.run_in_executor(self.kill_executor, self.kill_process_psutil, pid))
+            finally:
+                self.killing_pids.discard(pid)
+
+        for pid in killing_pid_list:
+            if pid in self.killing_pids:
+                continue
+            self.killing_pids.add(pid)
+            task = asyncio.create_task(kill(pid))
+            self.kill_tasks.add(task)
+            task.add_done_callback(self.kill_tasks.discard)
+
+    def enforce_schedule(self):
+        server_status = self.get_server_info()
+        return self.local_killing_pid_list(server_status) if server_status else []
+
+    async def enforcement_loop_async(self):
+        # enforces each booked hour from the cached schedule right at its start (plus grace), instead of at the next heartbeat
+        loop = asyncio.get_running_loop()
+        while True:
+            now = time.time()
+            next_enforcement = now - now % 3600 + self.schedule.kill_offset()
+            if next_enforcement <= now:
+                next_enforcement += 3600
+            await asyncio.sleep(next_enforcement - now)
+            try:
+                killing_pid_list = await loop.run_in_executor(self.io_executor, self.enforce_schedule)
+                await self.kill_processes_async(killing_pid_list)
+            except Exception as e:
+                self.logger.error(f"[Enforcement Loop] Error: {e}")
+
     def client_login(self):
-        self.session = requests.Session()
-        response = self.session.post(f"{self.master_url}/server/login", data={'server_id': self.server_id, 'password': self.server_password})
+        if self.session is None:
+            self.session = requests.Session()
+        try:
+            response = self.session.post(f"{self.master_url}/server/login", data={'server_id': self.server_id, 'password': self.server_password}, timeout=self.request_timeout)
+        except requests.RequestException as e:
+            self.logger.error(f"[Client Login] Failed to reach the master server: {e}")
+            return False
         if response.status_code == 200:
             self.logger.info(f"[Client Login] Successfully logged in to the master server.")
             return True
@@ -240,19 +583,35 @@ class Telemetry:
             self.logger.error(f"[Client Login] Failed to log in to the master server. Status code: {response.status_code}")
             return False
 
-    def telemetry_loop(self):
-        self.client_login()
+    async def telemetry_loop_async(self):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.io_executor, self.client_login)
+        self.enforcement_task = asyncio.create_task(self.enforcement_loop_async())
+
+        # spread nodes started together over the first interval, then tick at a fixed rate
+        await asyncio.sleep(random.uniform(0, self.interval))
+        next_tick = loop.time()
         while True:
-            # try:
-            self.post_server_info()
-            self.get_server_kill()
-            # except Exception as e:
-            #     self.logger.error(f"[Telemetry Loop] Error: {e}")
-            time.sleep(self.interval)
+            try:
+                # collection and the HTTP round trip block, so they run off the event loop
+                killing_pid_list = await loop.run_in_executor(self.io_executor, self.exchange_heartbeat)
+                await self.kill_processes_async(killing_pid_list)
+            except Exception as e:
+                self.logger.error(f"[Telemetry Loop] Error: {e}")
+
+            next_tick += self.interval
+            if next_tick < loop.time():
+                skipped = int((loop.time() - next_tick) // self.interval) + 1
+                self.logger.warning(f"[Telemetry Loop] Heartbeat overran the interval, skipping {skipped} tick(s).")
+                next_tick += skipped * self.interval
+            await asyncio.sleep(next_tick - loop.time())
+
+    def telemetry_loop(self):
+        asyncio.run(self.telemetry_loop_async())
             
 if __name__ == "__main__":
     load_dotenv()
-    client = Telemetry(server_id=os.getenv("SERVER_ID"), server_password=os.getenv("SERVER_PASSWORD"), master_url=os.getenv("MASTER_URL"), interval=os.getenv("INTERVAL"))
+    client = Telemetry(server_id=os.getenv("SERVER_ID"), server_password=os.getenv("SERVER_PASSWORD"), master_url=os.getenv("MASTER_URL"), interval=os.getenv("INTERVAL"), collector=os.getenv("COLLECTOR"), compression=os.getenv("COMPRESSION"))
     client.telemetry_loop()
         
         
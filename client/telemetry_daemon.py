@@ -24,9 +24,9 @@ def setup_logger():
     logger.addHandler(file_handler)
     logger.addHandler(stream_handler)
 
-def run(master_url, server_password, server_id, interval):
+def run(master_url, server_password, server_id, interval, collector, compression):
     setup_logger()
-    client = Telemetry(master_url=master_url, server_password=server_password, server_id=server_id, interval=interval)
+    client = Telemetry(master_url=master_url, server_password=server_password, server_id=server_id, interval=interval, collector=collector, compression=compression)
     client.telemetry_loop()
 
 context = daemon.DaemonContext(
@@ -38,4 +38,4 @@ context = daemon.DaemonContext(
 if __name__ == "__main__":
     load_dotenv()
     with context:
-        run(master_url=os.getenv("MASTER_URL"), server_password=os.getenv("SERVER_PASSWORD"), server_id=os.getenv("SERVER_ID"), interval=os.getenv("INTERVAL"))
+        run(master_url=os.getenv("MASTER_URL"), server_password=os.getenv("SERVER_PASSWORD"), server_id=os.getenv("SERVER_ID"), interval=os.getenv("INTERVAL"), collector=os.getenv("COLLECTOR"), compression=os.getenv("COMPRESSION"))
@@ -12,7 +12,7 @@ source telemetry_venv/bin/activate
 
 # Install dependencies
 echo "Installing dependencies..."
-pip install requests psutil flask python-daemon python-dotenv
+pip install requests psutil flask python-daemon python-dotenv nvidia-ml-py
 
 # Start the daemon
 sudo ./telemetry_venv/bin/python telemetry_daemon.py
@@ -0,0 +1,47 @@
+# coding: utf-8
+
+# Time per collect() of each collector backend on a GPU-less machine, through the fake NVML / nvidia-smi fixtures.
+# The fakes answer instantly, so this measures the collector's own cost: the two nvidia-smi forks and their
+# parsing for 'smi', the in-process pass for 'nvml', plus process lookups through the PID cache for both.
+#
+# Usage: python tests/benchmark_collectors.py [--gpus 8] [--ticks 200]
+
+import os
+import sys
+import time
+import logging
+import argparse
+import importlib.util
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.join(TESTS_DIR, 'fixtures')
+sys.path.insert(0, os.path.dirname(TESTS_DIR))
+
+import telemetry
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the GPU collector backends against the fake NVML / nvidia-smi.')
+    parser.add_argument('--gpus', type=int, default=8, help='fake GPUs')
+    parser.add_argument('--ticks', type=int, default=200, help='collect() calls per backend')
+    args = parser.parse_args()
+
+    os.environ['FAKE_GPU_COUNT'] = str(args.gpus)
+    os.environ['FAKE_GPU_PID'] = str(os.getpid())
+    os.environ['PATH'] = os.path.join(FIXTURES_DIR, 'bin') + os.pathsep + os.environ.get('PATH', '')
+    spec = importlib.util.spec_from_file_location('fake_pynvml', os.path.join(FIXTURES_DIR, 'pynvml.py'))
+    telemetry.pynvml = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(telemetry.pynvml)
+
+    logger = logging.getLogger('benchmark_collectors')
+    for backend in ['smi', 'nvml']:
+        collector = telemetry.create_collector(backend, logger)
+        collector.collect()
+        start = time.perf_counter()
+        for _ in range(args.ticks):
+            collector.collect()
+        elapsed = time.perf_counter() - start
+        collector.close()
+        print(f"[Benchmark] -> {backend:<5} {args.gpus} GPU(s): {elapsed / args.ticks * 1000:.3f} ms/tick over {args.ticks} tick(s)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,25 @@
+# coding: utf-8
+
+import os
+import sys
+import pytest
+import importlib.util
+
+CLIENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+sys.path.insert(0, CLIENT_DIR)
+
+@pytest.fixture
+def fake_gpus(monkeypatch):
+    # puts the fake nvidia-smi on PATH and the fake pynvml in telemetry; the fake process is this test process
+    import telemetry
+    # loaded from its path, so an installed pynvml is never picked up instead
+    spec = importlib.util.spec_from_file_location('fake_pynvml', os.path.join(FIXTURES_DIR, 'pynvml.py'))
+    fake_pynvml = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(fake_pynvml)
+    monkeypatch.setattr(telemetry, 'pynvml', fake_pynvml)
+    monkeypatch.setenv('PATH', os.path.join(FIXTURES_DIR, 'bin') + os.pathsep + os.environ.get('PATH', ''))
+    monkeypatch.setenv('FAKE_GPU_COUNT', '4')
+    monkeypatch.setenv('FAKE_GPU_PID', str(os.getpid()))
+    return fake_pynvml
@@ -0,0 +1,54 @@
+# coding: utf-8
+
+# Stand-in for the pynvml module on machines without an NVIDIA GPU, covering the calls NvmlCollector makes.
+# It reports the same devices as fixtures/bin/nvidia-smi: FAKE_GPU_COUNT GPUs (default 2), GPU i at
+# utilization 10 * i % 100, and one compute process on GPU 0 with pid FAKE_GPU_PID (default: the calling process).
+
+import os
+from types import SimpleNamespace
+
+NVML_TEMPERATURE_GPU = 0
+
+# calls made so far, for tests checking that the library is initialised once
+calls = {'nvmlInit': 0, 'nvmlShutdown': 0}
+
+class NVMLError(Exception):
+    pass
+
+def gpu_count():
+    return int(os.environ.get('FAKE_GPU_COUNT', 2))
+
+def nvmlInit():
+    calls['nvmlInit'] += 1
+
+def nvmlShutdown():
+    calls['nvmlShutdown'] += 1
+
+def nvmlDeviceGetCount():
+    return gpu_count()
+
+def nvmlDeviceGetHandleByIndex(index):
+    if index >= gpu_count():
+        raise NVMLError(f'no device {index}')
+    return index
+
+def nvmlDeviceGetUUID(handle):
+    return f'GPU-fake-{handle:04d}'.encode()
+
+def nvmlDeviceGetMemoryInfo(handle):
+    used_mib = 1000 if handle == 0 else 0
+    return SimpleNamespace(used=used_mib * 1024 * 1024, total=81920 * 1024 * 1024, free=(81920 - used_mib) * 1024 * 1024)
+
+def nvmlDeviceGetUtilizationRates(handle):
+    return SimpleNamespace(gpu=10 * handle % 100, memory=0)
+
+def nvmlDeviceGetTemperature(handle, sensor):
+    return 40 + handle
+
+def nvmlDeviceGetComputeRunningProcesses(handle):
+    if handle != 0:
+        return []
+    return [SimpleNamespace(pid=int(os.environ.get('FAKE_GPU_PID', os.getpid())), usedGpuMemory=900 * 1024 * 1024)]
+
+def nvmlSystemGetProcessName(pid):
+    raise NVMLError('not supported by the fake')
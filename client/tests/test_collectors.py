@@ -0,0 +1,69 @@
+# coding: utf-8
+
+# Both collector backends against the fake NVML / nvidia-smi fixtures: same GPUs, same processes, same shape.
+
+import os
+import psutil
+import logging
+import telemetry
+
+logger = logging.getLogger('test_collectors')
+
+GPU_FIELDS = {'gpu_id', 'uuid', 'memory_usage_mib', 'memory_total_mib', 'memory_percent', 'utilization_percent', 'temperature_celsius', 'processes'}
+
+def check_gpus(gpus):
+    assert [gpu['gpu_id'] for gpu in gpus] == [0, 1, 2, 3]
+    for gpu in gpus:
+        assert set(gpu) == GPU_FIELDS
+        assert gpu['uuid'] == f"GPU-fake-{gpu['gpu_id']:04d}"
+        assert gpu['memory_total_mib'] == 81920
+        assert gpu['utilization_percent'] == 10 * gpu['gpu_id']
+        assert gpu['temperature_celsius'] == 40 + gpu['gpu_id']
+    assert gpus[0]['memory_usage_mib'] == 1000
+    assert gpus[0]['memory_percent'] == round(1000 / 81920 * 100, 1)
+    assert all(not gpu['processes'] for gpu in gpus[1:])
+
+    process, = gpus[0]['processes']
+    assert process['pid'] == os.getpid()
+    assert process['user'] == psutil.Process().username()
+    assert process['used_gpu_memory_mib'] == 900
+
+def test_smi_collector(fake_gpus):
+    collector = telemetry.SmiCollector(logger)
+    gpus = collector.collect()
+    check_gpus(gpus)
+    assert gpus[0]['processes'][0]['process_name'] == 'python'
+
+def test_nvml_collector(fake_gpus):
+    collector = telemetry.NvmlCollector(logger)
+    gpus = collector.collect()
+    check_gpus(gpus)
+    # the name comes from the process itself rather than from NVML
+    assert gpus[0]['processes'][0]['process_name'] == psutil.Process().name()
+
+def test_backends_agree(fake_gpus):
+    smi_gpus = telemetry.SmiCollector(logger).collect()
+    nvml_gpus = telemetry.NvmlCollector(logger).collect()
+    strip = lambda gpus: [dict(gpu, processes=[dict(process, process_name=None) for process in gpu['processes']]) for gpu in gpus]
+    assert strip(smi_gpus) == strip(nvml_gpus)
+
+def test_nvml_initialised_once(fake_gpus):
+    collector = telemetry.NvmlCollector(logger)
+    for _ in range(5):
+        collector.collect()
+    collector.close()
+    assert fake_gpus.calls == {'nvmlInit': 1, 'nvmlShutdown': 1}
+
+def test_auto_prefers_nvml(fake_gpus):
+    assert isinstance(telemetry.create_collector('auto', logger), telemetry.NvmlCollector)
+    assert isinstance(telemetry.create_collector('smi', logger), telemetry.SmiCollector)
+
+def test_auto_falls_back_to_smi(fake_gpus, monkeypatch):
+    monkeypatch.setattr(telemetry, 'pynvml', None)
+    collector = telemetry.create_collector('auto', logger)
+    assert isinstance(collector, telemetry.SmiCollector)
+    check_gpus(collector.collect())
+
+def test_smi_missing(fake_gpus, monkeypatch, tmp_path):
+    monkeypatch.setenv('PATH', str(tmp_path))
+    assert telemetry.SmiCollector(logger).collect() == []
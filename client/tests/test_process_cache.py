@@ -0,0 +1,38 @@
+# coding: utf-8
+
+import logging
+import contextlib
+import process_cache
+
+CONTAINER_ID = 'ab' * 32
+
+def test_container_pattern():
+    for cgroup in [f'0::/system.slice/docker-{CONTAINER_ID}.scope',
+                   f'12:memory:/docker/{CONTAINER_ID}',
+                   f'0::/kubepods.slice/kubepods-pod1.slice/cri-containerd-{CONTAINER_ID}.scope']:
+        assert process_cache.CONTAINER_PATTERN.search(cgroup).group(1) == CONTAINER_ID
+    for cgroup in [f'0::/user.slice/user-1000.slice/user@1000.service/app.slice/docker-{CONTAINER_ID}.scope',
+                   f'0::/user.slice/user-1000.slice/user@1000.service/user.slice/libpod-{CONTAINER_ID}.scope',
+                   '0::/user.slice/user-1000.slice/session-3.scope']:
+        assert process_cache.CONTAINER_PATTERN.search(cgroup) is None
+
+def test_owner_only_for_root_processes(monkeypatch):
+    cache = process_cache.ProcessCache(logging.getLogger('test_process_cache'))
+    monkeypatch.setattr(cache, 'get_container', lambda pid: CONTAINER_ID[:12])
+    monkeypatch.setattr(cache, 'get_container_owner', lambda container: 'alice')
+
+    class Process:
+        pid = 1
+        def __init__(self, user):
+            self.user = user
+        def oneshot(self):
+            return contextlib.nullcontext()
+        def username(self):
+            return self.user
+        def name(self):
+            return 'python'
+        def cmdline(self):
+            return ['python', 'train.py']
+
+    assert cache.inspect(Process('root'), 0)['owner'] == 'alice'
+    assert cache.inspect(Process('mallory'), 0)['owner'] is None
@@ -0,0 +1,52 @@
+# coding: utf-8
+
+import spool
+from spool import SnapshotSpool
+
+def test_peek_drop_and_restart(tmp_path):
+    path = str(tmp_path / 'spool.jsonl')
+    snapshot_spool = SnapshotSpool(path, max_entries=100)
+    for timestamp in range(10):
+        snapshot_spool.append({'timestamp': timestamp})
+
+    assert [sample['timestamp'] for sample in snapshot_spool.peek(3)] == [0, 1, 2]
+    snapshot_spool.drop(3)
+    assert len(snapshot_spool) == 7
+
+    # the offset survives a restart, so delivered samples are not sent again
+    snapshot_spool = SnapshotSpool(path, max_entries=100)
+    assert len(snapshot_spool) == 7
+    assert [sample['timestamp'] for sample in snapshot_spool.peek(2)] == [3, 4]
+
+    snapshot_spool.drop(7)
+    assert len(snapshot_spool) == 0
+    assert (tmp_path / 'spool.jsonl').stat().st_size == 0
+
+def test_bad_lines_skipped(tmp_path):
+    path = tmp_path / 'spool.jsonl'
+    path.write_text('{"timestamp": 0}\nnot json\n{"timestamp": 1}\n')
+    snapshot_spool = SnapshotSpool(str(path))
+
+    assert [sample['timestamp'] for sample in snapshot_spool.peek(10)] == [0, 1]
+    snapshot_spool.drop(2)
+    assert len(snapshot_spool) == 0
+    assert snapshot_spool.peek(10) == []
+
+def test_cap_and_compaction(tmp_path, monkeypatch):
+    monkeypatch.setattr(spool, 'COMPACT_MIN_BYTES', 64)
+    path = tmp_path / 'spool.jsonl'
+    snapshot_spool = SnapshotSpool(str(path), max_entries=20)
+    for timestamp in range(23):
+        snapshot_spool.append({'timestamp': timestamp})
+
+    # past the 10% slack the oldest samples are skipped
+    assert len(snapshot_spool) == 20
+    assert snapshot_spool.peek(1) == [{'timestamp': 3}]
+
+    # delivering half of the file cuts the delivered head off
+    snapshot_spool.drop(1)
+    assert [sample['timestamp'] for sample in snapshot_spool.peek(12)] == list(range(4, 16))
+    snapshot_spool.drop(12)
+    assert snapshot_spool.offset == 0
+    assert path.read_text().splitlines()[0] == '{"timestamp":16}'
+    assert [sample['timestamp'] for sample in snapshot_spool.peek(10)] == list(range(16, 23))
@@ -0,0 +1,356 @@
+# coding: utf-8
+
+# Bulk provisioning of users, servers, ACLs and credits, and whole-dataset snapshots.
+#
+# Records are read and written as CSV or JSONL, one record per row / line:
+#
+#   users     username, password, credit, server_list (CSV: servers separated by ';'), any other user document field
+#   servers   server_id, password, gpu_ids (CSV: separated by ';')
+#   acl       username, server_id, action ('grant', the default, or 'revoke')
+#   credits   username, and either credit (new balance) or delta (added to the balance)
+#
+# A batch is validated as a whole before anything is written, then written in pipelines of CHUNK_SIZE
+# records (one round trip each, two for users, whose documents are read first so omitted fields are kept).
+# Fields left empty in a row are left unchanged. Every changed user / server is announced on AUTH_INVALIDATE.
+#
+# A snapshot is the primary data of the database as JSONL after a header line: {key, ttl_ms, dump} per key,
+# `dump` being the base64 of the key's DUMP. Keys are read by SCAN in chunks of CHUNK_SIZE, each one pipelined
+# round trip, so Redis is never blocked for long and nothing is buffered beyond a chunk; the price is that keys
+# are read at slightly different instants. Left out are locks and what heartbeats rebuild (HISTORY_*, status,
+# summaries, idle clocks, audited kills), and the AUDIT* streams unless asked for. Replaying RESTOREs the keys
+# as they were, e.g. into a test instance running the same or a newer Redis. For a full point-in-time backup
+# use Redis itself (BGSAVE and copy the RDB file).
+#
+# Usage: python admin.py import {users,servers,acl,credits} FILE
+#        python admin.py export {users,servers,acl,credits} [FILE] [--secrets]
+#        python admin.py snapshot [FILE] [--audit]
+#        python admin.py replay FILE [--flush]
+# FILE is CSV when it ends in .csv, JSONL otherwise; '-' or no FILE is stdout. Every command takes
+# --host / --port / --db, defaulting to REDIS_HOST / REDIS_PORT / REDIS_DB like the master; replay --flush
+# empties the target first and so only runs when --host and --db are given explicitly.
+
+import io
+import os
+import re
+import csv
+import sys
+import json
+import time
+import base64
+import argparse
+from database import DataBase
+from dotenv import load_dotenv
+
+KINDS = ['users', 'servers', 'acl', 'credits']
+
+# records written per pipeline
+CHUNK_SIZE = 1000
+
+SNAPSHOT_VERSION = 2
+
+# keys a snapshot leaves out: locks and the data rebuilt from heartbeats
+DERIVED_KEY_PATTERN = re.compile(r'^(?:LOCK_|HISTORY_|SERVER_.+_(?:STATUS|SUMMARY|IDLE|KILLS_\d+)$)')
+
+CSV_FIELDS = {
+    'users': ['username', 'password', 'credit', 'server_list'],
+    'servers': ['server_id', 'password', 'gpu_ids'],
+    'acl': ['username', 'server_id'],
+    'credits': ['username', 'credit'],
+}
+
+# CSV columns holding ';' separated lists
+LIST_FIELDS = {'server_list', 'gpu_ids'}
+
+def parse_records(text, data_format):
+    # [record, ...] from CSV / JSONL text; CSV cells are strings, empty cells are dropped
+    if data_format == 'csv':
+        records = list()
+        for row in csv.DictReader(io.StringIO(text)):
+            record = dict()
+            for field, value in row.items():
+                if field is None or value is None or value.strip() == '':
+                    continue
+                value = value.strip()
+                record[field.strip()] = [item.strip() for item in value.split(';') if item.strip()] if field.strip() in LIST_FIELDS else value
+            records.append(record)
+        return records
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+def format_records(records, data_format, fields=()):
+    if data_format == 'csv':
+        fieldnames = list(fields) + sorted({field for record in records for field in record} - set(fields))
+        output = io.StringIO()
+        writer = csv.DictWriter(output, fieldnames=fieldnames, lineterminator='\n')
+        writer.writeheader()
+        for record in records:
+            writer.writerow({field: ';'.join(map(str, value)) if isinstance(value, list) else value for field, value in record.items()})
+        return output.getvalue()
+    return ''.join(json.dumps(record) + '\n' for record in records)
+
+def chunks(items, size=CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def is_integer(value):
+    try:
+        int(value)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+class BulkAdmin:
+    def __init__(self, db):
+        self.db = db
+        self.redis_client = db.redis_client
+
+    def validate(self, kind, records):
+        # [(record number, message), ...], empty when the whole batch can be written
+        errors = list()
+        key_field = 'server_id' if kind == 'servers' else 'username'
+        known_servers = set(self.db.get_servers()) if kind in ('users', 'acl') else set()
+        missing_users = self.get_missing_users(records) if kind in ('acl', 'credits') else set()
+        for number, record in enumerate(records, 1):
+            if not isinstance(record, dict) or not record.get(key_field):
+                errors.append((number, f'missing {key_field}'))
+                continue
+            if kind in ('users', 'credits') and 'credit' in record and not is_integer(record['credit']):
+                errors.append((number, 'credit must be an integer'))
+            if kind == 'credits' and ('credit' in record) == ('delta' in record):
+                errors.append((number, 'expecting one of credit or delta'))
+            if kind == 'credits' and 'delta' in record and not is_integer(record['delta']):
+                errors.append((number, 'delta must be an integer'))
+            if kind == 'servers' and not all(is_integer(gpu_id) for gpu_id in record.get('gpu_ids', [])):
+                errors.append((number, 'gpu_ids must be integers'))
+            if kind == 'acl' and (not record.get('server_id') or record.get('action', 'grant') not in ('grant', 'revoke')):
+                errors.append((number, 'expecting server_id and action grant / revoke'))
+            for field in LIST_FIELDS & set(record):
+                if not isinstance(record[field], list):
+                    errors.append((number, f'{field} must be a list'))
+            if kind == 'users' and isinstance(record.get('server_list', []), list) and set(record.get('server_list', [])) - known_servers:
+                errors.append((number, f"unknown server(s): {sorted(set(record['server_list']) - known_servers)}"))
+            if kind == 'acl' and record.get('server_id') and record['server_id'] not in known_servers:
+                errors.append((number, f"unknown server: {record['server_id']}"))
+            if isinstance(record[key_field], str) and record[key_field] in missing_users:
+                errors.append((number, f"unknown user: {record[key_field]}"))
+        return errors
+
+    def get_missing_users(self, records):
+        # the usernames of `records` without a USER_{name} document, checked CHUNK_SIZE per round trip
+        usernames = sorted({record['username'] for record in records if isinstance(record, dict) and isinstance(record.get('username'), str) and record['username']})
+        missing = set()
+        for chunk in chunks(usernames):
+            exists = self.db.pipeline_results(lambda pipe: [pipe.exists(f'USER_{username}') for username in chunk])
+            missing.update(username for username, found in zip(chunk, exists) if not found)
+        return missing
+
+    def import_records(self, kind, records):
+        # {'imported': n} once written, or {'errors': [...]} with nothing written
+        errors = self.validate(kind, records)
+        if errors:
+            return {'imported': 0, 'errors': [{'record': number, 'message': message} for number, message in errors]}
+        write = getattr(self, f'import_{kind}')
+        for chunk in chunks(records):
+            write(chunk)
+        return {'imported': len(records), 'errors': []}
+
+    def import_users(self, records):
+        raw_documents = self.redis_client.mget([f"USER_{record['username']}" for record in records])
+        pipe = self.redis_client.pipeline(transaction=False)
+        for record, raw_data in zip(records, raw_documents):
+            username = record['username']
+            user_info = json.loads(raw_data) if raw_data else {}
+            user_info.update({field: value for field, value in record.items() if field not in ('username', 'credit', 'server_list')})
+            pipe.set(f'USER_{username}', json.dumps(user_info))
+            if 'credit' in record:
+                pipe.set(f'USER_{username}_CREDIT', int(record['credit']))
+            elif not raw_data:
+                pipe.set(f'USER_{username}_CREDIT', 0, nx=True)
+            if 'server_list' in record:
+                pipe.delete(f'USER_{username}_SERVERS')
+                if record['server_list']:
+                    pipe.sadd(f'USER_{username}_SERVERS', *record['server_list'])
+            pipe.publish('AUTH_INVALIDATE', f'USER:{username}')
+        pipe.execute()
+
+    def import_servers(self, records):
+        pipe = self.redis_client.pipeline(transaction=False)
+        for record in records:
+            server_id = record['server_id']
+            pipe.sadd('SERVERS', server_id)
+            if 'password' in record:
+                pipe.set(f'SERVER_{server_id}_PASSWORD', record['password'])
+            if 'gpu_ids' in record:
+                pipe.delete(f'SERVER_{server_id}_GPUS')
+                if record['gpu_ids']:
+                    pipe.sadd(f'SERVER_{server_id}_GPUS', *[str(int(gpu_id)) for gpu_id in record['gpu_ids']])
+            pipe.publish('AUTH_INVALIDATE', f'SERVER:{server_id}')
+        pipe.execute()
+
+    def import_acl(self, records):
+        pipe = self.redis_client.pipeline(transaction=False)
+        for record in records:
+            if record.get('action', 'grant') == 'grant':
+                pipe.sadd(f"USER_{record['username']}_SERVERS", record['server_id'])
+            else:
+                pipe.srem(f"USER_{record['username']}_SERVERS", record['server_id'])
+        for username in {record['username'] for record in records}:
+            pipe.publish('AUTH_INVALIDATE', f'USER:{username}')
+        pipe.execute()
+
+    def import_credits(self, records):
+        # deltas go through INCRBY, so they add up with bookings made meanwhile
+        pipe = self.redis_client.pipeline(transaction=False)
+        for record in records:
+            if 'delta' in record:
+                pipe.incrby(f"USER_{record['username']}_CREDIT", int(record['delta']))
+            else:
+                pipe.set(f"USER_{record['username']}_CREDIT", int(record['credit']))
+        pipe.execute()
+
+    def get_usernames(self):
+        # user documents are the USER_{name} strings holding a json object (USER_{name}_CREDIT holds a number)
+        keys = sorted(self.redis_client.scan_iter(match='USER_*', _type='string', count=CHUNK_SIZE))
+        usernames = list()
+        for chunk in chunks(keys):
+            for key, raw_data in zip(chunk, self.redis_client.mget(chunk)):
+                if raw_data and raw_data.startswith('{'):
+                    usernames.append(key[len('USER_'):])
+        return usernames
+
+    def export_records(self, kind, secrets=False):
+        # [record, ...] in the import format; passwords only with `secrets`
+        if kind == 'servers':
+            server_ids = self.db.get_servers()
+            records = list()
+            for chunk in chunks(server_ids):
+                results = self.db.pipeline_results(lambda pipe: [(pipe.get(f'SERVER_{server_id}_PASSWORD'), pipe.smembers(f'SERVER_{server_id}_GPUS')) for server_id in chunk])
+                for server_id, password, gpu_ids in zip(chunk, results[0::2], results[1::2]):
+                    record = {'server_id': server_id, 'gpu_ids': sorted(gpu_ids, key=int)}
+                    if secrets:
+                        record['password'] = password
+                    records.append(record)
+            return records
+
+        records = list()
+        for chunk in chunks(self.get_usernames()):
+            results = self.db.pipeline_results(lambda pipe: [(pipe.get(f'USER_{username}'), pipe.get(f'USER_{username}_CREDIT'), pipe.smembers(f'USER_{username}_SERVERS')) for username in chunk])
+            for username, raw_data, credit, server_list in zip(chunk, results[0::3], results[1::3], results[2::3]):
+                if kind == 'acl':
+                    records.extend({'username': username, 'server_id': server_id} for server_id in sorted(server_list))
+                elif kind == 'credits':
+                    records.append({'username': username, 'credit': int(credit or 0)})
+                else:
+                    user_info = json.loads(raw_data) if raw_data else {}
+                    if not secrets:
+                        user_info.pop('password', None)
+                    records.append(dict({'username': username, 'credit': int(credit or 0), 'server_list': sorted(server_list)}, **user_info))
+        return records
+
+    def snapshot(self, audit=False):
+        # yields the JSONL lines of a snapshot: a header, then {key, ttl_ms, dump} per key, CHUNK_SIZE keys per round trip
+        yield json.dumps({'snapshot': SNAPSHOT_VERSION, 'created': time.time(), 'audit': audit}) + '\n'
+        keys = (key for key in self.redis_client.scan_iter(count=CHUNK_SIZE)
+                if not DERIVED_KEY_PATTERN.match(key) and (audit or not key.startswith('AUDIT')))
+        while True:
+            chunk = [key for _, key in zip(range(CHUNK_SIZE), keys)]
+            if not chunk:
+                break
+            pipe = self.db.raw_redis_client.pipeline(transaction=False)
+            for key in chunk:
+                pipe.dump(key)
+                pipe.pttl(key)
+            results = pipe.execute()
+            for key, dump, ttl in zip(chunk, results[0::2], results[1::2]):
+                # a key deleted since it was listed
+                if dump is None:
+                    continue
+                yield json.dumps({'key': key, 'ttl_ms': ttl if ttl > 0 else None, 'dump': base64.b64encode(dump).decode()}) + '\n'
+
+    def replay(self, lines, flush=False):
+        # writes back the keys of a snapshot (replacing them, or the whole database with `flush`); returns the number of keys
+        lines = iter(lines)
+        header = json.loads(next(lines))
+        if header.get('snapshot') != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version: {header.get('snapshot')}")
+        if flush:
+            self.redis_client.flushdb()
+
+        restored = 0
+        pipe = self.db.raw_redis_client.pipeline(transaction=False)
+        for line in lines:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            pipe.restore(entry['key'], entry['ttl_ms'] or 0, base64.b64decode(entry['dump']), replace=True)
+            restored += 1
+            if restored % CHUNK_SIZE == 0:
+                pipe.execute()
+        # every cached credential / ACL may be stale now
+        pipe.publish('AUTH_INVALIDATE', '*')
+        pipe.execute()
+        return restored
+
+def data_format_of(path, data_format=None):
+    return data_format or ('csv' if path and path.endswith('.csv') else 'jsonl')
+
+def write_output(path, chunks_of_text):
+    output_file = sys.stdout if path == '-' else open(path, 'w', newline='')
+    try:
+        output_file.writelines(chunks_of_text)
+    finally:
+        if output_file is not sys.stdout:
+            output_file.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Bulk import / export of users, servers, ACLs and credits, and dataset snapshots.")
+    parser.add_argument('--host', help="Redis host (default: REDIS_HOST or localhost)")
+    parser.add_argument('--port', type=int, help="Redis port (default: REDIS_PORT or 6379)")
+    parser.add_argument('--db', type=int, help="Redis database (default: REDIS_DB or 0)")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    import_parser = subparsers.add_parser('import')
+    import_parser.add_argument('kind', choices=KINDS)
+    import_parser.add_argument('path')
+    import_parser.add_argument('--format', choices=['csv', 'jsonl'])
+    export_parser = subparsers.add_parser('export')
+    export_parser.add_argument('kind', choices=KINDS)
+    export_parser.add_argument('path', nargs='?', default='-')
+    export_parser.add_argument('--format', choices=['csv', 'jsonl'])
+    export_parser.add_argument('--secrets', action='store_true', help="include passwords")
+    snapshot_parser = subparsers.add_parser('snapshot')
+    snapshot_parser.add_argument('path', nargs='?', default='-')
+    snapshot_parser.add_argument('--audit', action='store_true', help="include the audit streams")
+    replay_parser = subparsers.add_parser('replay')
+    replay_parser.add_argument('path')
+    replay_parser.add_argument('--flush', action='store_true', help="empty the database first (needs explicit --host and --db)")
+    args = parser.parse_args()
+    if args.command == 'replay' and args.flush and (args.host is None or args.db is None):
+        parser.error("replay --flush empties the target database, name it with --host and --db")
+
+    load_dotenv()
+    redis_host = args.host if args.host is not None else os.environ.get('REDIS_HOST', 'localhost')
+    redis_port = args.port if args.port is not None else int(os.environ.get('REDIS_PORT', 6379))
+    redis_db = args.db if args.db is not None else int(os.environ.get('REDIS_DB', 0))
+    print(f"[Admin] -> Redis {redis_host}:{redis_port} db {redis_db}", file=sys.stderr)
+    db = DataBase(redis_host=redis_host, redis_port=redis_port, redis_password=os.environ["REDIS_PASSWORD"], redis_db=redis_db)
+    bulk_admin = BulkAdmin(db)
+
+    if args.command == 'import':
+        with open(args.path, newline='') as input_file:
+            records = parse_records(input_file.read(), data_format_of(args.path, args.format))
+        result = bulk_admin.import_records(args.kind, records)
+        for error in result['errors']:
+            print(f"[Admin Import] -> record {error['record']}: {error['message']}", file=sys.stderr)
+        print(f"[Admin Import] -> {result['imported']} {args.kind} record(s) imported", file=sys.stderr)
+        sys.exit(1 if result['errors'] else 0)
+    elif args.command == 'export':
+        records = bulk_admin.export_records(args.kind, args.secrets)
+        text = format_records(records, data_format_of(args.path, args.format), CSV_FIELDS[args.kind])
+        write_output(args.path, [text])
+        print(f"[Admin Export] -> {len(records)} {args.kind} record(s) exported", file=sys.stderr)
+    elif args.command == 'snapshot':
+        write_output(args.path, bulk_admin.snapshot(args.audit))
+        print(f"[Admin Snapshot] -> written to {args.path}", file=sys.stderr)
+    elif args.command == 'replay':
+        with open(args.path) as input_file:
+            restored = bulk_admin.replay(input_file, args.flush)
+        print(f"[Admin Replay] -> {restored} key(s) restored", file=sys.stderr)
@@ -0,0 +1,64 @@
+# coding: utf-8
+
+# Availability grid for the /server/detail page.
+#
+# The slot labels only change once per hour, so they are formatted once per hour for every server.
+# Each server's grid is cached per (server, current hour) and rebuilt only when the hour rolls over
+# or SERVER_{id}_BOOK_VERSION moves, i.e. when a booking on that server changed (from any worker).
+
+import time
+import pytz
+import threading
+from datetime import datetime
+
+class AvailabilityGrid:
+    def __init__(self, db, display_timezone, slot_count=48):
+        self.db = db
+        self.display_timezone = display_timezone
+        self.slot_count = slot_count
+        self.lock = threading.Lock()
+        self.labels = (None, [])
+        self.grids = dict()
+
+    def get_labels(self, current_hour_timestamp):
+        # [(slot_timestamp, display_time), ...] for the next `slot_count` hours, shared by every server
+        labels_hour, labels = self.labels
+        if labels_hour != current_hour_timestamp:
+            labels = list()
+            for i in range(self.slot_count):
+                slot_timestamp = current_hour_timestamp + i * 3600
+                display_time = datetime.fromtimestamp(slot_timestamp, pytz.utc).astimezone(self.display_timezone).strftime('%m-%d %H:%M')
+                labels.append((slot_timestamp, display_time))
+            self.labels = (current_hour_timestamp, labels)
+        return labels
+
+    def get_free_slots(self, server_id):
+        current_hour_timestamp = int(time.time()) - int(time.time()) % 3600
+        book_version = self.db.get_book_version(server_id)
+
+        cached = self.grids.get(server_id)
+        if cached and cached[0] == current_hour_timestamp and cached[1] == book_version:
+            return cached[2]
+
+        free_slots = self.build(server_id, current_hour_timestamp)
+        with self.lock:
+            self.grids[server_id] = (current_hour_timestamp, book_version, free_slots)
+        return free_slots
+
+    def build(self, server_id, current_hour_timestamp):
+        labels = self.get_labels(current_hour_timestamp)
+        gpu_ids = self.db.get_server_gpus(server_id)
+        book_events = self.db.get_book_range(server_id, gpu_ids, labels[0][0], labels[-1][0])
+
+        free_slots = dict()
+        for gpu in gpu_ids:
+            book_event = book_events[gpu]
+            free_slots[gpu] = [
+                {
+                    "current_timestamp": slot_timestamp,
+                    "display_time": display_time,
+                    "booked_by": book_event.get(str(slot_timestamp), "")
+                }
+                for slot_timestamp, display_time in labels
+            ]
+        return free_slots
@@ -0,0 +1,366 @@
+# coding: utf-8
+
+# Load test of the master with a simulated telemetry fleet and concurrent booking users.
+#
+# Each simulated node is a real client Telemetry object (compact payloads, deltas, compression) fed by a
+# synthetic collector; each simulated user logs in and cycles through /server/detail, /server/status,
+# /cluster/overview and book / unbook of a random future slot. The report lists per endpoint the request
+# count, errors, throughput, p50 / p99 latency and Redis commands / round trips per request.
+#
+# Usage:
+#   python benchmark.py --nodes 200 --users 20 --duration 60                 in-process app on fakeredis
+#   python benchmark.py --redis --nodes 200                                  in-process app on the local Redis (db 15)
+#   python benchmark.py --master-url http://localhost:8000 --nodes 200       a running master started with REDIS_DB=15
+#   python benchmark.py --detail --gpus 16 --requests 200                    /server/detail alone, in-process
+#
+# --detail times the rendering of /server/detail for one server with `--gpus` GPUs, every other GPU booked
+# every third hour of the grid, through the Flask test client. Run it in two checkouts to compare a change.
+#
+# With --redis or --master-url the bench-* servers and users are written to database --redis-db (15 by
+# default, so a run never touches the production db 0; a running master must use the same one through
+# REDIS_DB) and removed afterwards, along with their audit events and waitlist requests, even when the run
+# fails or is interrupted. Redis commands per request are counted per endpoint for the in-process app, and as one
+# total from INFO for a running master (which also includes its background work).
+
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import tempfile
+import threading
+import requests
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'client'))
+
+BENCH_PREFIX = 'bench-'
+
+class Recorder:
+    # latencies and Redis counts per endpoint, shared by every simulated client
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = dict()
+
+    def add(self, endpoint, latency, status_code, redis_commands=None, redis_roundtrips=None):
+        with self.lock:
+            self.samples.setdefault(endpoint, []).append((latency, status_code, redis_commands, redis_roundtrips))
+
+    def report(self, duration):
+        report = dict()
+        for endpoint, samples in sorted(self.samples.items()):
+            latencies = sorted(sample[0] for sample in samples)
+            commands = [sample[2] for sample in samples if sample[2] is not None]
+            roundtrips = [sample[3] for sample in samples if sample[3] is not None]
+            report[endpoint] = {
+                'requests': len(samples),
+                'errors': sum(1 for sample in samples if sample[1] >= 400 and sample[1] != 409),
+                'throughput': round(len(samples) / duration, 1),
+                'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+                'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+                'redis_commands': round(sum(commands) / len(commands), 1) if commands else None,
+                'redis_roundtrips': round(sum(roundtrips) / len(roundtrips), 1) if roundtrips else None,
+            }
+        return report
+
+def percentile(sorted_values, percent):
+    if not sorted_values:
+        return 0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * percent / 100))]
+
+class TimedSession(requests.Session):
+    def __init__(self, recorder):
+        super().__init__()
+        self.recorder = recorder
+
+    def request(self, method, url, *args, **kwargs):
+        start = time.perf_counter()
+        response = super().request(method, url, *args, **kwargs)
+        latency = time.perf_counter() - start
+        endpoint = f"{method} {requests.utils.urlparse(url).path}"
+        commands, roundtrips = response.headers.get('X-Redis-Commands'), response.headers.get('X-Redis-Roundtrips')
+        self.recorder.add(endpoint, latency, response.status_code, commands and int(commands), roundtrips and int(roundtrips))
+        return response
+
+class RedisCounter:
+    # counts the Redis commands / round trips issued by each request thread of the in-process app
+    def __init__(self):
+        self.local = threading.local()
+
+    def install(self, app):
+        import redis
+        counter = self
+        execute_command = redis.client.Redis.execute_command
+        pipeline_execute = redis.client.Pipeline.execute
+
+        def counted_execute_command(self, *args, **kwargs):
+            counter.count(1)
+            return execute_command(self, *args, **kwargs)
+
+        def counted_pipeline_execute(self, *args, **kwargs):
+            counter.count(len(self.command_stack))
+            return pipeline_execute(self, *args, **kwargs)
+
+        redis.client.Redis.execute_command = counted_execute_command
+        redis.client.Pipeline.execute = counted_pipeline_execute
+
+        @app.before_request
+        def start_counting():
+            self.local.counts = [0, 0]
+
+        @app.after_request
+        def report_counts(response):
+            counts = getattr(self.local, 'counts', None)
+            if counts is not None:
+                response.headers['X-Redis-Commands'], response.headers['X-Redis-Roundtrips'] = str(counts[0]), str(counts[1])
+                self.local.counts = None
+            return response
+
+    def count(self, commands):
+        counts = getattr(self.local, 'counts', None)
+        if counts is not None:
+            counts[0] += commands
+            counts[1] += 1
+
+class SyntheticCollector:
+    # a node with `gpu_count` GPUs whose utilization and memory drift between ticks
+    def __init__(self, gpu_count, users):
+        self.users = users
+        self.gpus = [
+            {
+                'gpu_id': gpu_id, 'uuid': f'GPU-{random.getrandbits(64):016x}', 'memory_usage_mib': 0, 'memory_total_mib': 81920,
+                'memory_percent': 0.0, 'utilization_percent': 0, 'temperature_celsius': 35, 'processes': [],
+            }
+            for gpu_id in range(gpu_count)
+        ]
+
+    def collect(self):
+        for gpu in self.gpus:
+            # about a third of the GPUs change per tick, like a partly busy node
+            if random.random() < 0.3:
+                busy = random.random() < 0.6
+                gpu['utilization_percent'] = random.randint(60, 100) if busy else 0
+                gpu['memory_usage_mib'] = random.randint(4096, 81920) if busy else 0
+                gpu['memory_percent'] = round(gpu['memory_usage_mib'] / gpu['memory_total_mib'] * 100, 2)
+                gpu['temperature_celsius'] = random.randint(50, 85) if busy else 35
+                gpu['processes'] = [{'pid': random.randint(1000, 99999), 'user': random.choice(self.users), 'process_name': 'python', 'used_gpu_memory_mib': gpu['memory_usage_mib']}] if busy else []
+        return [dict(gpu) for gpu in self.gpus]
+
+    def close(self):
+        pass
+
+def run_node(telemetry, recorder, interval, deadline):
+    from telemetry import MasterUnavailable
+    telemetry.session = TimedSession(recorder)
+    telemetry.client_login()
+    next_tick = time.time() + random.uniform(0, interval)
+    while time.time() < deadline:
+        time.sleep(max(0, next_tick - time.time()))
+        try:
+            telemetry.exchange_heartbeat()
+        except MasterUnavailable:
+            pass
+        next_tick += interval
+
+def run_user(master_url, username, password, server_ids, recorder, think_time, deadline):
+    session = TimedSession(recorder)
+    session.post(f"{master_url}/user/login", data={'username': username, 'password': password}, allow_redirects=False)
+    while time.time() < deadline:
+        server_id = random.choice(server_ids)
+        action = random.random()
+        if action < 0.4:
+            session.get(f"{master_url}/server/detail", params={'server_id': server_id}, allow_redirects=False)
+        elif action < 0.6:
+            session.get(f"{master_url}/server/status", params={'server_id': server_id}, allow_redirects=False)
+        elif action < 0.7:
+            session.get(f"{master_url}/cluster/overview", params={'format': 'json'}, allow_redirects=False)
+        else:
+            params = {'server_id': server_id, 'gpu_id': random.randint(0, 7), 'timestamp': int(time.time()) // 3600 * 3600 + random.randint(1, 48) * 3600}
+            session.get(f"{master_url}/server/book", params=params, allow_redirects=False)
+            session.get(f"{master_url}/server/unbook", params=params, allow_redirects=False)
+        time.sleep(think_time)
+
+def seed(db, node_count, gpu_count, user_count):
+    server_ids = [f'{BENCH_PREFIX}server-{i}' for i in range(node_count)]
+    usernames = [f'{BENCH_PREFIX}user-{j}' for j in range(user_count)]
+    for server_id in server_ids:
+        db.create_server(server_id, server_id, list(range(gpu_count)))
+    for username in usernames:
+        db.set_user_info(username, {'password': username, 'credit': 10 ** 9, 'server_list': server_ids})
+    return server_ids, usernames
+
+def cleanup(redis_client, since=None):
+    # removes every bench-* key, and the bench-* events of the shared AUDIT stream / WAITLIST added after `since`
+    for pattern in [f'SERVER_{BENCH_PREFIX}*', f'USER_{BENCH_PREFIX}*', f'HISTORY_{BENCH_PREFIX}*', f'AUDIT_USER_{BENCH_PREFIX}*', f'AUDIT_SERVER_{BENCH_PREFIX}*']:
+        keys = list(redis_client.scan_iter(pattern, count=1000))
+        for i in range(0, len(keys), 1000):
+            redis_client.delete(*keys[i:i + 1000])
+    server_ids = [server_id for server_id in redis_client.smembers('SERVERS') if server_id.startswith(BENCH_PREFIX)]
+    if server_ids:
+        redis_client.srem('SERVERS', *server_ids)
+
+    start_id = f'{int(since * 1000)}-0' if since else '-'
+    while True:
+        events = redis_client.xrange('AUDIT', min=start_id, count=1000)
+        bench_ids = [event_id for event_id, fields in events if fields.get('username', '').startswith(BENCH_PREFIX) or fields.get('server_id', '').startswith(BENCH_PREFIX)]
+        if bench_ids:
+            redis_client.xdel('AUDIT', *bench_ids)
+        if len(events) < 1000:
+            break
+        start_id = f'({events[-1][0]}'
+
+    for entry_id in redis_client.zrange('WAITLIST', 0, -1):
+        raw_entry = redis_client.get(f'WAITLIST_ENTRY_{entry_id}')
+        if raw_entry and json.loads(raw_entry)['username'].startswith(BENCH_PREFIX):
+            redis_client.zrem('WAITLIST', entry_id)
+            redis_client.delete(f'WAITLIST_ENTRY_{entry_id}')
+
+def run_detail(app, db, gpu_count, request_count):
+    # mean seconds per /server/detail request of one seeded server
+    server_ids, usernames = seed(db, 1, gpu_count, 1)
+    current_hour_timestamp = int(time.time()) - int(time.time()) % 3600
+    db.book_slots(server_ids[0], [str(gpu_id) for gpu_id in range(0, gpu_count, 2)], [current_hour_timestamp + i * 3600 for i in range(0, 48, 3)], usernames[0])
+    db.set_server_status(server_ids[0], SyntheticCollector(gpu_count, usernames).collect(), time.time())
+
+    client = app.test_client()
+    client.post('/user/login', data={'username': usernames[0], 'password': usernames[0]})
+    # warm up the caches first, like a server that has been up for a while
+    for _ in range(5):
+        client.get('/server/detail', query_string={'server_id': server_ids[0]})
+    start = time.perf_counter()
+    for _ in range(request_count):
+        response = client.get('/server/detail', query_string={'server_id': server_ids[0]})
+        if response.status_code != 200:
+            raise RuntimeError(f"/server/detail returned {response.status_code}")
+    return (time.perf_counter() - start) / request_count
+
+def redis_total_commands(redis_client):
+    # None when the server does not report it (e.g. a Redis-compatible server without INFO)
+    try:
+        return int(redis_client.info('stats')['total_commands_processed'])
+    except Exception:
+        return None
+
+def print_report(report, duration, total_redis_commands=None):
+    print(f"{'endpoint':<28}{'requests':>10}{'errors':>8}{'req/s':>9}{'p50 ms':>9}{'p99 ms':>9}{'redis cmd':>11}{'redis rtt':>11}")
+    for endpoint, stats in report.items():
+        redis_commands = '-' if stats['redis_commands'] is None else stats['redis_commands']
+        redis_roundtrips = '-' if stats['redis_roundtrips'] is None else stats['redis_roundtrips']
+        print(f"{endpoint:<28}{stats['requests']:>10}{stats['errors']:>8}{stats['throughput']:>9}{stats['p50_ms']:>9}{stats['p99_ms']:>9}{redis_commands:>11}{redis_roundtrips:>11}")
+    total_requests = sum(stats['requests'] for stats in report.values())
+    print(f"[Benchmark] -> {total_requests} request(s) in {duration:.1f}s, {total_requests / duration:.1f} req/s")
+    if total_redis_commands is not None and total_requests:
+        print(f"[Benchmark] -> {total_redis_commands} Redis command(s), {total_redis_commands / total_requests:.1f} per request")
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the Argus master with simulated telemetry nodes and booking users.')
+    parser.add_argument('--nodes', type=int, default=50, help='simulated telemetry nodes')
+    parser.add_argument('--gpus', type=int, default=8, help='GPUs per node')
+    parser.add_argument('--users', type=int, default=10, help='simulated booking users')
+    parser.add_argument('--duration', type=float, default=30, help='seconds to run')
+    parser.add_argument('--interval', type=float, default=5, help='heartbeat interval of each node in seconds')
+    parser.add_argument('--think-time', type=float, default=0.5, help='pause between two user actions in seconds')
+    parser.add_argument('--compression', default='gzip', choices=['none', 'gzip', 'zstd'])
+    parser.add_argument('--redis', action='store_true', help='run the in-process app on the local Redis instead of fakeredis')
+    parser.add_argument('--redis-db', type=int, default=15, help='Redis database of the bench data with --redis / --master-url')
+    parser.add_argument('--master-url', help='benchmark a running master instead of an in-process app')
+    parser.add_argument('--json', help='also write the report to this file, to compare runs')
+    parser.add_argument('--detail', action='store_true', help='only time /server/detail of one server with --gpus GPUs')
+    parser.add_argument('--requests', type=int, default=200, help='requests timed by --detail')
+    args = parser.parse_args()
+    if args.detail and args.master_url:
+        parser.error('--detail runs the in-process app, it cannot be combined with --master-url')
+
+    load_dotenv()
+    report_path = args.json and os.path.abspath(args.json)
+    os.environ.setdefault('FLASK_SECRET_KEY', 'benchmark')
+    os.environ.setdefault('REDIS_PASSWORD', '')
+    os.environ['REDIS_DB'] = str(args.redis_db)
+    # log files and client spools of the run stay out of the working directory
+    work_dir = tempfile.mkdtemp(prefix='argus_benchmark_')
+    os.chdir(work_dir)
+
+    server = None
+    counter = RedisCounter()
+    if args.master_url:
+        from database import DataBase
+        db = DataBase(redis_host='localhost', redis_port=6379, redis_password=os.environ["REDIS_PASSWORD"], redis_db=args.redis_db)
+        master_url = args.master_url.rstrip('/')
+    else:
+        if not args.redis:
+            import redis
+            import fakeredis
+            redis.Redis = fakeredis.FakeRedis
+        from werkzeug.serving import make_server
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+        from master import app
+        counter.install(app)
+        db = app.db
+        server = make_server('127.0.0.1', 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        master_url = f"http://127.0.0.1:{server.server_port}"
+
+    shared_redis = args.redis or args.master_url
+    started = time.time()
+    if shared_redis:
+        cleanup(db.redis_client)
+    try:
+        if args.detail:
+            app.logger.setLevel(logging.WARNING)
+            seconds = run_detail(app, db, args.gpus, args.requests)
+            print(f"[Benchmark] -> /server/detail, {args.gpus} GPU(s): {seconds * 1000:.2f} ms/request over {args.requests} request(s)")
+            if report_path:
+                with open(report_path, 'w') as report_file:
+                    json.dump({'arguments': vars(args), 'detail_ms': seconds * 1000}, report_file, indent=2)
+        else:
+            run_load(args, db, master_url, counter, work_dir, report_path)
+    finally:
+        if server:
+            server.shutdown()
+        if shared_redis:
+            cleanup(db.redis_client, started)
+
+def run_load(args, db, master_url, counter, work_dir, report_path):
+    from telemetry import Telemetry
+    server_ids, usernames = seed(db, args.nodes, args.gpus, args.users)
+    if args.master_url:
+        # the master has to read the database the bench data went to
+        login = requests.post(f"{master_url}/user/login", data={'username': usernames[0], 'password': usernames[0]}, allow_redirects=False)
+        if login.status_code == 401:
+            raise SystemExit(f"[Benchmark] -> {master_url} rejected the bench users, start it with REDIS_DB={args.redis_db}")
+    print(f"[Benchmark] -> {args.nodes} node(s) x {args.gpus} GPU(s) every {args.interval}s, {args.users} user(s), {args.duration}s against {master_url}")
+
+    recorder = Recorder()
+    deadline = time.time() + args.duration
+    threads = list()
+    for server_id in server_ids:
+        telemetry = Telemetry(server_id, server_id, master_url, args.interval, collector='smi', compression=args.compression,
+                              spool_path=os.path.join(work_dir, f'{server_id}_spool.jsonl'), schedule_path=os.path.join(work_dir, f'{server_id}_schedule.json'))
+        telemetry.collector = SyntheticCollector(args.gpus, usernames)
+        threads.append(threading.Thread(target=run_node, args=(telemetry, recorder, args.interval, deadline), daemon=True))
+    for username in usernames:
+        threads.append(threading.Thread(target=run_user, args=(master_url, username, username, server_ids, recorder, args.think_time, deadline), daemon=True))
+
+    redis_commands_before = redis_total_commands(db.redis_client) if args.master_url else None
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    # threads are daemons, so Ctrl-C ends the run and still goes through the cleanup
+    for thread in threads:
+        while thread.is_alive():
+            thread.join(0.5)
+    duration = time.time() - start
+
+    report = recorder.report(duration)
+    total_redis_commands = None
+    if redis_commands_before is not None:
+        total_redis_commands = redis_total_commands(db.redis_client) - redis_commands_before
+    print_report(report, duration, total_redis_commands)
+    if report_path:
+        with open(report_path, 'w') as report_file:
+            json.dump({'arguments': vars(args), 'duration': duration, 'endpoints': report, 'redis_commands': total_redis_commands}, report_file, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+# coding: utf-8
+
+# Small in-process LRU cache with a per-entry time to live, used to keep auth / ACL lookups off Redis.
+
+import time
+import threading
+from collections import OrderedDict
+
+class TTLCache:
+    def __init__(self, maxsize=4096, ttl=30):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, key, loader):
+        # cached value of `key`, calling loader() on a miss or once the entry expired
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] > now:
+                self.entries.move_to_end(key)
+                return entry[1]
+
+        value = loader()
+        with self.lock:
+            self.entries[key] = (now + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        return value
+
+    def invalidate(self, owner):
+        # drops every entry whose key starts with `owner`, e.g. ('USER', 'alice')
+        with self.lock:
+            for key in [key for key in self.entries if key[:len(owner)] == owner]:
+                self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
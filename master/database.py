@@ -1,30 +1,475 @@
 
 import os
+import hmac
+import time
 import json
 import redis
+import logging
+import threading
+from cache import TTLCache
+
+# Key layout (one Redis key per concern, so each request touches only what it needs):
+#   SERVERS                        set of every registered server id
+#   SERVER_{id}_PASSWORD           server credential
+#   SERVER_{id}_STATUS             hash {server_status: <json list>, timestamp: <float>, seq: <last applied snapshot>}
+#   SERVER_{id}_SUMMARY            compact json of the latest status, read for every server at once by the cluster overview
+#   SERVER_{id}_GPUS               set of gpu ids that can be booked
+#   SERVER_{id}_BOOK_{gpu_id}      sorted set of upcoming bookings, member '{hour_timestamp}:{username}' scored by hour
+#   SERVER_{id}_BOOK_ARCHIVE       append-only list of compacted past bookings (json lines)
+#   SERVER_{id}_BOOK_VERSION       counter bumped on every booking change, used to invalidate cached grids
+#   SERVER_{id}_ENFORCEMENT        hash of per-server kill policy overrides {field: json}, see enforcement.py
+#   SERVER_{id}_ENFORCEMENT_VERSION  counter bumped on every change of the hash above
+#   SERVER_{id}_KILLS_{hour}       hash {pid: first planned timestamp} of the kills audited this hour, shared by every worker
+#   USER_{name}                    user document (password, ...)
+#   USER_{name}_CREDIT             integer credit balance, kept apart so booking scripts can INCR/DECR it
+#   USER_{name}_SERVERS            set of server ids the user may access (SISMEMBER for ACL checks)
+#   AUTH_INVALIDATE                pub/sub channel announcing credential / ACL changes to every worker's auth cache ('*': all of them)
+#   LOCK_{name}                    short-lived lock letting one worker of the cluster run a periodic task
+
+# returns the username holding `timestamp` in the booking sorted set `key`, or nil
+BOOKER_LUA = """
+local function booker(key, timestamp)
+    local member = redis.call('ZRANGEBYSCORE', key, timestamp, timestamp, 'LIMIT', 0, 1)[1]
+    if not member then
+        return nil
+    end
+    return string.sub(member, #timestamp + 2)
+end
+"""
+
+# all-or-nothing booking of every (gpu, hour) pair: KEYS = [credit, version, booking set per gpu], ARGV = [username, timestamps...]
+BOOK_SCRIPT = BOOKER_LUA + """
+local username = ARGV[1]
+local results = {}
+local available = true
+for i = 3, #KEYS do
+    for j = 2, #ARGV do
+        if booker(KEYS[i], ARGV[j]) then
+            results[#results + 1] = 'booked'
+            available = false
+        else
+            results[#results + 1] = 'available'
+        end
+    end
+end
+local cost = (#KEYS - 2) * (#ARGV - 1)
+if available and (tonumber(redis.call('GET', KEYS[1])) or 0) < cost then
+    for k = 1, #results do
+        results[k] = 'insufficient_credit'
+    end
+    return results
+end
+if not available then
+    return results
+end
+redis.call('DECRBY', KEYS[1], cost)
+redis.call('INCR', KEYS[2])
+for i = 3, #KEYS do
+    for j = 2, #ARGV do
+        redis.call('ZADD', KEYS[i], ARGV[j], ARGV[j] .. ':' .. username)
+    end
+end
+for k = 1, #results do
+    results[k] = 'success'
+end
+return results
+"""
+
+# releases every pair booked by the user and refunds it, reporting the rest
+UNBOOK_SCRIPT = BOOKER_LUA + """
+local username = ARGV[1]
+local results = {}
+local refund = 0
+for i = 3, #KEYS do
+    for j = 2, #ARGV do
+        local holder = booker(KEYS[i], ARGV[j])
+        if not holder then
+            results[#results + 1] = 'not_booked'
+        elseif holder ~= username then
+            results[#results + 1] = 'not_owner'
+        else
+            redis.call('ZREM', KEYS[i], ARGV[j] .. ':' .. username)
+            refund = refund + 1
+            results[#results + 1] = 'success'
+        end
+    end
+end
+if refund > 0 then
+    redis.call('INCRBY', KEYS[1], refund)
+    redis.call('INCR', KEYS[2])
+end
+return results
+"""
+
+# releases the run of consecutive hours the user booked on one gpu from ARGV[2] on, refunding ARGV[3] percent of it:
+# KEYS = [credit, version, booking set], ARGV = [username, first hour, refund percent]; returns {released, refunded}
+RELEASE_SCRIPT = BOOKER_LUA + """
+local username = ARGV[1]
+local timestamp = tonumber(ARGV[2])
+local released = 0
+while booker(KEYS[3], string.format('%d', timestamp)) == username do
+    redis.call('ZREM', KEYS[3], string.format('%d', timestamp) .. ':' .. username)
+    released = released + 1
+    timestamp = timestamp + 3600
+end
+local refund = math.floor(released * tonumber(ARGV[3]) / 100)
+if refund > 0 then
+    redis.call('INCRBY', KEYS[1], refund)
+end
+if released > 0 then
+    redis.call('INCR', KEYS[2])
+end
+return {released, refund}
+"""
+
+# moves bookings scored below ARGV[1] from each booking set KEYS[i] (gpu ARGV[i]) to the archive list KEYS[1]
+COMPACT_SCRIPT = """
+local moved = 0
+for i = 2, #KEYS do
+    local gpu_id = ARGV[i]
+    local members = redis.call('ZRANGEBYSCORE', KEYS[i], '-inf', '(' .. ARGV[1])
+    for _, member in ipairs(members) do
+        local separator = string.find(member, ':', 1, true)
+        redis.call('RPUSH', KEYS[1], cjson.encode({
+            gpu_id = gpu_id,
+            timestamp = tonumber(string.sub(member, 1, separator - 1)),
+            username = string.sub(member, separator + 1),
+        }))
+    end
+    moved = moved + redis.call('ZREMRANGEBYSCORE', KEYS[i], '-inf', '(' .. ARGV[1])
+end
+return moved
+"""
 
 class DataBase:
     def __init__(self, redis_host, redis_port, redis_password, redis_db):
-        self.redis_client = redis.Redis(host=redis_host, port=redis_port, db=redis_db, password=redis_password)
+        self.redis_client = redis.Redis(host=redis_host, port=redis_port, db=redis_db, password=redis_password, decode_responses=True)
+        # undecoded replies, for DUMP / RESTORE of admin snapshots (connects on first use)
+        self.raw_redis_client = redis.Redis(host=redis_host, port=redis_port, db=redis_db, password=redis_password, decode_responses=False)
+        self.book_script = self.redis_client.register_script(BOOK_SCRIPT)
+        self.unbook_script = self.redis_client.register_script(UNBOOK_SCRIPT)
+        self.compact_script = self.redis_client.register_script(COMPACT_SCRIPT)
+        self.release_script = self.redis_client.register_script(RELEASE_SCRIPT)
+
+        # credentials and ACL lookups are served from this cache; writes through DataBase publish on
+        # AUTH_INVALIDATE so every worker drops its copy, and the TTL bounds staleness of edits made elsewhere
+        self.auth_cache = TTLCache(maxsize=4096, ttl=30)
+        self.auth_listener = None
+        self.auth_listener_lock = threading.Lock()
 
     def get_user_info(self, username):
-        raw_data = self.redis_client.get(f'USER_{username}')
-        return json.loads(raw_data) if raw_data else None
-    
+        raw_data, credit, server_list = self.pipeline_results(lambda pipe: (
+            pipe.get(f'USER_{username}'),
+            pipe.get(f'USER_{username}_CREDIT'),
+            pipe.smembers(f'USER_{username}_SERVERS'),
+        ))
+        if not raw_data:
+            return None
+        user_info = json.loads(raw_data)
+        user_info['credit'] = int(credit) if credit is not None else user_info.get('credit', 0)
+        user_info['server_list'] = sorted(server_list) if server_list else user_info.get('server_list', [])
+        return user_info
+
     def set_user_info(self, username, user_info):
-        return self.redis_client.set(f'USER_{username}', json.dumps(user_info))
-    
+        user_info = dict(user_info)
+        pipe = self.redis_client.pipeline()
+        if 'credit' in user_info:
+            pipe.set(f'USER_{username}_CREDIT', int(user_info.pop('credit')))
+        if 'server_list' in user_info:
+            server_list = user_info.pop('server_list')
+            pipe.delete(f'USER_{username}_SERVERS')
+            if server_list:
+                pipe.sadd(f'USER_{username}_SERVERS', *server_list)
+        pipe.set(f'USER_{username}', json.dumps(user_info))
+        pipe.publish('AUTH_INVALIDATE', f'USER:{username}')
+        result = pipe.execute()[-2]
+        self.auth_cache.invalidate(('USER', username))
+        return result
+
+    def pipeline_results(self, queue_commands):
+        pipe = self.redis_client.pipeline(transaction=False)
+        queue_commands(pipe)
+        return pipe.execute()
+
+    def get_user_credit(self, username):
+        return int(self.redis_client.get(f'USER_{username}_CREDIT') or 0)
+
+    def get_user_servers(self, username):
+        self.start_auth_listener()
+        return self.auth_cache.get(('USER', username, 'servers'), lambda: sorted(self.redis_client.smembers(f'USER_{username}_SERVERS')))
+
+    def user_has_server(self, username, server_id):
+        self.start_auth_listener()
+        return self.auth_cache.get(('USER', username, 'server', server_id), lambda: bool(self.redis_client.sismember(f'USER_{username}_SERVERS', server_id)))
+
     def user_auth(self, username, password):
-        user_info = self.get_user_info(username)
-        return user_info and user_info['password'] == password
-    
+        self.start_auth_listener()
+        def load_password():
+            raw_data = self.redis_client.get(f'USER_{username}')
+            return json.loads(raw_data).get('password') if raw_data else None
+        user_password = self.auth_cache.get(('USER', username, 'password'), load_password)
+        # compared as bytes, compare_digest rejects non-ASCII str
+        return user_password is not None and hmac.compare_digest(str(user_password).encode(), str(password).encode())
+
     def server_auth(self, server_id, password):
-        server_info = self.get_server_info(server_id)
-        return server_info and server_info['password'] == password
-    
-    def set_server_info(self, server_id, server_info):
-        return self.redis_client.set(f'SERVER_{server_id}', json.dumps(server_info))
-    
-    def get_server_info(self, server_id):
-        raw_data = self.redis_client.get(f'SERVER_{server_id}')
-        return json.loads(raw_data) if raw_data else {}
\ No newline at end of file
+        self.start_auth_listener()
+        server_password = self.auth_cache.get(('SERVER', server_id, 'password'), lambda: self.redis_client.get(f'SERVER_{server_id}_PASSWORD'))
+        return server_password is not None and hmac.compare_digest(server_password.encode(), str(password).encode())
+
+    def set_server_password(self, server_id, password):
+        pipe = self.redis_client.pipeline()
+        pipe.set(f'SERVER_{server_id}_PASSWORD', password)
+        pipe.publish('AUTH_INVALIDATE', f'SERVER:{server_id}')
+        result = pipe.execute()[0]
+        self.auth_cache.invalidate(('SERVER', server_id))
+        return result
+
+    def start_auth_listener(self):
+        # one background subscription per process that drops invalidated auth cache entries
+        if self.auth_listener is not None and self.auth_listener.is_alive():
+            return
+        with self.auth_listener_lock:
+            if self.auth_listener is None or not self.auth_listener.is_alive():
+                self.auth_listener = threading.Thread(target=self.auth_listener_loop, daemon=True)
+                self.auth_listener.start()
+
+    def auth_listener_loop(self):
+        while True:
+            try:
+                pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe('AUTH_INVALIDATE')
+                # anything may have changed while we were not subscribed
+                self.auth_cache.clear()
+                for message in pubsub.listen():
+                    # '*' after bulk rewrites of the dataset (see admin.py)
+                    if message['data'] == '*':
+                        self.auth_cache.clear()
+                        continue
+                    kind, _, owner = message['data'].partition(':')
+                    self.auth_cache.invalidate((kind, owner))
+            except Exception as e:
+                logging.getLogger(__name__).error(f"[Auth Cache] -> Invalidation subscription lost: {e}")
+                self.auth_cache.clear()
+                time.sleep(1)
+
+    def create_server(self, server_id, password, gpu_ids):
+        pipe = self.redis_client.pipeline()
+        pipe.sadd('SERVERS', server_id)
+        pipe.set(f'SERVER_{server_id}_PASSWORD', password)
+        if gpu_ids:
+            pipe.sadd(f'SERVER_{server_id}_GPUS', *[str(gpu_id) for gpu_id in gpu_ids])
+        pipe.publish('AUTH_INVALIDATE', f'SERVER:{server_id}')
+        result = pipe.execute()
+        self.auth_cache.invalidate(('SERVER', server_id))
+        return result
+
+    def get_servers(self):
+        return sorted(self.redis_client.smembers('SERVERS'))
+
+    def server_exists(self, server_id):
+        return bool(self.redis_client.sismember('SERVERS', server_id))
+
+    def get_server_gpus(self, server_id):
+        return sorted(self.redis_client.smembers(f'SERVER_{server_id}_GPUS'), key=int)
+
+    def set_server_status(self, server_id, server_status, timestamp, seq=None):
+        # server_status=None only refreshes the timestamp / seq of an unchanged snapshot
+        mapping = {'timestamp': timestamp, 'seq': '' if seq is None else seq}
+        if server_status is not None:
+            mapping['server_status'] = json.dumps(server_status)
+        return self.redis_client.hset(f'SERVER_{server_id}_STATUS', mapping=mapping)
+
+    def get_server_status_state(self, server_id):
+        # (server_status, seq) as needed to apply a delta upload
+        raw_data, seq = self.redis_client.hmget(f'SERVER_{server_id}_STATUS', ['server_status', 'seq'])
+        return (json.loads(raw_data) if raw_data else []), (int(seq) if seq else None)
+
+    def get_server_status(self, server_id):
+        raw_data = self.redis_client.hget(f'SERVER_{server_id}_STATUS', 'server_status')
+        return json.loads(raw_data) if raw_data else []
+
+    def set_server_summary(self, server_id, summary):
+        return self.redis_client.set(f'SERVER_{server_id}_SUMMARY', json.dumps(summary))
+
+    def get_server_summaries(self, server_ids):
+        # {server_id: summary or None} with a single MGET
+        if not server_ids:
+            return dict()
+        raw_data = self.redis_client.mget([f'SERVER_{server_id}_SUMMARY' for server_id in server_ids])
+        return {server_id: json.loads(summary) if summary else None for server_id, summary in zip(server_ids, raw_data)}
+
+    def get_current_bookers(self, gpus_by_server, timestamp):
+        # {server_id: {gpu_id: username}} for one hour across many servers in one round trip
+        pipe = self.redis_client.pipeline(transaction=False)
+        slots = [(server_id, str(gpu_id)) for server_id, gpu_ids in gpus_by_server.items() for gpu_id in gpu_ids]
+        for server_id, gpu_id in slots:
+            pipe.zrangebyscore(f'SERVER_{server_id}_BOOK_{gpu_id}', int(timestamp), int(timestamp), start=0, num=1)
+
+        bookers = {server_id: dict() for server_id in gpus_by_server}
+        for (server_id, gpu_id), members in zip(slots, pipe.execute() if slots else []):
+            if members:
+                bookers[server_id][gpu_id] = members[0].split(':', 1)[1]
+        return bookers
+
+    def get_book_event(self, server_id, gpu_id, timestamp):
+        return self.get_book_range(server_id, [gpu_id], timestamp, timestamp)[str(gpu_id)].get(str(int(timestamp)))
+
+    def get_book_range(self, server_id, gpu_ids, start_timestamp, end_timestamp):
+        # bookings in [start, end] for each gpu in one round trip: {gpu_id: {timestamp: {'username': ...}}}
+        pipe = self.redis_client.pipeline(transaction=False)
+        for gpu_id in gpu_ids:
+            pipe.zrangebyscore(f'SERVER_{server_id}_BOOK_{gpu_id}', int(start_timestamp), int(end_timestamp))
+
+        book_events = dict()
+        for gpu_id, members in zip(gpu_ids, pipe.execute()):
+            book_events[str(gpu_id)] = dict()
+            for member in members:
+                timestamp, username = member.split(':', 1)
+                book_events[str(gpu_id)][timestamp] = {'username': username}
+        return book_events
+
+    def get_book_version(self, server_id):
+        return int(self.redis_client.get(f'SERVER_{server_id}_BOOK_VERSION') or 0)
+
+    def get_enforcement_versions(self, server_id):
+        # (booking version, enforcement settings version) in one round trip
+        book_version, enforcement_version = self.redis_client.mget([f'SERVER_{server_id}_BOOK_VERSION', f'SERVER_{server_id}_ENFORCEMENT_VERSION'])
+        return int(book_version or 0), int(enforcement_version or 0)
+
+    def get_enforcement_settings(self, server_id):
+        return {field: json.loads(value) for field, value in self.redis_client.hgetall(f'SERVER_{server_id}_ENFORCEMENT').items()}
+
+    def set_enforcement_settings(self, server_id, settings):
+        # a None value removes the override so the default applies again
+        pipe = self.redis_client.pipeline()
+        for field, value in settings.items():
+            if value is None:
+                pipe.hdel(f'SERVER_{server_id}_ENFORCEMENT', field)
+            else:
+                pipe.hset(f'SERVER_{server_id}_ENFORCEMENT', field, json.dumps(value))
+        pipe.incr(f'SERVER_{server_id}_ENFORCEMENT_VERSION')
+        return pipe.execute()[-1]
+
+    def mark_kills_reported(self, server_id, hour_timestamp, pids):
+        # [True for each pid no worker had reported yet this hour, False otherwise]
+        if not pids:
+            return []
+        pipe = self.redis_client.pipeline(transaction=False)
+        for pid in pids:
+            pipe.hsetnx(f'SERVER_{server_id}_KILLS_{hour_timestamp}', pid, time.time())
+        pipe.expire(f'SERVER_{server_id}_KILLS_{hour_timestamp}', 7200)
+        return [bool(first) for first in pipe.execute()[:-1]]
+
+    def book_slot(self, server_id, gpu_id, timestamp, username):
+        # returns 'success', 'booked' or 'insufficient_credit'
+        return self.book_slots(server_id, [gpu_id], [timestamp], username)[0]['status']
+
+    def unbook_slot(self, server_id, gpu_id, timestamp, username):
+        # returns 'success', 'not_booked' or 'not_owner'
+        return self.unbook_slots(server_id, [gpu_id], [timestamp], username)[0]['status']
+
+    def book_slots(self, server_id, gpu_ids, timestamps, username):
+        # books every (gpu, hour) pair or none of them; returns [{'gpu_id', 'timestamp', 'status'}, ...]
+        keys = [f'USER_{username}_CREDIT', f'SERVER_{server_id}_BOOK_VERSION'] + [f'SERVER_{server_id}_BOOK_{gpu_id}' for gpu_id in gpu_ids]
+        statuses = self.book_script(keys=keys, args=[username] + [str(int(timestamp)) for timestamp in timestamps])
+        return self._reset_idle_clocks(server_id, self._slot_results(gpu_ids, timestamps, statuses))
+
+    def unbook_slots(self, server_id, gpu_ids, timestamps, username):
+        # releases the (gpu, hour) pairs booked by the user; returns [{'gpu_id', 'timestamp', 'status'}, ...]
+        keys = [f'USER_{username}_CREDIT', f'SERVER_{server_id}_BOOK_VERSION'] + [f'SERVER_{server_id}_BOOK_{gpu_id}' for gpu_id in gpu_ids]
+        statuses = self.unbook_script(keys=keys, args=[username] + [str(int(timestamp)) for timestamp in timestamps])
+        return self._reset_idle_clocks(server_id, self._slot_results(gpu_ids, timestamps, statuses))
+
+    def _slot_results(self, gpu_ids, timestamps, statuses):
+        slots = [(str(gpu_id), int(timestamp)) for gpu_id in gpu_ids for timestamp in timestamps]
+        return [{'gpu_id': gpu_id, 'timestamp': timestamp, 'status': status} for (gpu_id, timestamp), status in zip(slots, statuses)]
+
+    def _reset_idle_clocks(self, server_id, slots):
+        # a booking change of the current hour restarts the idle clocks of its GPUs (see reclaim.py); returns `slots`
+        current_hour_timestamp = int(time.time()) - int(time.time()) % 3600
+        gpu_ids = {slot['gpu_id'] for slot in slots if slot['status'] == 'success' and slot['timestamp'] == current_hour_timestamp}
+        if gpu_ids:
+            self.redis_client.hdel(f'SERVER_{server_id}_IDLE', *gpu_ids)
+        return slots
+
+    def release_bookings(self, server_id, gpu_id, username, timestamp, refund_percent):
+        # (released, refunded): frees the user's booking of `gpu_id` at `timestamp` and the consecutive hours after it
+        released, refunded = self.release_script(
+            keys=[f'USER_{username}_CREDIT', f'SERVER_{server_id}_BOOK_VERSION', f'SERVER_{server_id}_BOOK_{gpu_id}'],
+            args=[username, int(timestamp), int(refund_percent)],
+        )
+        return int(released), int(refunded)
+
+    def compact_bookings(self, server_id, before_timestamp):
+        # moves bookings older than `before_timestamp` into SERVER_{id}_BOOK_ARCHIVE; returns the number moved
+        gpu_ids = self.get_server_gpus(server_id)
+        keys = [f'SERVER_{server_id}_BOOK_ARCHIVE'] + [f'SERVER_{server_id}_BOOK_{gpu_id}' for gpu_id in gpu_ids]
+        return self.compact_script(keys=keys, args=[int(before_timestamp)] + gpu_ids)
+
+    def acquire_lock(self, name, ttl):
+        # True for the one caller that takes LOCK_{name}; it is released by expiry after `ttl` seconds
+        return bool(self.redis_client.set(f'LOCK_{name}', os.getpid(), nx=True, ex=int(ttl)))
+
+    def get_book_archive(self, server_id, start=0, end=-1):
+        return [json.loads(raw_data) for raw_data in self.redis_client.lrange(f'SERVER_{server_id}_BOOK_ARCHIVE', start, end)]
+
+    def migrate_legacy_users(self):
+        # one-shot move of the credit / server_list fields out of USER_{name} into USER_{name}_CREDIT / USER_{name}_SERVERS
+        migrated = list()
+        for key in self.redis_client.scan_iter(match='USER_*', _type='string'):
+            try:
+                user_info = json.loads(self.redis_client.get(key))
+            except (TypeError, ValueError):
+                continue
+            if not isinstance(user_info, dict) or ('credit' not in user_info and 'server_list' not in user_info):
+                continue
+
+            username = key[len('USER_'):]
+            self.set_user_info(username, user_info)
+            migrated.append(username)
+        return migrated
+
+    def migrate_legacy_servers(self):
+        # one-shot conversion of the old whole-document SERVER_{id} JSON blobs into the split layout
+        migrated = list()
+        for key in self.redis_client.scan_iter(match='SERVER_*', _type='string'):
+            try:
+                server_info = json.loads(self.redis_client.get(key))
+            except (TypeError, ValueError):
+                continue
+            if not isinstance(server_info, dict) or 'password' not in server_info:
+                continue
+
+            server_id = key[len('SERVER_'):]
+            book_event = server_info.get('book_event', {})
+            pipe = self.redis_client.pipeline()
+            pipe.sadd('SERVERS', server_id)
+            pipe.set(f'SERVER_{server_id}_PASSWORD', server_info['password'])
+            if book_event:
+                pipe.sadd(f'SERVER_{server_id}_GPUS', *[str(gpu_id) for gpu_id in book_event])
+            for gpu_id, events in book_event.items():
+                if events:
+                    pipe.zadd(f'SERVER_{server_id}_BOOK_{gpu_id}', {f"{timestamp}:{event['username']}": int(timestamp) for timestamp, event in events.items()})
+            if 'server_status' in server_info:
+                pipe.hset(f'SERVER_{server_id}_STATUS', mapping={
+                    'server_status': json.dumps(server_info['server_status']),
+                    'timestamp': server_info.get('timestamp', 0),
+                })
+            pipe.delete(key)
+            pipe.execute()
+            migrated.append(server_id)
+        return migrated
+
+    def migrate_book_hashes(self):
+        # one-shot conversion of SERVER_{id}_BOOK_{gpu_id} hashes {hour_timestamp: username} into booking sorted sets
+        migrated = list()
+        for key in self.redis_client.scan_iter(match='SERVER_*_BOOK_*', _type='hash'):
+            book_event = self.redis_client.hgetall(key)
+            pipe = self.redis_client.pipeline()
+            pipe.delete(key)
+            pipe.incr(key[:key.rindex('_BOOK_')] + '_BOOK_VERSION')
+            if book_event:
+                pipe.zadd(key, {f'{timestamp}:{username}': int(timestamp) for timestamp, username in book_event.items()})
+            pipe.execute()
+            migrated.append(key)
+        return migrated
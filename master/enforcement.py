@@ -0,0 +1,162 @@
+# coding: utf-8
+
+# Kill decisions for /server/kill and /server/heartbeat.
+#
+# A compact policy is compiled per server for the current hour: the booker of each GPU plus the
+# settings below (defaults overridden per server in SERVER_{id}_ENFORCEMENT). It is cached per
+# (hour, booking version, settings version), so it is rebuilt when the hour rolls over or a booking /
+# setting changes in any worker, and a poll costs one MGET of the two versions plus a walk over the
+# processes of the booked GPUs.
+#
+#   allow_users       users whose processes are never killed
+#   allow_processes   process names (basename) never killed, e.g. Xorg
+#   grace_seconds     no kill before this many seconds into the booked hour, so the previous user can checkpoint
+#   min_memory_mib    processes using less GPU memory than this are left alone
+#   dry_run           plan and audit, but never return pids to the client
+#
+# and for reclaiming idle booked GPUs (see reclaim.py):
+#
+#   idle_release_minutes      release a booked GPU idle for this long, 0 to never release
+#   idle_utilization_percent  a GPU at or below this utilization counts as idle ...
+#   idle_memory_mib           ... unless a process of the booker holds more GPU memory than this
+#   idle_refund_percent       share of the released hours refunded to the booker
+
+import os
+import time
+import threading
+
+SETTINGS = ['allow_users', 'allow_processes', 'grace_seconds', 'min_memory_mib', 'dry_run',
+            'idle_release_minutes', 'idle_utilization_percent', 'idle_memory_mib', 'idle_refund_percent']
+
+DEFAULT_SETTINGS = {
+    'allow_users': [],
+    'allow_processes': ['Xorg', 'X', 'gnome-shell', 'nvidia-persistenced', 'nvidia-smi'],
+    'grace_seconds': 0,
+    'min_memory_mib': 0,
+    'dry_run': False,
+    'idle_release_minutes': 30,
+    'idle_utilization_percent': 5,
+    'idle_memory_mib': 1024,
+    'idle_refund_percent': 50,
+}
+
+# (min, max) of the integer settings, None for no upper bound
+SETTING_RANGES = {
+    'grace_seconds': (0, 3600),
+    'min_memory_mib': (0, None),
+    'idle_release_minutes': (0, 1440),
+    'idle_utilization_percent': (0, 100),
+    'idle_memory_mib': (0, None),
+    'idle_refund_percent': (0, 100),
+}
+
+def validate_settings(settings):
+    # [message, ...] for the overrides that cannot be applied, empty when all of them can; None removes an override
+    errors = list()
+    for field, value in settings.items():
+        if field not in SETTINGS:
+            errors.append(f'unknown setting: {field}')
+        elif value is None:
+            continue
+        elif field in ('allow_users', 'allow_processes'):
+            if not isinstance(value, list) or not all(isinstance(name, str) and name for name in value):
+                errors.append(f'{field} must be a list of names')
+        elif field == 'dry_run':
+            if not isinstance(value, bool):
+                errors.append('dry_run must be true or false')
+        else:
+            low, high = SETTING_RANGES[field]
+            if isinstance(value, bool) or not isinstance(value, int) or value < low or (high is not None and value > high):
+                errors.append(f'{field} must be an integer ' + (f'between {low} and {high}' if high is not None else f'of at least {low}'))
+    return errors
+
+class EnforcementEngine:
+    def __init__(self, db, defaults=None):
+        self.db = db
+        self.defaults = dict(DEFAULT_SETTINGS, **(defaults or {}))
+        self.lock = threading.Lock()
+        self.policies = dict()
+
+    def get_settings(self, server_id):
+        # an override stored before validation existed and unusable now falls back to the default
+        overrides = self.db.get_enforcement_settings(server_id)
+        return dict(self.defaults, **{field: value for field, value in overrides.items() if not validate_settings({field: value})})
+
+    def compile(self, server_id, current_hour_timestamp, gpu_ids, versions):
+        settings = self.get_settings(server_id)
+        bookers = self.db.get_current_bookers({server_id: gpu_ids}, current_hour_timestamp)[server_id]
+        return {
+            'hour': current_hour_timestamp,
+            'gpu_ids': gpu_ids,
+            'version': '.'.join(map(str, versions)),
+            'bookers': bookers,
+            'allow_users': frozenset(settings['allow_users']),
+            'allow_processes': frozenset(settings['allow_processes']),
+            'kill_after': current_hour_timestamp + int(settings['grace_seconds']),
+            'min_memory_mib': settings['min_memory_mib'],
+            'dry_run': bool(settings['dry_run']),
+            'idle_release_minutes': settings['idle_release_minutes'],
+            'idle_utilization_percent': settings['idle_utilization_percent'],
+            'idle_memory_mib': settings['idle_memory_mib'],
+            'idle_refund_percent': settings['idle_refund_percent'],
+        }
+
+    def get_policy(self, server_id, gpu_ids=(), now=None):
+        # gpu_ids: GPUs reported by the node, covered on top of the bookable ones
+        now = time.time() if now is None else now
+        current_hour_timestamp = int(now) - int(now) % 3600
+        versions = self.db.get_enforcement_versions(server_id)
+
+        cached = self.policies.get(server_id)
+        if cached and cached[0] == (current_hour_timestamp, versions) and set(gpu_ids) <= set(cached[1]['gpu_ids']):
+            return cached[1]
+
+        policy = self.compile(server_id, current_hour_timestamp, sorted(set(self.db.get_server_gpus(server_id)) | set(gpu_ids), key=int), versions)
+        with self.lock:
+            self.policies[server_id] = ((current_hour_timestamp, versions), policy)
+        return policy
+
+    def plan(self, server_id, server_status, now=None):
+        # (kills, policy): [{pid, gpu_id, user, booker, process_name}, ...] of the processes breaking the policy right now
+        now = time.time() if now is None else now
+        policy = self.get_policy(server_id, [str(gpu['gpu_id']) for gpu in server_status], now)
+        if not policy['bookers'] or now < policy['kill_after']:
+            return [], policy
+
+        kills = list()
+        for gpu in server_status:
+            booker = policy['bookers'].get(str(gpu['gpu_id']))
+            if not booker:
+                continue
+            for process in gpu.get('processes', []):
+                # a container's owner stands in for its (usually root) username
+                user = process.get('owner') or process['user']
+                if user == booker or user in policy['allow_users']:
+                    continue
+                if os.path.basename(process.get('process_name') or '') in policy['allow_processes']:
+                    continue
+                if (process.get('used_gpu_memory_mib') or 0) < policy['min_memory_mib']:
+                    continue
+                kills.append({'pid': process['pid'], 'gpu_id': str(gpu['gpu_id']), 'user': user, 'booker': booker, 'process_name': process.get('process_name'), 'container': process.get('container')})
+        return kills, policy
+
+    def get_schedule(self, server_id, start_timestamp, hours):
+        # what a node needs to enforce on its own: {version, start, end, schedule: {hour: {gpu_id: booker}}, settings}
+        book_version, enforcement_version = self.db.get_enforcement_versions(server_id)
+        end_timestamp = start_timestamp + hours * 3600
+        schedule = dict()
+        for gpu_id, book_events in self.db.get_book_range(server_id, self.db.get_server_gpus(server_id), start_timestamp, end_timestamp - 3600).items():
+            for timestamp, book_event in book_events.items():
+                schedule.setdefault(timestamp, dict())[gpu_id] = book_event['username']
+        return {
+            'version': f'{book_version}.{enforcement_version}',
+            'start': start_timestamp,
+            'end': end_timestamp,
+            'schedule': schedule,
+            'settings': self.get_settings(server_id),
+        }
+
+    def unreported(self, server_id, kills, policy):
+        # the kills no worker has reported yet this hour, so a process is audited once rather than on every poll
+        first_reports = self.db.mark_kills_reported(server_id, policy['hour'], [kill['pid'] for kill in kills])
+        return [kill for kill, first in zip(kills, first_reports) if first]
@@ -0,0 +1,149 @@
+# coding: utf-8
+
+# Structured, non-blocking logging for the master.
+#
+# Request threads only put records on an in-memory queue (QueueHandler); a single listener thread
+# formats them as JSON lines and writes them to size-rotated files, so disk latency never lands on a
+# request. Structured fields are passed as `extra={'event': {...}}` and merged into the JSON line.
+# Every gunicorn worker appends to the same files: each line is one O_APPEND write, rotation runs under
+# an flock, and the other workers reopen the file once it has been renamed.
+#
+# Audit events (book / unbook / kill / login / logout) go to their own logger and are also appended,
+# from the listener thread, to capped Redis streams so they can be queried by user or by server:
+#
+#   AUDIT                  every audit event
+#   AUDIT_USER_{name}      audit events of one user
+#   AUDIT_SERVER_{id}      audit events touching one server
+
+import os
+import json
+import fcntl
+import queue
+import atexit
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener, WatchedFileHandler
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update(getattr(record, 'event', None) or {})
+        return json.dumps(entry, separators=(',', ':'), default=str)
+
+class RedisAuditHandler(logging.Handler):
+    def __init__(self, redis_client, maxlen=100000):
+        super().__init__()
+        self.redis_client = redis_client
+        self.maxlen = maxlen
+
+    def emit(self, record):
+        event = getattr(record, 'event', None)
+        if not event:
+            return
+        try:
+            fields = {key: json.dumps(value) if isinstance(value, (list, dict)) else str(value) for key, value in event.items() if value is not None}
+            fields['time'] = str(round(record.created, 3))
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.xadd('AUDIT', fields, maxlen=self.maxlen, approximate=True)
+            if event.get('username'):
+                pipe.xadd(f"AUDIT_USER_{event['username']}", fields, maxlen=self.maxlen // 10, approximate=True)
+            if event.get('server_id'):
+                pipe.xadd(f"AUDIT_SERVER_{event['server_id']}", fields, maxlen=self.maxlen // 10, approximate=True)
+            pipe.execute()
+        except Exception:
+            self.handleError(record)
+
+def setup_queue_logging(logger, handlers, level=logging.INFO):
+    # routes `logger` through a queue drained by one background thread writing to `handlers`
+    log_queue = queue.Queue(-1)
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.setLevel(level)
+    logger.setLevel(level)
+    logger.handlers = [queue_handler]
+    logger.propagate = False
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+class SharedRotatingFileHandler(WatchedFileHandler):
+    # size-based rotation that is safe with several processes appending to the same file
+    def __init__(self, path, max_bytes, backup_count):
+        super().__init__(path)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.lock_path = f'{self.baseFilename}.lock'
+
+    def emit(self, record):
+        try:
+            if self.max_bytes and os.stat(self.baseFilename).st_size >= self.max_bytes:
+                self.rotate()
+        except OSError:
+            pass
+        # reopens the file first when another process rotated it
+        super().emit(record)
+
+    def rotate(self):
+        with open(self.lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                # another process may have rotated it while we waited for the lock
+                if not os.path.exists(self.baseFilename) or os.stat(self.baseFilename).st_size < self.max_bytes:
+                    return
+                if not self.backup_count:
+                    os.remove(self.baseFilename)
+                    return
+                for i in range(self.backup_count - 1, 0, -1):
+                    if os.path.exists(f'{self.baseFilename}.{i}'):
+                        os.replace(f'{self.baseFilename}.{i}', f'{self.baseFilename}.{i + 1}')
+                os.replace(self.baseFilename, f'{self.baseFilename}.1')
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def rotating_json_handler(path, max_bytes=100 * 1024 * 1024, backup_count=10):
+    handler = SharedRotatingFileHandler(path, max_bytes, backup_count)
+    handler.setFormatter(JsonFormatter())
+    return handler
+
+class Sampler:
+    # lets one in `every` events per key through, starting with the first
+    def __init__(self, every):
+        self.every = max(1, int(every))
+        self.lock = threading.Lock()
+        self.counts = dict()
+
+    def __call__(self, key):
+        with self.lock:
+            count = self.counts.get(key, 0)
+            self.counts[key] = count + 1
+        return count % self.every == 0
+
+class AuditLog:
+    def __init__(self, redis_client, path='audit.log', maxlen=100000):
+        self.redis_client = redis_client
+        self.logger = logging.getLogger('argus.audit')
+        self.listener = setup_queue_logging(self.logger, [rotating_json_handler(path), RedisAuditHandler(redis_client, maxlen)])
+
+    def record(self, action, username=None, server_id=None, **fields):
+        event = dict(action=action, username=username, server_id=server_id, **fields)
+        self.logger.info(f"[Audit] -> {action} {username} {server_id}", extra={'event': event})
+
+    def query(self, username=None, server_id=None, count=100, before=None):
+        # newest first, optionally only events older than the stream id `before` (for paging)
+        key = f'AUDIT_USER_{username}' if username else (f'AUDIT_SERVER_{server_id}' if server_id else 'AUDIT')
+        events = list()
+        for event_id, fields in self.redis_client.xrevrange(key, max=f'({before}' if before else '+', count=count):
+            event = {'id': event_id}
+            for name, value in fields.items():
+                event[name] = json.loads(value) if value[:1] in ('[', '{') else value
+            event['time'] = float(event['time'])
+            # a user stream also holds events on servers other than the one asked for, and vice versa
+            if username and server_id and event.get('server_id') != server_id:
+                continue
+            events.append(event)
+        return events
@@ -0,0 +1,61 @@
+# coding: utf-8
+
+# gunicorn settings of the master: gunicorn -c gunicorn.conf.py master:app (see master_start.sh)
+#
+# Several workers serve heartbeats, pages and SSE streams concurrently. With gevent installed each worker
+# is cooperative and holds up to `worker_connections` open requests (long-lived /server/stream clients
+# included); without it each worker runs `threads` request threads, and since an open stream holds one of
+# them, a worker keeps at most a quarter of its threads for streams (ARGUS_MAX_STREAMS, set in post_fork) so
+# heartbeats are never starved. master_start.sh installs gevent. Workers share nothing but Redis:
+# auth caches are invalidated over pub/sub, grids and the overview are versioned / refreshed from Redis,
+# periodic tasks take a Redis lock, and the log files are appended to by every worker.
+#
+# `kill -HUP` (master_reload.sh) reloads the code gracefully: new workers start on the same listening
+# socket and old ones finish their in-flight requests, so no heartbeat is refused during a deploy.
+#
+# Sizing target, verified by load test: 300 nodes heartbeating every 5s (60 heartbeats/s) plus 10 users,
+# with p99 below 250 ms on /server/heartbeat, on a single vCPU shared by 3 gevent workers, Redis 6.2 and the
+# load generator. Re-check a deployment (and any larger target) with
+#   python benchmark.py --master-url http://localhost:8000 --nodes 300 --interval 5 --users 10 --duration 60
+#
+#   nodes/5s   heartbeat p50 / p99   /server/detail p99   total       errors
+#   100        7.5 / 74 ms           103 ms               50 req/s    0
+#   150        9.1 / 70 ms           107 ms               62 req/s    0
+#   200        9.2 / 83 ms           128 ms               74 req/s    0
+#   250        12 / 153 ms           165 ms               85 req/s    0
+#   300        12 / 179 ms           160 ms               95 req/s    0
+#   400        17 / 662 ms           431 ms               116 req/s   0   (target missed: CPU saturated)
+#
+# A heartbeat costs ~65-75 Redis commands and the CPU is the limit, so more nodes need more cores for the
+# workers and Redis, measured again before being relied on.
+
+import os
+import multiprocessing
+
+try:
+    import gevent
+except ImportError:
+    gevent = None
+
+bind = os.environ.get('ARGUS_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('ARGUS_WORKERS', min(2 * multiprocessing.cpu_count() + 1, 9)))
+worker_class = 'gevent' if gevent else 'gthread'
+worker_connections = 1000
+threads = int(os.environ.get('ARGUS_THREADS', 32))
+
+# telemetry clients keep their session open between heartbeats
+keepalive = 75
+timeout = 60
+graceful_timeout = 30
+
+pidfile = 'gunicorn.pid'
+accesslog = None
+errorlog = 'gunicorn.log'
+loglevel = 'info'
+
+def post_fork(server, worker):
+    # the stream limit follows the worker class and size actually in effect (`-k` / `--threads` included)
+    if server.cfg.worker_class_str == 'gthread':
+        os.environ.setdefault('ARGUS_MAX_STREAMS', str(max(1, server.cfg.threads // 4)))
+    else:
+        os.environ.setdefault('ARGUS_MAX_STREAMS', str(server.cfg.worker_connections // 2))
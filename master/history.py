@@ -0,0 +1,116 @@
+# coding: utf-8
+
+# Per-GPU utilization / memory / temperature history.
+#
+#   HISTORY_{id}_{gpu_id}_RAW           sorted set of raw samples 'timestamp,util,mem,temp' scored by timestamp
+#   HISTORY_{id}_{gpu_id}_{step}        hash {bucket_timestamp: aggregate json} rolled up at ingest time
+#   HISTORY_{id}_{gpu_id}_{step}_INDEX  sorted set of the buckets in the hash above, used for range reads and retention
+#
+# An aggregate is {metric: [count, sum, min, max]}, so a week-long query reads ~168 hourly buckets
+# instead of every raw sample.
+
+import json
+
+METRICS = ['utilization_percent', 'memory_usage_mib', 'temperature_celsius']
+
+# (step seconds, retention seconds); step 0 is the raw sample set
+RETENTION = [
+    (0, 24 * 3600),
+    (60, 14 * 24 * 3600),
+    (3600, 365 * 24 * 3600),
+]
+
+# KEYS = [raw, (hash, index) per rollup], ARGV = [timestamp, metric values..., raw retention, (step, retention) per rollup]
+RECORD_SCRIPT = """
+local timestamp = tonumber(ARGV[1])
+local metrics = {'utilization_percent', 'memory_usage_mib', 'temperature_celsius'}
+local values = {tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])}
+
+redis.call('ZADD', KEYS[1], timestamp, ARGV[1] .. ',' .. ARGV[2] .. ',' .. ARGV[3] .. ',' .. ARGV[4])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', '(' .. (timestamp - tonumber(ARGV[5])))
+
+local rollup = 0
+for i = 2, #KEYS, 2 do
+    local step = tonumber(ARGV[6 + rollup * 2])
+    local retention = tonumber(ARGV[7 + rollup * 2])
+    local bucket = timestamp - timestamp % step
+    local raw_aggregate = redis.call('HGET', KEYS[i], bucket)
+    local aggregate = raw_aggregate and cjson.decode(raw_aggregate) or {}
+    for m = 1, #metrics do
+        local value = values[m]
+        if value then
+            local stats = aggregate[metrics[m]]
+            if stats then
+                aggregate[metrics[m]] = {stats[1] + 1, stats[2] + value, math.min(stats[3], value), math.max(stats[4], value)}
+            else
+                aggregate[metrics[m]] = {1, value, value, value}
+            end
+        end
+    end
+    redis.call('HSET', KEYS[i], bucket, cjson.encode(aggregate))
+    redis.call('ZADD', KEYS[i + 1], bucket, bucket)
+
+    local expired = redis.call('ZRANGEBYSCORE', KEYS[i + 1], '-inf', '(' .. (timestamp - retention))
+    if #expired > 0 then
+        redis.call('HDEL', KEYS[i], unpack(expired))
+        redis.call('ZREMRANGEBYSCORE', KEYS[i + 1], '-inf', '(' .. (timestamp - retention))
+    end
+    rollup = rollup + 1
+end
+return rollup
+"""
+
+class HistoryStore:
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+        self.record_script = self.redis_client.register_script(RECORD_SCRIPT)
+
+    def keys(self, server_id, gpu_id):
+        keys = [f'HISTORY_{server_id}_{gpu_id}_RAW']
+        for step, _ in RETENTION[1:]:
+            keys += [f'HISTORY_{server_id}_{gpu_id}_{step}', f'HISTORY_{server_id}_{gpu_id}_{step}_INDEX']
+        return keys
+
+    def record(self, server_id, server_status, timestamp):
+        # one sample per GPU, all GPUs of the snapshot in one round trip
+        pipe = self.redis_client.pipeline(transaction=False)
+        for gpu in server_status:
+            args = [float(timestamp)] + ['' if gpu.get(metric) is None else gpu[metric] for metric in METRICS] + [RETENTION[0][1]]
+            for step, retention in RETENTION[1:]:
+                args += [step, retention]
+            self.record_script(keys=self.keys(server_id, gpu['gpu_id']), args=args, client=pipe)
+        pipe.execute()
+
+    def query(self, server_id, gpu_id, start_timestamp, end_timestamp, step):
+        # [{timestamp, samples, metric: {avg, min, max}}, ...] for each `step`-aligned bucket in [start, end) holding data;
+        # reads the coarsest rollup whose step divides the requested one, the raw samples otherwise
+        source_step = max([rollup_step for rollup_step, _ in RETENTION[1:] if step % rollup_step == 0], default=0)
+        if source_step:
+            index_key = f'HISTORY_{server_id}_{gpu_id}_{source_step}_INDEX'
+            buckets = self.redis_client.zrangebyscore(index_key, start_timestamp, f'({end_timestamp}')
+            raw_aggregates = self.redis_client.hmget(f'HISTORY_{server_id}_{gpu_id}_{source_step}', buckets) if buckets else []
+            aggregates = [(int(bucket), json.loads(raw_aggregate)) for bucket, raw_aggregate in zip(buckets, raw_aggregates) if raw_aggregate]
+        else:
+            aggregates = list()
+            for member in self.redis_client.zrangebyscore(f'HISTORY_{server_id}_{gpu_id}_RAW', start_timestamp, f'({end_timestamp}'):
+                timestamp, *values = member.split(',')
+                aggregates.append((float(timestamp), {metric: [1, float(value), float(value), float(value)] for metric, value in zip(METRICS, values) if value}))
+
+        points = dict()
+        for timestamp, aggregate in aggregates:
+            bucket = int(timestamp - timestamp % step)
+            point = points.setdefault(bucket, {metric: [0, 0, None, None] for metric in METRICS})
+            for metric, (count, total, minimum, maximum) in aggregate.items():
+                stats = point[metric]
+                stats[0] += count
+                stats[1] += total
+                stats[2] = minimum if stats[2] is None else min(stats[2], minimum)
+                stats[3] = maximum if stats[3] is None else max(stats[3], maximum)
+
+        history = list()
+        for bucket in sorted(points):
+            point = {'timestamp': bucket, 'samples': max(stats[0] for stats in points[bucket].values())}
+            for metric, (count, total, minimum, maximum) in points[bucket].items():
+                point[metric] = {'avg': round(total / count, 2), 'min': minimum, 'max': maximum} if count else None
+            history.append(point)
+        return history
@@ -4,92 +4,251 @@
 # Date: 2025-05-21
 
 import os
+import csv
 import time
 import pytz
-import logging
+import threading
 from database import DataBase
+from history import HistoryStore
+from stream import StatusStream
+from overview import ClusterOverview
+from availability import AvailabilityGrid
+from reclaim import IdleReclaimer
+from scheduler import WaitlistScheduler
+from admin import BulkAdmin, KINDS as ADMIN_KINDS, CSV_FIELDS as ADMIN_CSV_FIELDS, parse_records, format_records
+from enforcement import EnforcementEngine, validate_settings
+from eventlog import AuditLog, Sampler, setup_queue_logging, rotating_json_handler
+from status import KeyframeRequired, load_status_payload, apply_status_payload, normalize_gpu, display_gpu
 from dotenv import load_dotenv
-from datetime import datetime, timedelta, timezone
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
+from flask import Flask, Response, render_template, request, redirect, url_for, session, flash, jsonify, stream_with_context
 
 # load the environment variables
 load_dotenv()
 
 # Flask Config
 app = Flask(__name__)
-app.logger.setLevel(logging.INFO)
-file_handler = logging.FileHandler('argus.log')
-file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-file_handler.setLevel(logging.INFO)
-app.logger.addHandler(file_handler)
+setup_queue_logging(app.logger, [rotating_json_handler('argus.log')])
 app.secret_key = os.environ["FLASK_SECRET_KEY"]
-app.db = DataBase(redis_host='localhost', redis_port=6379, redis_password=os.environ["REDIS_PASSWORD"], redis_db=0)
+app.db = DataBase(redis_host=os.environ.get('REDIS_HOST', 'localhost'), redis_port=int(os.environ.get('REDIS_PORT', 6379)), redis_password=os.environ["REDIS_PASSWORD"], redis_db=int(os.environ.get('REDIS_DB', 0)))
 sgt_timezone = pytz.timezone('Asia/Singapore')
+app.grid = AvailabilityGrid(app.db, sgt_timezone)
+app.history = HistoryStore(app.db.redis_client)
+app.overview = ClusterOverview(app.db)
+app.stream = StatusStream(app.db.redis_client, max_listeners=int(os.environ.get('ARGUS_MAX_STREAMS', 0)))
+app.audit = AuditLog(app.db.redis_client, 'audit.log')
+app.scheduler = WaitlistScheduler(app.db)
+app.enforcer = EnforcementEngine(app.db, {
+    key: value for key, value in {
+        'allow_users': os.environ.get('ENFORCE_ALLOW_USERS') and os.environ['ENFORCE_ALLOW_USERS'].split(','),
+        'allow_processes': os.environ.get('ENFORCE_ALLOW_PROCESSES') and os.environ['ENFORCE_ALLOW_PROCESSES'].split(','),
+        'grace_seconds': os.environ.get('ENFORCE_GRACE_SECONDS') and int(os.environ['ENFORCE_GRACE_SECONDS']),
+        'min_memory_mib': os.environ.get('ENFORCE_MIN_MEMORY_MIB') and int(os.environ['ENFORCE_MIN_MEMORY_MIB']),
+        'dry_run': os.environ.get('ENFORCE_DRY_RUN') and os.environ['ENFORCE_DRY_RUN'] == '1',
+        'idle_release_minutes': os.environ.get('IDLE_RELEASE_MINUTES') and int(os.environ['IDLE_RELEASE_MINUTES']),
+        'idle_utilization_percent': os.environ.get('IDLE_UTILIZATION_PERCENT') and int(os.environ['IDLE_UTILIZATION_PERCENT']),
+        'idle_memory_mib': os.environ.get('IDLE_MEMORY_MIB') and int(os.environ['IDLE_MEMORY_MIB']),
+        'idle_refund_percent': os.environ.get('IDLE_REFUND_PERCENT') and int(os.environ['IDLE_REFUND_PERCENT']),
+    }.items() if value is not None
+})
+app.reclaimer = IdleReclaimer(app.db, app.enforcer)
+app.bulk_admin = BulkAdmin(app.db)
+
+# one in this many heartbeats of each server is written to the event log
+HEARTBEAT_LOG_SAMPLE = int(os.environ.get('HEARTBEAT_LOG_SAMPLE', 60))
+sample_heartbeat = Sampler(HEARTBEAT_LOG_SAMPLE)
+
+# upper bound on audit events returned by one /audit/events query
+AUDIT_MAX_EVENTS = 1000
+
+# upper bound on hours of bookings a node fetches with /server/schedule
+SCHEDULE_MAX_HOURS = 24 * 7
+
+# upper bound on how far ahead a waitlist request may be placed
+WAITLIST_MAX_HOURS = 24 * 14
+
+# upper bound on (gpu, hour) pairs handled by one range request
+BOOK_RANGE_MAX_SLOTS = 24 * 7 * 16
+
+# upper bound on points returned by one /server/history query
+HISTORY_MAX_POINTS = 10000
+
+# past bookings kept in the hot booking sets before being moved to the archive
+BOOK_KEEP_HOURS = 24
+
+def compact_bookings_loop():
+    while True:
+        current_hour_timestamp = int(time.time()) - int(time.time()) % 3600
+        # every worker runs this loop, the first one to take the hour's lock does the work
+        if app.db.acquire_lock(f'BOOK_COMPACT_{current_hour_timestamp}', 3600):
+            before_timestamp = current_hour_timestamp - BOOK_KEEP_HOURS * 3600
+            for server_id in app.db.get_servers():
+                try:
+                    moved = app.db.compact_bookings(server_id, before_timestamp)
+                    if moved:
+                        app.logger.info(f"[Booking Compact] -> {server_id} {moved} booking(s) archived")
+                except Exception as e:
+                    app.logger.error(f"[Booking Compact] -> {server_id} Error: {e}")
+            # windows move with the hour, so the whole waitlist is retried (and expired) once per hour too
+            try:
+                audit_waitlist(app.scheduler.process())
+            except Exception as e:
+                app.logger.error(f"[Waitlist] -> Error: {e}")
+        time.sleep(3600 - int(time.time()) % 3600)
+
+def audit_waitlist(entries):
+    for entry in entries:
+        app.audit.record('waitlist', entry['username'], (entry['placement'] or {}).get('server_id'), entry_id=entry['id'], result=entry['status'], placement=entry['placement'])
+
+threading.Thread(target=compact_bookings_loop, daemon=True).start()
 
 # before request
 @app.before_request
 def before_request():
-    if request.endpoint in ['server_status', 'user_status', 'server_detail', 'server_kill', 'server_book', 'server_unbook', 'server_list']:
+    if request.endpoint in ['server_status', 'user_status', 'server_detail', 'server_kill', 'server_heartbeat', 'server_status_batch', 'server_history', 'cluster_overview', 'server_stream', 'server_book', 'server_unbook', 'server_book_range', 'server_unbook_range', 'server_list', 'audit_events', 'server_enforcement', 'server_schedule', 'waitlist', 'waitlist_cancel', 'admin_import', 'admin_export', 'admin_snapshot']:
         if not session.get('instance_id'):
             return redirect(url_for('user_login'))
 
 @app.route('/')
 def index():
     if session.get('instance_id'):
-        user_info = app.db.get_user_info(session['instance_id'])
-        return render_template('index.html', instance_id=session['instance_id'], credit=user_info['credit'], server_list=user_info['server_list'])
+        return render_template('index.html', instance_id=session['instance_id'], credit=app.db.get_user_credit(session['instance_id']), server_list=app.db.get_user_servers(session['instance_id']))
     else:
         return render_template('index.html')
 
 @app.route('/server/detail', methods=['GET'])
 def server_detail():
     request_server_id = request.args.get('server_id')
-    server_info = app.db.get_server_info(request_server_id)
+    free_slots = app.grid.get_free_slots(request_server_id)
+    server_status = [display_gpu(gpu) for gpu in app.db.get_server_status(request_server_id)]
+    return render_template('detail.html', server_id=request_server_id, data=server_status, free_slots=free_slots)
+
+def ingest_server_status(server_id):
+    # stores the status posted in the current request; returns (server_status, seq, error_response)
+    try:
+        server_status_data = load_status_payload(request.get_data(), request.headers.get('Content-Encoding'))
+    except (OSError, ValueError) as e:
+        return None, None, (jsonify({'status': 'error', 'message': f'Invalid status payload: {e}'}), 400)
     
-    free_slots = {gpu: [] for gpu in server_info['book_event'].keys()}
-    current_hour_timestamp = int(time.time()) - int(time.time()) % 3600
-    for gpu in server_info['book_event']:
-        book_event = server_info['book_event'][gpu]
-        for i in range(48):
-            current_slot_utc_timestamp = current_hour_timestamp + i * 3600
-            utc_dt = datetime.fromtimestamp(current_slot_utc_timestamp, pytz.utc)
-            sgt_dt = utc_dt.astimezone(sgt_timezone)
-            display_time_sgt = sgt_dt.strftime('%m-%d %H:%M')
-            free_slots[gpu].append(
-                {
-                    "current_timestamp": current_slot_utc_timestamp,
-                    "display_time": display_time_sgt,
-                    "booked_by": book_event[str(current_slot_utc_timestamp)] if str(current_slot_utc_timestamp) in book_event else ""
-                }
-            )
-
-    return render_template('detail.html', server_id=request_server_id, data=server_info['server_status'], free_slots=free_slots)
+    # deltas are applied on top of the stored snapshot, full snapshots replace it
+    current_status, current_seq = [], None
+    if 'server_status' not in server_status_data and not server_status_data.get('keyframe'):
+        current_status, current_seq = app.db.get_server_status_state(server_id)
+    try:
+        server_status, seq, changed = apply_status_payload(server_status_data, current_status, current_seq)
+    except KeyframeRequired as e:
+        app.logger.info(f"[Server Status] -> {server_id} Keyframe required: {e}", extra={'event': {'event': 'keyframe_required', 'server_id': server_id}})
+        return None, None, (jsonify({'status': 'error', 'message': 'Keyframe required', 'keyframe_required': True}), 409)
+    app.db.set_server_status(server_id, server_status if changed else None, server_status_data['timestamp'], seq)
+    app.history.record(server_id, server_status, server_status_data['timestamp'])
+    app.overview.update(server_id, server_status, server_status_data['timestamp'])
+    if changed:
+        app.stream.publish(server_id, [display_gpu(gpu) for gpu in server_status], server_status_data['timestamp'])
+    reclaim_idle_gpus(server_id, server_status)
+    
+    # log a compact, sampled summary of the server status
+    if sample_heartbeat(server_id):
+        event = {
+            'event': 'heartbeat', 'server_id': server_id, 'timestamp': server_status_data['timestamp'], 'seq': seq, 'changed': changed,
+            'gpus': len(server_status), 'processes': sum(len(gpu.get('processes', [])) for gpu in server_status),
+        }
+        app.logger.info(f"[Server Status] -> {server_id} {len(server_status)} GPU(s) {server_status_data['timestamp']}", extra={'event': event})
+    
+    return server_status, seq, None
+
+def reclaim_idle_gpus(server_id, server_status):
+    # releases the booked GPUs left idle too long and offers the freed hours to the waitlist
+    releases = app.reclaimer.observe(server_id, server_status)
+    for release in releases:
+        app.logger.info(f"[Idle Reclaim] -> {server_id} GPU {release['gpu_id']} of {release['username']} released {release['released']} hour(s), refunded {release['refunded']}")
+        app.audit.record('reclaim', release['username'], server_id, gpu_id=release['gpu_id'], idle_since=release['idle_since'], released=release['released'], refunded=release['refunded'])
+    if releases:
+        audit_waitlist(app.scheduler.process(server_id))
+
+def get_killing_pid_list(server_id, server_status):
+    # (pids breaking the server's enforcement policy, none in dry-run mode; version of the node's schedule, see /server/schedule)
+    kills, policy = app.enforcer.plan(server_id, server_status)
+    
+    # audit each planned kill once, not on every poll
+    for kill in app.enforcer.unreported(server_id, kills, policy):
+        app.audit.record('kill', kill['user'], server_id, pid=kill['pid'], gpu_id=kill['gpu_id'], booker=kill['booker'], process_name=kill['process_name'], container=kill['container'], dry_run=policy['dry_run'])
+    
+    return ([] if policy['dry_run'] else [kill['pid'] for kill in kills]), policy['version']
 
 @app.route('/server/status', methods=['GET', 'POST'])
 def server_status():
     request_server_id = request.args.get('server_id')
     if request.method == 'POST':
-        server_status_data = request.get_json()
         if request_server_id != session['instance_id']:
             return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
         
-        server_info = app.db.get_server_info(request_server_id)
-        server_info['server_status'] = server_status_data['server_status']
-        server_info['timestamp'] = server_status_data['timestamp']
-        app.db.set_server_info(request_server_id, server_info)
-        
-        # log the server status
-        app.logger.info(f"[Server Status] -> {request_server_id} {server_status_data['server_status']} {server_status_data['timestamp']}")
+        server_status, seq, error_response = ingest_server_status(request_server_id)
+        if error_response:
+            return error_response
         
-        return jsonify({'status': 'success'}), 200
+        return jsonify({'status': 'success', 'seq': seq}), 200
     elif request.method == 'GET':
-        user_info = app.db.get_user_info(session['instance_id'])
-        if request_server_id in user_info['server_list']:
-            server_info = app.db.get_server_info(request_server_id)
-            return jsonify({'status': 'success', 'server_id': request_server_id, 'server_status': server_info['server_status']}), 200
+        if app.db.user_has_server(session['instance_id'], request_server_id):
+            server_status = [display_gpu(gpu) for gpu in app.db.get_server_status(request_server_id)]
+            return jsonify({'status': 'success', 'server_id': request_server_id, 'server_status': server_status}), 200
         else:
             return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
 
+@app.route('/server/status/batch', methods=['POST'])
+def server_status_batch():
+    # snapshots a client spooled while the master was unreachable, oldest first
+    request_server_id = request.args.get('server_id')
+    if request_server_id != session['instance_id']:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    
+    try:
+        samples = load_status_payload(request.get_data(), request.headers.get('Content-Encoding'))['samples']
+        # every sample is checked before any is recorded, so a rejected batch leaves no partial history
+        samples = [{'timestamp': float(sample['timestamp']), 'server_status': [dict(normalize_gpu(gpu), gpu_id=int(gpu['gpu_id'])) for gpu in sample['server_status']]} for sample in samples]
+    except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+        return jsonify({'status': 'error', 'message': f'Invalid status batch: {e!r}'}), 400
+    
+    for sample in samples:
+        app.history.record(request_server_id, sample['server_status'], sample['timestamp'])
+    
+    # log the spooled batch
+    if samples:
+        event = {'event': 'heartbeat_batch', 'server_id': request_server_id, 'count': len(samples), 'first': samples[0]['timestamp'], 'last': samples[-1]['timestamp']}
+        app.logger.info(f"[Server Status] -> {request_server_id} {len(samples)} spooled sample(s)", extra={'event': event})
+    
+    return jsonify({'status': 'success', 'count': len(samples)}), 200
+
+@app.route('/server/stream', methods=['GET'])
+def server_stream():
+    request_server_id = request.args.get('server_id')
+    if not app.db.user_has_server(session['instance_id'], request_server_id):
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    events = app.stream.events(request_server_id)
+    if events is None:
+        # the page keeps its server-rendered status and retries later
+        return jsonify({'status': 'error', 'message': 'Too many live streams, try again later.'}), 503, {'Retry-After': '30'}
+    
+    # no request context is needed while streaming, and the Response closes `events` directly
+    return Response(events, mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/server/history', methods=['GET'])
+def server_history():
+    request_server_id = request.args.get('server_id')
+    if not app.db.user_has_server(session['instance_id'], request_server_id):
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    
+    try:
+        request_gpu_id = int(request.args['gpu_id'])
+        request_to = int(request.args.get('to', time.time()))
+        request_from = int(request.args.get('from', request_to - 24 * 3600))
+        request_step = int(request.args.get('step', 3600))
+    except (KeyError, ValueError):
+        return jsonify({'status': 'error', 'message': 'Invalid request. Expecting gpu_id and integer from, to and step.'}), 400
+    if request_step <= 0 or request_to <= request_from or (request_to - request_from) // request_step > HISTORY_MAX_POINTS:
+        return jsonify({'status': 'error', 'message': f'Invalid range. from must be before to, with at most {HISTORY_MAX_POINTS} steps.'}), 400
+    
+    history = app.history.query(request_server_id, request_gpu_id, request_from, request_to, request_step)
+    return jsonify({'status': 'success', 'server_id': request_server_id, 'gpu_id': request_gpu_id, 'step': request_step, 'history': history}), 200
+
 @app.route('/server/book', methods=['GET'])
 def server_book():
     request_server_id = request.args.get('server_id')
@@ -100,34 +259,30 @@ def server_book():
     app.logger.info(f"[Server Book] -> {session['instance_id']} {request_server_id} {request_gpu_id} {request_timestamp}")
     
     # check if the user is authorized to accessthis server
-    user_info = app.db.get_user_info(session['instance_id'])
-    if request_server_id not in user_info['server_list']:
+    if not app.db.user_has_server(session['instance_id'], request_server_id):
         app.logger.info(f"[Server Book] -> {session['instance_id']} {request_server_id} {request_gpu_id} {request_timestamp} Unauthorized")
+        app.audit.record('book', session['instance_id'], request_server_id, gpu_id=request_gpu_id, timestamp=request_timestamp, result='unauthorized')
         flash('Unauthorized. You are not authorized to access this server.', 'danger')
         return redirect(url_for('server_detail', server_id=request_server_id))
     
-    # check if the slot is already booked
-    server_info = app.db.get_server_info(request_server_id)
-    if request_timestamp in server_info['book_event'][request_gpu_id]:
+    gpu_id, timestamp, error_message = parse_book_slot(request_server_id, request_gpu_id, request_timestamp)
+    if error_message:
+        app.audit.record('book', session['instance_id'], request_server_id, gpu_id=request_gpu_id, timestamp=request_timestamp, result='invalid')
+        flash(error_message, 'danger')
+        return redirect(url_for('server_detail', server_id=request_server_id))
+    
+    # check the slot, charge the user credit and book the slot in one atomic step
+    result = app.db.book_slot(request_server_id, gpu_id, timestamp, session['instance_id'])
+    app.audit.record('book', session['instance_id'], request_server_id, gpu_id=request_gpu_id, timestamp=request_timestamp, result=result)
+    if result == 'booked':
         app.logger.info(f"[Server Book] -> {session['instance_id']} {request_server_id} {request_gpu_id} {request_timestamp} Slot already booked")
         flash('Slot already booked. Please check the timestamp.', 'danger')
         return redirect(url_for('server_detail', server_id=request_server_id))
-    
-    # charge the user credit
-    if user_info['credit'] < 1:
+    if result == 'insufficient_credit':
         app.logger.info(f"[Server Book] -> {session['instance_id']} {request_server_id} {request_gpu_id} {request_timestamp} Insufficient credit")
         flash('Insufficient credit. Please check your credit.', 'danger')
         return redirect(url_for('server_detail', server_id=request_server_id))
     
-    user_info['credit'] -= 1
-    app.db.set_user_info(session['instance_id'], user_info)
-    
-    # book the slot
-    server_info['book_event'][str(request_gpu_id)][str(request_timestamp)] = {
-        'username': session['instance_id']
-    }
-    app.db.set_server_info(request_server_id, server_info)
-    
     flash('Booked successfully!', 'success')
     return redirect(url_for('server_detail', server_id=request_server_id))
 
@@ -141,31 +296,147 @@ def server_unbook():
     app.logger.info(f"[Server Unbook] -> {session['instance_id']} {request_server_id} {request_gpu_id} {request_timestamp}")
     
     # check if the user is authorized to this server
-    user_info = app.db.get_user_info(session['instance_id'])
-    if request_server_id not in user_info['server_list']:
+    if not app.db.user_has_server(session['instance_id'], request_server_id):
         return jsonify({'status': 'error', 'message': 'Unauthorized. You are not authorized to access this server.'}), 401
     
-    # check if the booking event exists
-    server_info = app.db.get_server_info(request_server_id)
-    if request_timestamp not in server_info['book_event'][request_gpu_id]:
-        return jsonify({'status': 'error', 'message': 'Slot not booked. Please check the timestamp.'}), 400
+    gpu_id, timestamp, error_message = parse_book_slot(request_server_id, request_gpu_id, request_timestamp)
+    if error_message:
+        return jsonify({'status': 'error', 'message': error_message}), 400
     
-    # check if the booking event is booked by the user
-    booked_event = server_info['book_event'][str(request_gpu_id)][str(request_timestamp)]
-    if booked_event['username'] != session['instance_id']:
+    # check the booker, return the credit to the user and unbook the slot in one atomic step
+    result = app.db.unbook_slot(request_server_id, gpu_id, timestamp, session['instance_id'])
+    app.audit.record('unbook', session['instance_id'], request_server_id, gpu_id=request_gpu_id, timestamp=request_timestamp, result=result)
+    if result == 'not_booked':
+        return jsonify({'status': 'error', 'message': 'Slot not booked. Please check the timestamp.'}), 400
+    if result == 'not_owner':
         return jsonify({'status': 'error', 'message': 'Unauthorized. Only the booker can unbook the slot.'}), 401
     
-    # return the credit to the user
-    user_info['credit'] += 1
-    app.db.set_user_info(session['instance_id'], user_info)
-    
-    # unbook the slot
-    server_info['book_event'][str(request_gpu_id)].pop(str(request_timestamp))
-    app.db.set_server_info(request_server_id, server_info)
+    # hand the released slot to the waitlist
+    audit_waitlist(app.scheduler.process(request_server_id))
     
     flash('Unbooked successfully!', 'success')
     return redirect(url_for('server_detail', server_id=request_server_id))
     
+def parse_book_range(request_data):
+    # returns (gpu_ids, timestamps, error_message) for a {server_id, gpu_ids, start, end} range request
+    try:
+        gpu_ids = [str(int(gpu_id)) for gpu_id in request_data['gpu_ids']]
+        start_timestamp = int(request_data['start'])
+        end_timestamp = int(request_data['end'])
+    except (KeyError, TypeError, ValueError):
+        return None, None, 'Invalid request. Expecting gpu_ids, start and end.'
+    
+    if start_timestamp % 3600 or end_timestamp % 3600 or end_timestamp <= start_timestamp:
+        return None, None, 'Invalid range. start and end must be hour-aligned and start must be before end.'
+    
+    timestamps = list(range(start_timestamp, end_timestamp, 3600))
+    if not gpu_ids or len(gpu_ids) * len(timestamps) > BOOK_RANGE_MAX_SLOTS:
+        return None, None, f'Invalid range. Between 1 and {BOOK_RANGE_MAX_SLOTS} slots can be requested at once.'
+    
+    unknown_gpu_ids = set(gpu_ids) - set(app.db.get_server_gpus(request_data.get('server_id')))
+    if unknown_gpu_ids:
+        return None, None, f'Invalid GPU id(s): {sorted(unknown_gpu_ids)}.'
+    
+    return sorted(set(gpu_ids), key=int), timestamps, None
+
+def parse_book_slot(server_id, gpu_id, timestamp):
+    # returns (gpu_id, timestamp, error_message) for a single slot, checked like a one-hour range
+    try:
+        timestamp = int(timestamp)
+    except (TypeError, ValueError):
+        return None, None, 'Invalid request. Expecting gpu_id and an hour-aligned timestamp.'
+    gpu_ids, timestamps, error_message = parse_book_range({'server_id': server_id, 'gpu_ids': [gpu_id], 'start': timestamp, 'end': timestamp + 3600})
+    if error_message:
+        return None, None, error_message
+    return gpu_ids[0], timestamps[0], None
+
+@app.route('/server/book_range', methods=['POST'])
+def server_book_range():
+    request_data = request.get_json(silent=True) or {}
+    request_server_id = request_data.get('server_id')
+    
+    # log the book event
+    app.logger.info(f"[Server Book Range] -> {session['instance_id']} {request_server_id} {request_data.get('gpu_ids')} {request_data.get('start')} {request_data.get('end')}")
+    
+    # check if the user is authorized to access this server
+    if not app.db.user_has_server(session['instance_id'], request_server_id):
+        return jsonify({'status': 'error', 'message': 'Unauthorized. You are not authorized to access this server.'}), 401
+    
+    gpu_ids, timestamps, error_message = parse_book_range(request_data)
+    if error_message:
+        return jsonify({'status': 'error', 'message': error_message}), 400
+    
+    # check every slot, charge the user credit once and book all slots in one atomic step
+    results = app.db.book_slots(request_server_id, gpu_ids, timestamps, session['instance_id'])
+    app.audit.record('book_range', session['instance_id'], request_server_id, gpu_ids=gpu_ids, start=timestamps[0], end=timestamps[-1] + 3600,
+                     result='success' if all(result['status'] == 'success' for result in results) else 'rejected')
+    if any(result['status'] != 'success' for result in results):
+        app.logger.info(f"[Server Book Range] -> {session['instance_id']} {request_server_id} Rejected")
+        return jsonify({'status': 'error', 'message': 'Nothing was booked. Some slots are unavailable or your credit is insufficient.', 'results': results}), 409
+    
+    return jsonify({'status': 'success', 'results': results}), 200
+
+@app.route('/server/unbook_range', methods=['POST'])
+def server_unbook_range():
+    request_data = request.get_json(silent=True) or {}
+    request_server_id = request_data.get('server_id')
+    
+    # log the unbook event
+    app.logger.info(f"[Server Unbook Range] -> {session['instance_id']} {request_server_id} {request_data.get('gpu_ids')} {request_data.get('start')} {request_data.get('end')}")
+    
+    # check if the user is authorized to this server
+    if not app.db.user_has_server(session['instance_id'], request_server_id):
+        return jsonify({'status': 'error', 'message': 'Unauthorized. You are not authorized to access this server.'}), 401
+    
+    gpu_ids, timestamps, error_message = parse_book_range(request_data)
+    if error_message:
+        return jsonify({'status': 'error', 'message': error_message}), 400
+    
+    # release the user's own slots in the range and refund them in one atomic step
+    results = app.db.unbook_slots(request_server_id, gpu_ids, timestamps, session['instance_id'])
+    app.audit.record('unbook_range', session['instance_id'], request_server_id, gpu_ids=gpu_ids, start=timestamps[0], end=timestamps[-1] + 3600,
+                     unbooked=sum(result['status'] == 'success' for result in results))
+    if any(result['status'] == 'success' for result in results):
+        audit_waitlist(app.scheduler.process(request_server_id))
+    return jsonify({'status': 'success', 'results': results}), 200
+
+@app.route('/waitlist', methods=['GET', 'POST'])
+def waitlist():
+    # POST {server_ids, gpu_count, hours, within_hours}: book `gpu_count` GPUs of one of the servers for `hours` contiguous
+    # hours within the next `within_hours`, now if possible, otherwise as soon as slots are released; GET: the user's requests
+    if request.method == 'GET':
+        return jsonify({'status': 'success', 'entries': app.scheduler.get_user_entries(session['instance_id'])}), 200
+    
+    request_data = request.get_json(silent=True) or {}
+    try:
+        server_ids = [str(server_id) for server_id in request_data['server_ids']]
+        gpu_count = int(request_data.get('gpu_count', 1))
+        hours = int(request_data['hours'])
+        within_hours = int(request_data.get('within_hours', 48))
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'status': 'error', 'message': 'Invalid request. Expecting server_ids, hours and optional gpu_count and within_hours.'}), 400
+    if not server_ids or gpu_count < 1 or hours < 1 or within_hours < hours or within_hours > WAITLIST_MAX_HOURS:
+        return jsonify({'status': 'error', 'message': f'Invalid request. Expecting 1 <= hours <= within_hours <= {WAITLIST_MAX_HOURS} and gpu_count >= 1.'}), 400
+    if not all(app.db.user_has_server(session['instance_id'], server_id) for server_id in server_ids):
+        return jsonify({'status': 'error', 'message': 'Unauthorized. You are not authorized to access some of these servers.'}), 401
+    if all(len(app.db.get_server_gpus(server_id)) < gpu_count for server_id in server_ids):
+        return jsonify({'status': 'error', 'message': f'None of these servers has {gpu_count} GPU(s).'}), 400
+    
+    deadline = int(time.time()) - int(time.time()) % 3600 + within_hours * 3600
+    entry = app.scheduler.submit(session['instance_id'], server_ids, gpu_count, hours, deadline)
+    app.audit.record('waitlist_submit', session['instance_id'], entry_id=entry['id'], server_ids=server_ids, gpu_count=gpu_count, hours=hours, deadline=deadline)
+    if entry['status'] != 'waiting':
+        audit_waitlist([entry])
+    return jsonify({'status': 'success', 'entry': entry}), 200 if entry['status'] == 'booked' else 202
+
+@app.route('/waitlist/cancel', methods=['POST'])
+def waitlist_cancel():
+    request_data = request.get_json(silent=True) or {}
+    if not app.scheduler.cancel(session['instance_id'], str(request_data.get('id'))):
+        return jsonify({'status': 'error', 'message': 'No such waiting request.'}), 404
+    app.audit.record('waitlist_cancel', session['instance_id'], entry_id=request_data.get('id'))
+    return jsonify({'status': 'success'}), 200
+
 @app.route('/server/kill', methods=['GET'])
 def server_kill():
     request_server_id = request.args.get('server_id')
@@ -174,29 +445,142 @@ def server_kill():
     if request_server_id != session['instance_id']:
         return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
 
-    server_info = app.db.get_server_info(request_server_id)
-    current_hour_timestamp = str(int(time.time()) - int(time.time()) % 3600)
+    killing_pid_list, schedule_version = get_killing_pid_list(request_server_id, app.db.get_server_status(request_server_id))
+    return jsonify({'status': 'success', 'killing_pid_list': killing_pid_list, 'schedule_version': schedule_version}), 200
+
+@app.route('/server/heartbeat', methods=['POST'])
+def server_heartbeat():
+    # /server/status (POST) and /server/kill in one round trip, deciding on the status just submitted
+    request_server_id = request.args.get('server_id')
+    if request_server_id != session['instance_id']:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
     
-    killing_pid_list = list()
-    for gpu in server_info['server_status']:
-        gpu_id = str(gpu['gpu_id'])
-        if current_hour_timestamp in server_info['book_event'][gpu_id]:
-            username = server_info['book_event'][gpu_id][current_hour_timestamp]['username']
-            for process in gpu['processes']:
-                if process['user'] != username:
-                    killing_pid_list.append(process['pid'])
+    server_status, seq, error_response = ingest_server_status(request_server_id)
+    if error_response:
+        return error_response
     
-    # log the kill event
-    app.logger.info(f"[Server Kill] -> {request_server_id} {killing_pid_list}")
-            
-    return jsonify({'status': 'success', 'killing_pid_list': killing_pid_list}), 200
+    killing_pid_list, schedule_version = get_killing_pid_list(request_server_id, server_status)
+    return jsonify({'status': 'success', 'seq': seq, 'killing_pid_list': killing_pid_list, 'schedule_version': schedule_version}), 200
+
+@app.route('/server/schedule', methods=['GET'])
+def server_schedule():
+    # bookings of the node's GPUs for the next `hours` hours plus its enforcement settings, so the node can enforce them
+    # itself; heartbeats announce the current version, so nodes only call this when it moved or their cached hours run out
+    request_server_id = request.args.get('server_id')
+    if request_server_id != session['instance_id']:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    try:
+        request_hours = min(int(request.args.get('hours', 24)), SCHEDULE_MAX_HOURS)
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'Invalid hours.'}), 400
+    
+    current_hour_timestamp = int(time.time()) - int(time.time()) % 3600
+    schedule = app.enforcer.get_schedule(request_server_id, current_hour_timestamp, max(request_hours, 1))
+    return jsonify(dict(schedule, status='success')), 200
+
+@app.route('/server/enforcement', methods=['GET', 'POST'])
+def server_enforcement():
+    # GET: the server's compiled policy for this hour and the kills it plans now; POST (admin): update the overrides
+    request_server_id = request.args.get('server_id')
+    if request.method == 'POST':
+        if session['instance_id'] != 'ids_admin':
+            return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+        if not app.db.server_exists(request_server_id):
+            return jsonify({'status': 'error', 'message': 'Server not found'}), 404
+        settings = request.get_json(silent=True)
+        if not settings or not isinstance(settings, dict):
+            return jsonify({'status': 'error', 'message': 'Invalid request. Expecting a JSON object of settings.'}), 400
+        errors = validate_settings(settings)
+        if errors:
+            return jsonify({'status': 'error', 'message': 'Invalid settings, nothing changed.', 'errors': errors}), 400
+        app.db.set_enforcement_settings(request_server_id, settings)
+        app.audit.record('enforcement', session['instance_id'], request_server_id, settings=settings)
+        return jsonify({'status': 'success', 'settings': app.db.get_enforcement_settings(request_server_id)}), 200
+    
+    if request_server_id != session['instance_id'] and not app.db.user_has_server(session['instance_id'], request_server_id):
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    kills, policy = app.enforcer.plan(request_server_id, app.db.get_server_status(request_server_id))
+    policy = dict(policy, allow_users=sorted(policy['allow_users']), allow_processes=sorted(policy['allow_processes']))
+    return jsonify({'status': 'success', 'server_id': request_server_id, 'policy': policy, 'kills': kills}), 200
+
+@app.route('/admin/import', methods=['POST'])
+def admin_import():
+    # bulk upsert of users / servers / acl / credits from a CSV or JSONL body (see admin.py); nothing is written if a record is invalid
+    if session['instance_id'] != 'ids_admin':
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    request_kind = request.args.get('kind')
+    request_format = request.args.get('format', 'jsonl')
+    if request_kind not in ADMIN_KINDS or request_format not in ('csv', 'jsonl'):
+        return jsonify({'status': 'error', 'message': f'Invalid request. Expecting kind in {ADMIN_KINDS} and format csv or jsonl.'}), 400
+    try:
+        records = parse_records(request.get_data(as_text=True), request_format)
+    except (ValueError, csv.Error) as e:
+        return jsonify({'status': 'error', 'message': f'Invalid {request_format} body: {e}'}), 400
+    
+    result = app.bulk_admin.import_records(request_kind, records)
+    if result['errors']:
+        return jsonify({'status': 'error', 'message': 'Invalid records, nothing imported.', 'errors': result['errors']}), 400
+    app.audit.record('admin_import', session['instance_id'], kind=request_kind, records=result['imported'])
+    return jsonify({'status': 'success', 'imported': result['imported']}), 200
+
+@app.route('/admin/export', methods=['GET'])
+def admin_export():
+    # users / servers / acl / credits in the import format; passwords only with secrets=1
+    if session['instance_id'] != 'ids_admin':
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    request_kind = request.args.get('kind')
+    request_format = request.args.get('format', 'jsonl')
+    if request_kind not in ADMIN_KINDS or request_format not in ('csv', 'jsonl'):
+        return jsonify({'status': 'error', 'message': f'Invalid request. Expecting kind in {ADMIN_KINDS} and format csv or jsonl.'}), 400
+    
+    secrets = request.args.get('secrets') == '1'
+    records = app.bulk_admin.export_records(request_kind, secrets)
+    if secrets:
+        app.audit.record('admin_export', session['instance_id'], kind=request_kind, secrets=True)
+    mimetype = 'text/csv' if request_format == 'csv' else 'application/x-ndjson'
+    return Response(format_records(records, request_format, ADMIN_CSV_FIELDS[request_kind]), mimetype=mimetype)
+
+@app.route('/admin/snapshot', methods=['GET'])
+def admin_snapshot():
+    # JSONL snapshot of the primary data (?audit=1 adds the audit streams), streamed chunk by chunk; replay it with `python admin.py replay`
+    if session['instance_id'] != 'ids_admin':
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    audit = request.args.get('audit') == '1'
+    app.audit.record('admin_snapshot', session['instance_id'], audit=audit)
+    return Response(stream_with_context(app.bulk_admin.snapshot(audit)), mimetype='application/x-ndjson')
+
+@app.route('/cluster/overview', methods=['GET'])
+def cluster_overview():
+    servers = app.overview.get(app.db.get_user_servers(session['instance_id']))
+    if request.args.get('format') == 'json':
+        return jsonify({'status': 'success', 'servers': servers}), 200
+    return render_template('overview.html', servers=servers)
 
 @app.route('/server/list', methods=['GET'])
 def server_list():
-    user_info = app.db.get_user_info(session['instance_id'])
-    server_list = user_info['server_list']
+    server_list = app.db.get_user_servers(session['instance_id'])
     return jsonify({'status': 'success', 'server_list': server_list})
 
+@app.route('/audit/events', methods=['GET'])
+def audit_events():
+    # newest audit events of a user and/or a server; page with before=<id of the last event seen>
+    request_username = request.args.get('username')
+    request_server_id = request.args.get('server_id')
+    is_admin = session['instance_id'] == 'ids_admin'
+    if not request_username and not request_server_id and not is_admin:
+        return jsonify({'status': 'error', 'message': 'Invalid request. Expecting username or server_id.'}), 400
+    if request_username and request_username != session['instance_id'] and not is_admin:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    if request_server_id and not is_admin and request_server_id != session['instance_id'] and not app.db.user_has_server(session['instance_id'], request_server_id):
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    
+    try:
+        request_count = min(int(request.args.get('count', 100)), AUDIT_MAX_EVENTS)
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'Invalid count.'}), 400
+    events = app.audit.query(request_username, request_server_id, request_count, request.args.get('before'))
+    return jsonify({'status': 'success', 'events': events}), 200
+
 @app.route('/user/status', methods=['GET'])
 def user_status():
     request_username = request.args.get('username')
@@ -217,6 +601,7 @@ def server_login():
         session['instance_id'] = server_id
         return jsonify({'status': 'success'}), 200
     else:
+        app.audit.record('server_login', None, server_id, result='failed', remote_addr=request.remote_addr)
         return jsonify({'status': 'error', 'message': 'Invalid username or password'}), 401
 
 @app.route('/user/login', methods=['GET', 'POST'])
@@ -228,12 +613,12 @@ def user_login():
         if app.db.user_auth(username, password):
             session['instance_id'] = username
             # log the user login event
-            app.logger.info(f"[User Login] -> [success] {username} {password}")
+            app.audit.record('login', username, result='success', remote_addr=request.remote_addr)
             flash('Login successful!', 'success')
             return redirect(url_for('index'))
         else:
             # log the user login event
-            app.logger.info(f"[User Login] -> [failed] {username} {password}")
+            app.audit.record('login', username, result='failed', remote_addr=request.remote_addr)
             flash('Invalid username or password.', 'danger')
             return render_template('login.html'), 401
 
@@ -243,11 +628,12 @@ def user_login():
 def user_logout():
     # log the user logout event
     if session.get('instance_id'):
-        app.logger.info(f"[User Logout] -> {session['instance_id']}")
+        app.audit.record('logout', session['instance_id'])
     
         session.pop('instance_id', None)
         flash('You have been logged out.', 'info')
     return redirect(url_for('index'))
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=8000, debug=True)
\ No newline at end of file
+    # development server only, production runs under gunicorn (see gunicorn.conf.py)
+    app.run(host='0.0.0.0', port=8000, debug=os.environ.get('FLASK_DEBUG') == '1')
\ No newline at end of file
@@ -0,0 +1,4 @@
+#!/bin/bash
+
+# graceful reload: new workers pick up the code while the old ones drain, the listening socket stays open
+kill -HUP $(cat gunicorn.pid)
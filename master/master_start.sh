@@ -1,3 +1,17 @@
 #! /bin/bash
 
-gunicorn -w 1 -b 0.0.0.0:8000 master:app --daemon --pid gunicorn.pid
\ No newline at end of file
+# Create virtual environment
+echo "Creating virtual environment..."
+if [ ! -d "master_venv" ]; then
+    python3 -m venv master_venv
+fi
+
+# Activate virtual environment
+echo "Activating virtual environment..."
+source master_venv/bin/activate
+
+# Install dependencies (gevent lets each worker hold many live streams, see gunicorn.conf.py)
+echo "Installing dependencies..."
+pip install flask redis pytz python-dotenv requests zstandard gunicorn gevent
+
+gunicorn -c gunicorn.conf.py master:app --daemon
@@ -1,4 +1,6 @@
 #!/bin/bash
 
-kill -9 $(cat gunicorn.pid)
-rm gunicorn.pid
\ No newline at end of file
+# graceful stop: workers finish their in-flight requests (up to graceful_timeout) before exiting
+PID=$(cat gunicorn.pid)
+kill -TERM $PID
+while kill -0 $PID 2>/dev/null; do sleep 1; done
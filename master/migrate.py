@@ -0,0 +1,29 @@
+# coding: utf-8
+
+# One-shot migration of the legacy SERVER_{id} / USER_{name} JSON blobs into the split Redis layout.
+# Usage: python migrate.py [--host HOST] [--port PORT] [--db DB]   (defaults: REDIS_HOST / REDIS_PORT / REDIS_DB, as the master)
+
+import os
+import argparse
+from database import DataBase
+from dotenv import load_dotenv
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Migrate the legacy JSON blobs into the split Redis layout.")
+    parser.add_argument('--host', help="Redis host (default: REDIS_HOST or localhost)")
+    parser.add_argument('--port', type=int, help="Redis port (default: REDIS_PORT or 6379)")
+    parser.add_argument('--db', type=int, help="Redis database (default: REDIS_DB or 0)")
+    args = parser.parse_args()
+
+    load_dotenv()
+    redis_host = args.host if args.host is not None else os.environ.get('REDIS_HOST', 'localhost')
+    redis_port = args.port if args.port is not None else int(os.environ.get('REDIS_PORT', 6379))
+    redis_db = args.db if args.db is not None else int(os.environ.get('REDIS_DB', 0))
+    print(f"[Migrate] -> Redis {redis_host}:{redis_port} db {redis_db}")
+    db = DataBase(redis_host=redis_host, redis_port=redis_port, redis_password=os.environ["REDIS_PASSWORD"], redis_db=redis_db)
+    migrated = db.migrate_legacy_servers()
+    print(f"[Migrate] -> {len(migrated)} server(s) migrated: {migrated}")
+    migrated = db.migrate_book_hashes()
+    print(f"[Migrate] -> {len(migrated)} booking hash(es) migrated: {migrated}")
+    migrated = db.migrate_legacy_users()
+    print(f"[Migrate] -> {len(migrated)} user(s) migrated: {migrated}")
@@ -0,0 +1,73 @@
+# coding: utf-8
+
+# Cluster-wide overview for /cluster/overview.
+#
+# Heartbeats write a compact per-server summary (SERVER_{id}_SUMMARY) and update this worker's
+# in-memory snapshot directly. The whole snapshot is reloaded with one MGET of every summary plus one
+# pipelined read of the current-hour bookings, at most every `refresh_seconds`, or sooner when the hour
+# rolls over. Requests are served from memory and only filtered by the user's server list.
+
+import time
+import threading
+
+class ClusterOverview:
+    def __init__(self, db, refresh_seconds=5):
+        self.db = db
+        self.refresh_seconds = refresh_seconds
+        self.lock = threading.Lock()
+        self.refreshed_at = 0
+        self.refreshed_hour = None
+        self.summaries = dict()
+        self.bookers = dict()
+
+    def summarize(self, server_status, timestamp):
+        return {
+            'timestamp': timestamp,
+            'gpus': [
+                {
+                    'gpu_id': gpu['gpu_id'],
+                    'utilization_percent': gpu.get('utilization_percent'),
+                    'memory_usage_mib': gpu.get('memory_usage_mib'),
+                    'memory_total_mib': gpu.get('memory_total_mib'),
+                    'users': sorted({process.get('owner') or process['user'] for process in gpu.get('processes', [])}),
+                }
+                for gpu in server_status
+            ],
+        }
+
+    def update(self, server_id, server_status, timestamp):
+        # called on heartbeat ingest
+        summary = self.summarize(server_status, timestamp)
+        self.db.set_server_summary(server_id, summary)
+        with self.lock:
+            self.summaries[server_id] = summary
+
+    def refresh(self, current_hour_timestamp):
+        server_ids = self.db.get_servers()
+        summaries = {server_id: summary for server_id, summary in self.db.get_server_summaries(server_ids).items() if summary}
+        gpus_by_server = {server_id: [gpu['gpu_id'] for gpu in summary['gpus']] for server_id, summary in summaries.items()}
+        bookers = self.db.get_current_bookers(gpus_by_server, current_hour_timestamp)
+        with self.lock:
+            self.summaries, self.bookers = summaries, bookers
+            self.refreshed_at, self.refreshed_hour = time.time(), current_hour_timestamp
+
+    def get(self, server_list):
+        # [{server_id, timestamp, gpus: [{gpu_id, state: free|busy|booked, booked_by, ...}]}, ...] for the given servers
+        current_hour_timestamp = int(time.time()) - int(time.time()) % 3600
+        if time.time() - self.refreshed_at > self.refresh_seconds or self.refreshed_hour != current_hour_timestamp:
+            self.refresh(current_hour_timestamp)
+
+        overview = list()
+        for server_id in server_list:
+            summary = self.summaries.get(server_id)
+            if summary is None:
+                overview.append({'server_id': server_id, 'timestamp': None, 'gpus': []})
+                continue
+            bookers = self.bookers.get(server_id, {})
+            gpus = list()
+            for gpu in summary['gpus']:
+                booked_by = bookers.get(str(gpu['gpu_id']))
+                state = 'booked' if booked_by else ('busy' if gpu['users'] else 'free')
+                gpus.append(dict(gpu, state=state, booked_by=booked_by))
+            overview.append({'server_id': server_id, 'timestamp': summary['timestamp'], 'gpus': gpus})
+        return overview
@@ -0,0 +1,84 @@
+# coding: utf-8
+
+# Release of booked GPUs left idle.
+#
+# Every heartbeat is checked against the server's enforcement policy (see enforcement.py): a GPU booked for
+# the current hour is idle when its utilization is at most `idle_utilization_percent` and no process of the
+# booker holds more than `idle_memory_mib`. The moment it went idle is kept, shared by every worker, in
+#
+#   SERVER_{id}_IDLE   hash {gpu_id: '{idle since timestamp}:{booker}'}, expiring two hours after the last heartbeat
+#
+# The clock belongs to the booker it was started for and runs on through that booker's consecutive hours, so
+# `idle_release_minutes` may span several hours. It is cleared as soon as the GPU is used again, is not booked,
+# or its booking for the current hour changes (see database.py); a GPU handed to someone else starts a fresh
+# clock, so the new booker never inherits the previous booker's idle time. Once a GPU has been idle for
+# `idle_release_minutes`, the booker's current hour and the consecutive hours booked after it are released in
+# one atomic step, with `idle_refund_percent` of them refunded.
+
+import time
+
+# starts the idle clock of each idle GPU unless it already runs for the same booker:
+# KEYS = [idle hash], ARGV = [now, gpu_id, booker, gpu_id, booker, ...]
+IDLE_SCRIPT = """
+for i = 2, #ARGV, 2 do
+    local since = redis.call('HGET', KEYS[1], ARGV[i])
+    if not since or string.sub(since, (string.find(since, ':', 1, true) or #since) + 1) ~= ARGV[i + 1] then
+        redis.call('HSET', KEYS[1], ARGV[i], ARGV[1] .. ':' .. ARGV[i + 1])
+    end
+end
+return 1
+"""
+
+class IdleReclaimer:
+    def __init__(self, db, enforcer):
+        self.db = db
+        self.enforcer = enforcer
+        self.redis_client = db.redis_client
+        self.idle_script = self.redis_client.register_script(IDLE_SCRIPT)
+
+    def is_idle(self, gpu, booker, policy):
+        utilization = gpu.get('utilization_percent')
+        if utilization is None or utilization > policy['idle_utilization_percent']:
+            return False
+        for process in gpu.get('processes', []):
+            if (process.get('owner') or process['user']) == booker and (process.get('used_gpu_memory_mib') or 0) > policy['idle_memory_mib']:
+                return False
+        return True
+
+    def observe(self, server_id, server_status, now=None):
+        # updates the idle clocks of the server's booked GPUs from one heartbeat;
+        # returns the releases it made: [{gpu_id, username, idle_since, released, refunded}, ...]
+        now = time.time() if now is None else now
+        policy = self.enforcer.get_policy(server_id, [str(gpu['gpu_id']) for gpu in server_status], now)
+        idle_key = f'SERVER_{server_id}_IDLE'
+        if not policy['bookers'] or not policy['idle_release_minutes']:
+            # nothing booked now, so no clock may carry over to a later booking
+            self.redis_client.delete(idle_key)
+            return []
+
+        idle_gpus, busy_gpus = list(), list()
+        for gpu in server_status:
+            gpu_id = str(gpu['gpu_id'])
+            booker = policy['bookers'].get(gpu_id)
+            (idle_gpus if booker and self.is_idle(gpu, booker, policy) else busy_gpus).append(gpu_id)
+
+        pipe = self.redis_client.pipeline(transaction=False)
+        if idle_gpus:
+            self.idle_script(keys=[idle_key], args=[now] + [value for gpu_id in idle_gpus for value in (gpu_id, policy['bookers'][gpu_id])], client=pipe)
+        if busy_gpus:
+            pipe.hdel(idle_key, *busy_gpus)
+        pipe.expire(idle_key, 7200)
+        pipe.hgetall(idle_key)
+        idle_since = {gpu_id: value.split(':', 1) for gpu_id, value in pipe.execute()[-1].items()}
+
+        releases = list()
+        for gpu_id in idle_gpus:
+            booker = policy['bookers'][gpu_id]
+            since, clock_booker = idle_since.get(gpu_id, (now, booker))
+            if clock_booker != booker or now - float(since) < policy['idle_release_minutes'] * 60:
+                continue
+            released, refunded = self.db.release_bookings(server_id, gpu_id, booker, policy['hour'], policy['idle_refund_percent'])
+            self.redis_client.hdel(idle_key, gpu_id)
+            if released:
+                releases.append({'gpu_id': gpu_id, 'username': booker, 'idle_since': float(since), 'released': released, 'refunded': refunded})
+        return releases
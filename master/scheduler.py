@@ -0,0 +1,200 @@
+# coding: utf-8
+
+# Waitlist for GPU bookings.
+#
+# A request asks for `gpu_count` GPUs of one server among `server_ids`, for `hours` contiguous hours ending
+# before `deadline`. It is placed right away when possible, otherwise it waits and is retried whenever
+# slots are released (unbook) and at each hour. Waiting requests are served in fair-share order: users
+# holding fewer hours on the servers concerned go first, then first come first served.
+#
+#   WAITLIST              sorted set of waiting request ids scored by creation time
+#   WAITLIST_ID           counter for request ids
+#   WAITLIST_ENTRY_{id}   request json {id, username, server_ids, gpu_count, hours, deadline, created, status, placement}
+#   USER_{name}_WAITLIST  set of the user's request ids
+#
+# Placement reads each server's bookings once into an IntervalIndex (free hour intervals per GPU) and picks
+# the earliest start at which enough GPUs stay free for the whole duration, preferring the GPUs whose free
+# interval ends soonest so longer gaps stay available. Booking itself goes through the atomic booking script,
+# and a request is claimed by removing it from WAITLIST, so two workers never book the same request.
+
+import json
+import time
+import bisect
+from collections import Counter
+
+# finished requests are kept this long for the user to look at
+ENTRY_TTL = 7 * 24 * 3600
+
+class IntervalIndex:
+    # free hour intervals [start, end) of each GPU of one server within [start, end)
+    def __init__(self, book_events, start_timestamp, end_timestamp):
+        self.free = dict()
+        self.usage = Counter()
+        for gpu_id, gpu_events in book_events.items():
+            starts, ends = list(), list()
+            cursor = start_timestamp
+            for timestamp in sorted(int(timestamp) for timestamp in gpu_events):
+                if timestamp < start_timestamp or timestamp >= end_timestamp:
+                    continue
+                if timestamp > cursor:
+                    starts.append(cursor)
+                    ends.append(timestamp)
+                cursor = timestamp + 3600
+            if cursor < end_timestamp:
+                starts.append(cursor)
+                ends.append(end_timestamp)
+            self.free[gpu_id] = (starts, ends)
+            self.usage.update(book_event['username'] for book_event in gpu_events.values())
+
+    def free_until(self, gpu_id, timestamp):
+        # end of the free interval of `gpu_id` holding `timestamp`, or None when the GPU is booked then
+        starts, ends = self.free[gpu_id]
+        index = bisect.bisect_right(starts, timestamp) - 1
+        if index >= 0 and ends[index] > timestamp:
+            return ends[index]
+        return None
+
+    def find(self, gpu_count, hours, earliest_timestamp, latest_end_timestamp):
+        # (start, [gpu_id, ...]) of the earliest placement, or None
+        duration = hours * 3600
+        candidates = {earliest_timestamp}
+        for starts, _ in self.free.values():
+            candidates.update(start for start in starts if start > earliest_timestamp)
+
+        for start in sorted(candidates):
+            if start + duration > latest_end_timestamp:
+                break
+            fits = list()
+            for gpu_id in self.free:
+                free_end = self.free_until(gpu_id, start)
+                if free_end is not None and free_end >= start + duration:
+                    fits.append((free_end, int(gpu_id), gpu_id))
+            if len(fits) >= gpu_count:
+                return start, sorted(gpu_id for _, _, gpu_id in sorted(fits)[:gpu_count])
+        return None
+
+    def reserve(self, gpu_ids, start_timestamp, hours, username):
+        end_timestamp = start_timestamp + hours * 3600
+        for gpu_id in gpu_ids:
+            starts, ends = self.free[gpu_id]
+            index = bisect.bisect_right(starts, start_timestamp) - 1
+            free_start, free_end = starts[index], ends[index]
+            intervals = [(free_start, start_timestamp), (end_timestamp, free_end)]
+            starts[index:index + 1] = [interval[0] for interval in intervals if interval[1] > interval[0]]
+            ends[index:index + 1] = [interval[1] for interval in intervals if interval[1] > interval[0]]
+        self.usage[username] += hours * len(gpu_ids)
+
+class WaitlistScheduler:
+    def __init__(self, db):
+        self.db = db
+        self.redis_client = db.redis_client
+
+    def submit(self, username, server_ids, gpu_count, hours, deadline):
+        # stores the request and tries to place it at once; returns the request
+        now = int(time.time())
+        entry = {
+            'id': self.redis_client.incr('WAITLIST_ID'),
+            'username': username,
+            'server_ids': server_ids,
+            'gpu_count': gpu_count,
+            'hours': hours,
+            'deadline': deadline,
+            'created': now,
+            'status': 'waiting',
+            'placement': None,
+        }
+        pipe = self.redis_client.pipeline()
+        pipe.set(f"WAITLIST_ENTRY_{entry['id']}", json.dumps(entry))
+        pipe.zadd('WAITLIST', {entry['id']: now})
+        pipe.sadd(f'USER_{username}_WAITLIST', entry['id'])
+        pipe.execute()
+        self.process(entry_ids=[str(entry['id'])])
+        return self.get(entry['id'])
+
+    def get(self, entry_id):
+        raw_data = self.redis_client.get(f'WAITLIST_ENTRY_{entry_id}')
+        return json.loads(raw_data) if raw_data else None
+
+    def get_user_entries(self, username):
+        entry_ids = sorted(self.redis_client.smembers(f'USER_{username}_WAITLIST'), key=int)
+        if not entry_ids:
+            return []
+        raw_entries = self.redis_client.mget([f'WAITLIST_ENTRY_{entry_id}' for entry_id in entry_ids])
+        # finished requests expire on their own, their ids are dropped here
+        expired = [entry_id for entry_id, raw_data in zip(entry_ids, raw_entries) if not raw_data]
+        if expired:
+            self.redis_client.srem(f'USER_{username}_WAITLIST', *expired)
+        return [json.loads(raw_data) for raw_data in raw_entries if raw_data]
+
+    def cancel(self, username, entry_id):
+        # True when a waiting request of `username` was withdrawn
+        entry = self.get(entry_id)
+        if not entry or entry['username'] != username or not self.redis_client.zrem('WAITLIST', entry_id):
+            return False
+        self.finish(entry, 'cancelled')
+        return True
+
+    def finish(self, entry, status, placement=None):
+        entry = dict(entry, status=status, placement=placement)
+        self.redis_client.set(f"WAITLIST_ENTRY_{entry['id']}", json.dumps(entry), ex=ENTRY_TTL)
+        return entry
+
+    def process(self, server_id=None, entry_ids=None):
+        # places the waiting requests that fit (only those involving `server_id` / listed in `entry_ids`);
+        # returns the requests finished by this run
+        entry_ids = entry_ids or self.redis_client.zrange('WAITLIST', 0, -1)
+        raw_entries = self.redis_client.mget([f'WAITLIST_ENTRY_{entry_id}' for entry_id in entry_ids]) if entry_ids else []
+        entries = [json.loads(raw_data) for raw_data in raw_entries if raw_data]
+        if server_id is not None:
+            entries = [entry for entry in entries if server_id in entry['server_ids']]
+        if not entries:
+            return []
+
+        current_hour_timestamp = int(time.time()) - int(time.time()) % 3600
+        finished = list()
+        waiting = list()
+        for entry in entries:
+            if current_hour_timestamp + entry['hours'] * 3600 > entry['deadline']:
+                if self.redis_client.zrem('WAITLIST', entry['id']):
+                    finished.append(self.finish(entry, 'expired'))
+            else:
+                waiting.append(entry)
+        if not waiting:
+            return finished
+
+        # one read of the bookings of every server concerned, up to the last deadline
+        end_timestamp = max(entry['deadline'] for entry in waiting)
+        indexes = dict()
+        for index_server_id in sorted({server_id for entry in waiting for server_id in entry['server_ids']}):
+            gpu_ids = self.db.get_server_gpus(index_server_id)
+            book_events = self.db.get_book_range(index_server_id, gpu_ids, current_hour_timestamp, end_timestamp - 3600) if gpu_ids else {}
+            indexes[index_server_id] = IntervalIndex(book_events, current_hour_timestamp, end_timestamp)
+
+        def usage(entry):
+            return sum(indexes[server_id].usage[entry['username']] for server_id in entry['server_ids'])
+
+        for entry in sorted(waiting, key=lambda entry: (usage(entry), entry['created'], entry['id'])):
+            placement = None
+            for entry_server_id in entry['server_ids']:
+                found = indexes[entry_server_id].find(entry['gpu_count'], entry['hours'], current_hour_timestamp, entry['deadline'])
+                if found and (placement is None or found[0] < placement[1]):
+                    placement = (entry_server_id, found[0], found[1])
+            if placement is None:
+                continue
+
+            # claim the request, then book; a request that cannot be booked after all goes back on the list
+            if not self.redis_client.zrem('WAITLIST', entry['id']):
+                continue
+            placement_server_id, start_timestamp, gpu_ids = placement
+            timestamps = [start_timestamp + i * 3600 for i in range(entry['hours'])]
+            results = self.db.book_slots(placement_server_id, gpu_ids, timestamps, entry['username'])
+            statuses = {result['status'] for result in results}
+            if statuses == {'success'}:
+                indexes[placement_server_id].reserve(gpu_ids, start_timestamp, entry['hours'], entry['username'])
+                finished.append(self.finish(entry, 'booked', {'server_id': placement_server_id, 'gpu_ids': gpu_ids, 'start': start_timestamp, 'end': timestamps[-1] + 3600}))
+            elif 'insufficient_credit' in statuses:
+                finished.append(self.finish(entry, 'insufficient_credit'))
+            else:
+                # booked by someone else since the index was read
+                self.redis_client.zadd('WAITLIST', {entry['id']: entry['created']})
+        return finished
@@ -0,0 +1,80 @@
+# coding: utf-8
+
+# Server status wire formats accepted by POST /server/status.
+#
+# legacy:  {"server_status": [gpu, ...], "timestamp": t} with display strings ("87%", "65°C")
+# compact: {"format": "compact", "seq": n, "keyframe": bool, "base_seq": m, "timestamp": t,
+#           "gpus": [gpu, ...], "removed_gpus": [gpu_id, ...]} with numeric fields, where a
+#           non-keyframe only carries the GPUs that changed since snapshot `base_seq`.
+# Bodies may be sent with `Content-Encoding: gzip` or `zstd`.
+#
+# Statuses are stored numerically; display_gpu() turns them back into the legacy display strings.
+
+import re
+import gzip
+import json
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+class KeyframeRequired(Exception):
+    pass
+
+def load_status_payload(raw_data, content_encoding=None):
+    if content_encoding == 'gzip':
+        raw_data = gzip.decompress(raw_data)
+    elif content_encoding == 'zstd':
+        if zstandard is None:
+            raise ValueError("zstd request bodies need the zstandard package on the master")
+        raw_data = zstandard.ZstdDecompressor().decompress(raw_data)
+    elif content_encoding not in (None, '', 'identity'):
+        raise ValueError(f"Unsupported Content-Encoding: {content_encoding}")
+    return json.loads(raw_data)
+
+def parse_number(value):
+    # 87 -> 87, "87%" -> 87, "65°C" -> 65, "1.2%" -> 1.2, "N/A" -> None
+    if value is None or isinstance(value, (int, float)):
+        return value
+    match = re.match(r'\s*(-?\d+(?:\.\d+)?)', str(value))
+    if not match:
+        return None
+    number = float(match.group(1))
+    return int(number) if number.is_integer() and '.' not in match.group(1) else number
+
+def normalize_gpu(gpu):
+    gpu = dict(gpu)
+    for field in ('memory_usage_mib', 'memory_total_mib', 'memory_percent', 'utilization_percent', 'temperature_celsius'):
+        gpu[field] = parse_number(gpu.get(field))
+    gpu['processes'] = [dict(process, used_gpu_memory_mib=parse_number(process.get('used_gpu_memory_mib'))) for process in gpu.get('processes', [])]
+    return gpu
+
+def display_gpu(gpu):
+    gpu = dict(gpu)
+    gpu['memory_percent'] = f"{gpu['memory_percent']:.1f}%" if gpu.get('memory_percent') is not None else "N/A"
+    gpu['utilization_percent'] = f"{gpu['utilization_percent']}%" if gpu.get('utilization_percent') is not None else "N/A"
+    gpu['temperature_celsius'] = f"{gpu['temperature_celsius']}°C" if gpu.get('temperature_celsius') is not None else "N/A"
+    gpu['processes'] = [dict(process, used_gpu_memory_mib=process['used_gpu_memory_mib'] if process.get('used_gpu_memory_mib') is not None else "N/A") for process in gpu.get('processes', [])]
+    return gpu
+
+def apply_status_payload(payload, current_status, current_seq):
+    # returns (server_status, seq, changed) once `payload` is applied on top of the stored snapshot
+    if 'server_status' in payload:
+        return [normalize_gpu(gpu) for gpu in payload['server_status']], None, True
+
+    gpus = [normalize_gpu(gpu) for gpu in payload.get('gpus', [])]
+    if payload.get('keyframe'):
+        return sorted(gpus, key=lambda gpu: gpu['gpu_id']), payload['seq'], True
+
+    if current_seq is None or payload.get('base_seq') != current_seq:
+        raise KeyframeRequired(f"delta based on snapshot {payload.get('base_seq')} but the master holds {current_seq}")
+    if not gpus and not payload.get('removed_gpus'):
+        return current_status, payload['seq'], False
+
+    server_status = {gpu['gpu_id']: gpu for gpu in current_status}
+    for gpu_id in payload.get('removed_gpus', []):
+        server_status.pop(gpu_id, None)
+    for gpu in gpus:
+        server_status[gpu['gpu_id']] = gpu
+    return sorted(server_status.values(), key=lambda gpu: gpu['gpu_id']), payload['seq'], True
@@ -0,0 +1,100 @@
+# coding: utf-8
+
+# Live status push for /server/stream (server-sent events).
+#
+# Heartbeat ingest publishes each changed status once on the Redis channel STATUS_{id}. Every worker
+# holds a single pattern subscription (started with its first listener) and fans each message out to
+# its local listeners' queues, so Redis sees one subscriber per worker no matter how many pages watch.
+#
+# Each open stream holds a request slot of its worker (a thread of a gthread worker), so a worker takes
+# at most `max_listeners` of them (0: no limit) and turns further ones away, keeping slots for heartbeats.
+
+import time
+import json
+import queue
+import logging
+import threading
+
+class StatusStream:
+    def __init__(self, redis_client, keepalive_seconds=15, max_listeners=0):
+        self.redis_client = redis_client
+        self.keepalive_seconds = keepalive_seconds
+        self.max_listeners = max_listeners
+        self.listener_count = 0
+        self.lock = threading.Lock()
+        self.listeners = dict()
+        self.thread = None
+
+    def publish(self, server_id, server_status, timestamp):
+        return self.redis_client.publish(f'STATUS_{server_id}', json.dumps({'server_status': server_status, 'timestamp': timestamp}))
+
+    def dispatch_loop(self):
+        while True:
+            try:
+                pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe('STATUS_*')
+                for message in pubsub.listen():
+                    self.dispatch(message['channel'][len('STATUS_'):], message['data'])
+            except Exception as e:
+                logging.getLogger(__name__).error(f"[Status Stream] -> Subscription lost: {e}")
+                time.sleep(1)
+
+    def dispatch(self, server_id, data):
+        with self.lock:
+            listeners = list(self.listeners.get(server_id, ()))
+        for listener in listeners:
+            # only the newest status matters, so a slow listener drops its oldest pending one
+            if listener.full():
+                try:
+                    listener.get_nowait()
+                except queue.Empty:
+                    pass
+            try:
+                listener.put_nowait(data)
+            except queue.Full:
+                pass
+
+    def subscribe(self, server_id):
+        # None when this worker already holds `max_listeners` streams
+        listener = queue.Queue(maxsize=4)
+        with self.lock:
+            if self.max_listeners and self.listener_count >= self.max_listeners:
+                return None
+            self.listeners.setdefault(server_id, set()).add(listener)
+            self.listener_count += 1
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.dispatch_loop, daemon=True)
+                self.thread.start()
+        return listener
+
+    def unsubscribe(self, server_id, listener):
+        with self.lock:
+            if listener in self.listeners.get(server_id, set()):
+                self.listener_count -= 1
+            self.listeners.get(server_id, set()).discard(listener)
+            if not self.listeners.get(server_id):
+                self.listeners.pop(server_id, None)
+
+    def events(self, server_id):
+        # server-sent event stream of the status updates for `server_id`, or None when this worker is full;
+        # the slot is taken here, not on first iteration, so concurrent requests cannot overshoot the limit
+        listener = self.subscribe(server_id)
+        return None if listener is None else StatusEvents(self, server_id, listener)
+
+class StatusEvents:
+    # the server calls close() when the client goes away, also for a stream that never started
+    def __init__(self, stream, server_id, listener):
+        self.stream = stream
+        self.server_id = server_id
+        self.listener = listener
+
+    def __iter__(self):
+        yield ': connected\n\n'
+        while True:
+            try:
+                yield f'event: status\ndata: {self.listener.get(timeout=self.stream.keepalive_seconds)}\n\n'
+            except queue.Empty:
+                yield ': keepalive\n\n'
+
+    def close(self):
+        self.stream.unsubscribe(self.server_id, self.listener)
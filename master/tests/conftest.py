@@ -0,0 +1,17 @@
+# coding: utf-8
+
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def db(monkeypatch):
+    # a DataBase on an in-memory fakeredis server (Lua scripts need the lupa package)
+    fakeredis = pytest.importorskip('fakeredis')
+    pytest.importorskip('lupa')
+    import database
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(database.redis, 'Redis', lambda **kwargs: fakeredis.FakeRedis(server=server, decode_responses=kwargs.get('decode_responses', False)))
+    return database.DataBase(redis_host='localhost', redis_port=6379, redis_password=None, redis_db=0)
@@ -0,0 +1,41 @@
+# coding: utf-8
+
+import json
+import admin
+from admin import BulkAdmin
+
+def test_snapshot_round_trip(db, monkeypatch):
+    monkeypatch.setattr(admin, 'CHUNK_SIZE', 3)
+    db.create_server('s1', 'p', [0, 1])
+    db.set_user_info('alice', {'password': 'p', 'credit': 5, 'server_list': ['s1']})
+    db.redis_client.hset('SERVER_s1_STATUS', 'timestamp', 1)
+    db.redis_client.rpush('HISTORY_s1_0_RAW', 'sample')
+    db.redis_client.set('LOCK_compact', 1, ex=60)
+    db.redis_client.xadd('AUDIT', {'action': 'login'})
+    db.redis_client.set('USER_bob_CREDIT', 3, ex=600)
+
+    lines = list(BulkAdmin(db).snapshot())
+    assert json.loads(lines[0])['snapshot'] == admin.SNAPSHOT_VERSION
+    assert {json.loads(line)['key'] for line in lines[1:]} == {
+        'SERVERS', 'SERVER_s1_PASSWORD', 'SERVER_s1_GPUS', 'USER_alice', 'USER_alice_CREDIT', 'USER_alice_SERVERS', 'USER_bob_CREDIT'}
+    assert 'AUDIT' in {json.loads(line).get('key') for line in BulkAdmin(db).snapshot(audit=True)}
+
+    db.redis_client.flushdb()
+    assert BulkAdmin(db).replay(lines) == 7
+    assert db.get_user_info('alice') == {'password': 'p', 'credit': 5, 'server_list': ['s1']}
+    assert db.get_server_gpus('s1') == ['0', '1']
+    assert 0 < db.redis_client.pttl('USER_bob_CREDIT') <= 600 * 1000
+
+def test_acl_and_credits_need_existing_users(db):
+    db.create_server('s1', 'p', [0])
+    db.set_user_info('alice', {'password': 'p', 'credit': 5, 'server_list': []})
+    bulk_admin = BulkAdmin(db)
+
+    result = bulk_admin.import_records('acl', [{'username': 'alice', 'server_id': 's1'}, {'username': 'ghost', 'server_id': 's1'}])
+    assert result['imported'] == 0
+    assert [error['message'] for error in result['errors']] == ['unknown user: ghost']
+    result = bulk_admin.import_records('credits', [{'username': 'ghost', 'delta': 5}])
+    assert result['errors'] and not db.redis_client.exists('USER_ghost_CREDIT')
+
+    assert bulk_admin.import_records('credits', [{'username': 'alice', 'delta': 5}])['imported'] == 1
+    assert db.get_user_credit('alice') == 10
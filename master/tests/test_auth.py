@@ -0,0 +1,12 @@
+# coding: utf-8
+
+def test_non_ascii_passwords(db):
+    db.set_user_info('alice', {'password': 'pässwort', 'credit': 0, 'server_list': []})
+    db.create_server('s1', 'pässwort', [0])
+
+    assert db.user_auth('alice', 'pässwort')
+    assert not db.user_auth('alice', 'passwort')
+    assert not db.user_auth('alice', 'ä')
+    assert db.server_auth('s1', 'pässwort')
+    assert not db.server_auth('s1', 'password')
+    assert not db.user_auth('bob', 'pässwort')
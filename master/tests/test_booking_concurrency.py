@@ -0,0 +1,77 @@
+# coding: utf-8
+
+# Many clients racing for the same slots must end with one booking per slot and credit moved exactly once per booking.
+
+import time
+import threading
+
+THREADS = 32
+
+def hour_timestamp(hours_ahead=1):
+    return int(time.time()) - int(time.time()) % 3600 + hours_ahead * 3600
+
+def run_together(target, arguments):
+    # starts one thread per argument tuple, released at the same time by a barrier
+    barrier = threading.Barrier(len(arguments))
+    results = [None] * len(arguments)
+    def run(index, args):
+        barrier.wait()
+        results[index] = target(*args)
+    threads = [threading.Thread(target=run, args=(index, args)) for index, args in enumerate(arguments)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+def test_one_booking_per_slot_across_users(db):
+    db.create_server('s1', 'password', range(2))
+    usernames = [f'user{i}' for i in range(THREADS)]
+    for username in usernames:
+        db.set_user_info(username, {'password': 'password', 'credit': 5, 'server_list': ['s1']})
+    timestamp = hour_timestamp()
+
+    results = run_together(db.book_slot, [('s1', '0', timestamp, username) for username in usernames])
+
+    assert results.count('success') == 1
+    assert results.count('booked') == THREADS - 1
+    winner = usernames[results.index('success')]
+    assert db.get_book_range('s1', ['0'], timestamp, timestamp)['0'] == {str(timestamp): {'username': winner}}
+    assert sum(db.get_user_credit(username) for username in usernames) == 5 * THREADS - 1
+    assert db.get_user_credit(winner) == 4
+
+def test_one_debit_per_slot_for_one_user(db):
+    db.create_server('s1', 'password', range(2))
+    db.set_user_info('alice', {'password': 'password', 'credit': 100, 'server_list': ['s1']})
+    timestamp = hour_timestamp()
+
+    results = run_together(db.book_slot, [('s1', '0', timestamp, 'alice')] * THREADS)
+
+    assert results.count('success') == 1
+    assert db.get_user_credit('alice') == 99
+    assert len(db.redis_client.zrange('SERVER_s1_BOOK_0', 0, -1)) == 1
+
+def test_credit_never_overspent(db):
+    db.create_server('s1', 'password', range(4))
+    db.set_user_info('alice', {'password': 'password', 'credit': 3, 'server_list': ['s1']})
+
+    # each thread asks for a different slot, only three can be paid for
+    results = run_together(db.book_slot, [('s1', str(index % 4), hour_timestamp(1 + index // 4), 'alice') for index in range(THREADS)])
+
+    assert results.count('success') == 3
+    assert results.count('insufficient_credit') == THREADS - 3
+    assert db.get_user_credit('alice') == 0
+
+def test_concurrent_book_and_unbook_balance(db):
+    db.create_server('s1', 'password', range(1))
+    db.set_user_info('alice', {'password': 'password', 'credit': 10, 'server_list': ['s1']})
+    timestamp = hour_timestamp()
+
+    def book_then_unbook(_):
+        return db.book_slot('s1', '0', timestamp, 'alice'), db.unbook_slot('s1', '0', timestamp, 'alice')
+
+    run_together(book_then_unbook, [(index,) for index in range(THREADS)])
+
+    booked = len(db.redis_client.zrange('SERVER_s1_BOOK_0', 0, -1))
+    assert booked in (0, 1)
+    assert db.get_user_credit('alice') == 10 - booked
@@ -0,0 +1,32 @@
+# coding: utf-8
+
+from enforcement import EnforcementEngine, DEFAULT_SETTINGS, validate_settings
+
+def test_validate_settings():
+    assert validate_settings({'grace_seconds': 60, 'allow_users': ['alice'], 'dry_run': True, 'idle_refund_percent': None}) == []
+    assert len(validate_settings({
+        'grace_seconds': 'abc',
+        'allow_users': 'alice',
+        'idle_release_minutes': '30',
+        'idle_refund_percent': 150,
+        'min_memory_mib': True,
+        'dry_run': 'yes',
+        'colour': 'red',
+    })) == 7
+
+def test_invalid_stored_overrides_fall_back_to_defaults(db):
+    db.create_server('s1', 'p', [0])
+    db.set_enforcement_settings('s1', {'grace_seconds': 'abc', 'min_memory_mib': 100})
+    settings = EnforcementEngine(db).get_settings('s1')
+    assert settings['grace_seconds'] == DEFAULT_SETTINGS['grace_seconds']
+    assert settings['min_memory_mib'] == 100
+
+def test_kills_reported_once_across_workers(db):
+    workers = [EnforcementEngine(db), EnforcementEngine(db)]
+    kills = [{'pid': 10}, {'pid': 11}]
+    policy = {'hour': 3600}
+
+    assert workers[0].unreported('s1', kills, policy) == kills
+    assert workers[1].unreported('s1', kills + [{'pid': 12}], policy) == [{'pid': 12}]
+    assert workers[0].unreported('s1', kills, policy) == []
+    assert workers[1].unreported('s1', kills, {'hour': 7200}) == kills
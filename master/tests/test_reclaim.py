@@ -0,0 +1,59 @@
+# coding: utf-8
+
+import time
+from enforcement import EnforcementEngine
+from reclaim import IdleReclaimer
+
+IDLE_GPU = [{'gpu_id': 0, 'utilization_percent': 0, 'processes': []}]
+
+def setup_server(db):
+    db.create_server('s1', 'p', [0])
+    for username in ['alice', 'bob']:
+        db.set_user_info(username, {'password': 'p', 'credit': 10, 'server_list': ['s1']})
+    return IdleReclaimer(db, EnforcementEngine(db)), int(time.time()) - int(time.time()) % 3600
+
+def test_idle_gpu_released(db):
+    reclaimer, hour = setup_server(db)
+    db.book_slots('s1', ['0'], [hour, hour + 3600], 'alice')
+
+    assert reclaimer.observe('s1', IDLE_GPU, now=hour + 60) == []
+    releases = reclaimer.observe('s1', IDLE_GPU, now=hour + 60 + 30 * 60)
+    assert [(release['username'], release['released'], release['idle_since']) for release in releases] == [('alice', 2, hour + 60)]
+
+def test_new_booker_starts_a_fresh_clock(db):
+    reclaimer, hour = setup_server(db)
+    idle_key = 'SERVER_s1_IDLE'
+    db.book_slots('s1', ['0'], [hour], 'alice')
+    reclaimer.observe('s1', IDLE_GPU, now=hour + 60)
+    assert db.redis_client.hget(idle_key, '0') == f'{hour + 60}:alice'
+
+    # handing the GPU over clears the clock ...
+    db.unbook_slots('s1', ['0'], [hour], 'alice')
+    assert db.redis_client.hget(idle_key, '0') is None
+    db.book_slots('s1', ['0'], [hour], 'bob')
+
+    # ... and a clock left by the previous booker is not inherited either
+    db.redis_client.hset(idle_key, '0', f'{hour + 60}:alice')
+    assert reclaimer.observe('s1', IDLE_GPU, now=hour + 40 * 60) == []
+    assert db.redis_client.hget(idle_key, '0') == f'{hour + 40 * 60}:bob'
+
+def test_idle_clock_runs_across_the_booker_hours(db):
+    reclaimer, hour = setup_server(db)
+    db.set_enforcement_settings('s1', {'idle_release_minutes': 90})
+    db.book_slots('s1', ['0'], [hour, hour + 3600, hour + 7200, hour + 3 * 3600], 'alice')
+
+    assert reclaimer.observe('s1', IDLE_GPU, now=hour + 50 * 60) == []
+    assert reclaimer.observe('s1', IDLE_GPU, now=hour + 3600 + 60) == []
+    assert reclaimer.observe('s1', IDLE_GPU, now=hour + 3600 + 50 * 60) == []
+    releases = reclaimer.observe('s1', IDLE_GPU, now=hour + 7200 + 20 * 60)
+    assert [(release['username'], release['released'], release['idle_since']) for release in releases] == [('alice', 2, hour + 50 * 60)]
+
+def test_idle_clock_cleared_between_bookings(db):
+    reclaimer, hour = setup_server(db)
+    db.book_slots('s1', ['0'], [hour, hour + 7200], 'alice')
+    reclaimer.observe('s1', IDLE_GPU, now=hour + 40 * 60)
+
+    # an unbooked hour in between, and the clock starts over at the next booking
+    reclaimer.observe('s1', IDLE_GPU, now=hour + 3600 + 60)
+    assert reclaimer.observe('s1', IDLE_GPU, now=hour + 7200 + 60) == []
+    assert db.redis_client.hget('SERVER_s1_IDLE', '0') == f'{hour + 7200 + 60}:alice'